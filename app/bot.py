@@ -2,34 +2,95 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from database.models import init_db  # теперь это SQLite
 
+from app.database.models import close_db, init_db
 from app.handlers import admin, users
+from app.middlewares.antiflood import AntiFloodMiddleware
+from app.middlewares.metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware
+from app.middlewares.ordering import OrderedUpdatesMiddleware
+from app.utils.delivery import DeliveryEngine
+from app.utils.expiry import ExpiryTimers
+from app.utils.invite_links import InviteLinkManager
+from app.utils.logs import setup_logging
+from app.utils.metrics import MetricsServer
+from app.utils.reviewers import ReviewerPool
 from app.utils.scheduler import setup_scheduler
+from app.utils.session import TelegramSession
+from app.webhook import WebhookServer
 from config.config import config
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] [Bot] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    logger.info("Starting bot")
-    bot = Bot(token=config.bot_token)
-    dp = Dispatcher()
+def create_dispatcher(bot: Bot, delivery: DeliveryEngine) -> Dispatcher:
+    expiry_timers = ExpiryTimers(bot, delivery, window=config.expiry_window)
+    invite_links = InviteLinkManager(bot, delivery, **config.invite_links)
+    antiflood = AntiFloodMiddleware(**config.antiflood, exempt=config.admins)
+    reviewers = ReviewerPool(config.admins, config.review["strategy"])
+    ordering = OrderedUpdatesMiddleware(**config.update_queue)
+    dp = Dispatcher(
+        delivery=delivery,
+        expiry_timers=expiry_timers,
+        invite_links=invite_links,
+        antiflood=antiflood,
+        ordering=ordering,
+        reviewers=reviewers,
+    )
+    dp.update.outer_middleware(ordering)
+    dp.message.outer_middleware(antiflood)
+    handler_metrics = HandlerMetricsMiddleware()
+    for observer in (dp.message, dp.callback_query, dp.chat_member):
+        observer.middleware(handler_metrics)
     dp.include_router(admin.router)
     dp.include_router(users.router)
+    return dp
 
-    logger.info("Initializing SQLite database")
+
+async def main():
+    logger.info("Starting bot")
+    bot = Bot(token=config.bot_token, session=TelegramSession(**config.api_session))
+    bot.session.middleware(ApiMetricsMiddleware())
+    delivery = DeliveryEngine(**config.delivery)
+    dp = create_dispatcher(bot, delivery)
+    expiry_timers, invite_links = dp["expiry_timers"], dp["invite_links"]
+
+    logger.info("Initializing database")
     await init_db(config)  # создает таблицы, если нужно
 
     logger.info("Setting up scheduler")
-    setup_scheduler(config.db["path"])  # передаём путь к SQLite
+    scheduler_lease = setup_scheduler(bot, delivery, expiry_timers, invite_links)
+    scheduler_lease.start()
+
+    metrics_server = None
+    if config.metrics["enabled"]:
+        metrics_server = MetricsServer(config.metrics["host"], config.metrics["port"])
+        await metrics_server.start()
 
-    logger.info("Starting polling")
-    await dp.start_polling(bot)
+    try:
+        if config.mode == "webhook":
+            logger.info("Starting webhook server")
+            server = WebhookServer(bot, dp, **config.webhook)
+            await server.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await server.stop()
+        else:
+            logger.info("Starting polling")
+            await dp.start_polling(bot)
+    finally:
+        logger.info("Shutting down")
+        await scheduler_lease.stop()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await expiry_timers.stop()
+        await invite_links.stop()
+        await close_db()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    log_listener = setup_logging(config.logging)
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.database.migrations import MIGRATIONS
+
+logger = logging.getLogger("db")
+
+SNAPSHOT_SUFFIX = ".db.gz"
+# Writes from other connections restart a stepwise backup; after this many
+# restarts the copy is done in a single step instead.
+MAX_RESTARTS = 20
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _backup_file(source: str, target: str, pages: int, pause: float):
+    # Runs in a worker thread on its own connections. Each step copies
+    # `pages` pages under a short read lock, so the bot keeps writing.
+    restarts = 0
+    remaining_before = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, remaining_before
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _Restarted()
+        remaining_before = remaining
+
+    src = sqlite3.connect(source)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=pause)
+        except _Restarted:
+            # In WAL mode a single-step copy only holds a read snapshot, so
+            # writers are still not blocked.
+            logger.warning("Backup of %s restarted %s times, copying in one step", source, restarts)
+            dst.close()
+            os.remove(target)
+            dst = sqlite3.connect(target)
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return restarts
+
+
+def _compress(source: str, target: str):
+    digest = hashlib.sha256()
+    with open(source, "rb") as raw, gzip.open(target, "wb", compresslevel=6) as packed:
+        while chunk := raw.read(1 << 20):
+            digest.update(chunk)
+            packed.write(chunk)
+    return digest.hexdigest()
+
+
+def _unpack(snapshot: str, target: str):
+    if not snapshot.endswith(".gz"):
+        shutil.copyfile(snapshot, target)
+        return
+    try:
+        with gzip.open(snapshot, "rb") as packed, open(target, "wb") as raw:
+            shutil.copyfileobj(packed, raw, 1 << 20)
+    except (OSError, EOFError) as e:
+        raise BackupError(f"cannot unpack {snapshot}: {e}") from e
+
+
+def verify_database(path: str) -> dict:
+    # Full integrity check plus the parts of the schema the bot relies on.
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        try:
+            problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"not a readable SQLite database: {e}") from e
+        if problems != ["ok"]:
+            raise BackupError(f"integrity check failed: {'; '.join(problems[:5])}")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        latest = MIGRATIONS[-1][0]
+        if version > latest:
+            raise BackupError(f"schema version {version} is newer than this code ({latest})")
+        try:
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"users table is unreadable: {e}") from e
+        return {"schema_version": version, "users": users}
+    finally:
+        conn.close()
+
+
+def verify_snapshot(snapshot: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "verify.db")
+        _unpack(snapshot, path)
+        return verify_database(path)
+
+
+def _create_snapshot(source: str, directory: str, pages: int, pause: float, keep: int) -> dict:
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    target = Path(directory) / f"{Path(source).stem}-{stamp}{SNAPSHOT_SUFFIX}"
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        copy = os.path.join(tmp, "backup.db")
+        restarts = _backup_file(source, copy, pages, pause)
+        info = verify_database(copy)
+        partial = f"{target}.partial"
+        info["sha256"] = _compress(copy, partial)
+        os.replace(partial, target)
+    info.update(path=str(target), size=target.stat().st_size, restarts=restarts)
+    _prune(directory, Path(source).stem, keep)
+    return info
+
+
+def _prune(directory: str, stem: str, keep: int):
+    if not keep:
+        return
+    snapshots = sorted(Path(directory).glob(f"{stem}-*{SNAPSHOT_SUFFIX}"))
+    for old in snapshots[:-keep]:
+        logger.info("Removing old snapshot %s", old)
+        old.unlink()
+
+
+async def create_snapshot(source: str, directory: str, pages: int = 1024, pause: float = 0.005, keep: int = 14):
+    # Copies the live database with the online backup API, verifies the copy
+    # and stores it gzip-compressed. Everything runs in a thread.
+    logger.info("Creating snapshot of %s in %s", source, directory)
+    info = await asyncio.to_thread(_create_snapshot, source, directory, pages, pause, keep)
+    logger.info(
+        "Snapshot %s written: %s bytes, %s users, schema %s",
+        info["path"],
+        info["size"],
+        info["users"],
+        info["schema_version"],
+    )
+    return info
+
+
+def restore_snapshot(snapshot: str, target: str) -> dict:
+    # The bot must be stopped. The snapshot is unpacked and verified next to
+    # the target and swapped in with a rename; the current database is kept
+    # as <target>.before-restore.
+    directory = os.path.dirname(os.path.abspath(target))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        candidate = os.path.join(tmp, "restore.db")
+        _unpack(snapshot, candidate)
+        info = verify_database(candidate)
+        if os.path.exists(target):
+            _backup_file(target, f"{target}.before-restore", pages=-1, pause=0)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+        os.replace(candidate, target)
+    logger.info("Restored %s from %s (%s users)", target, snapshot, info["users"])
+    return info
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("db")
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, write_batch, flush_interval: float = 0.05, batch_size: int = 500, max_pending: int = 10000):
+        # write_batch(rows) persists a list of rows in a single transaction.
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, key, row):
+        if self._task is None:
+            raise RuntimeError("Write-behind queue is not running")
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = row
+        # Blocks once max_pending rows are waiting, which pushes back on the
+        # handlers instead of growing memory without bound.
+        try:
+            await self._queue.put((key, row, future))
+        except BaseException:
+            # Cancelled while waiting: the row will never be written, so
+            # reads must not see it.
+            if self.pending.get(key) is row:
+                del self.pending[key]
+            raise
+        return future
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # A row arriving at an idle queue is written at once; while rows
+            # keep coming the batch fills for up to flush_interval.
+            deadline = loop.time() + self.flush_interval
+            busy = not self._queue.empty()
+            while busy and len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Flush whatever was queued behind the stop marker.
+        rest = [item for item in _drain(self._queue) if item is not _STOP]
+        for start in range(0, len(rest), self.batch_size):
+            await self._flush(rest[start : start + self.batch_size])
+
+    async def _flush(self, batch):
+        try:
+            await self.write_batch([row for _, row, _ in batch])
+        except Exception as e:
+            logger.error("Failed to write batch of %s rows: %s", len(batch), str(e))
+            for key, row, future in batch:
+                if self.pending.get(key) is row:
+                    del self.pending[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, row, future in batch:
+            if self.pending.get(key) is row:
+                del self.pending[key]
+            if not future.done():
+                future.set_result(None)
+        logger.debug("Flushed batch of %s rows", len(batch))
+
+
+def _drain(queue: asyncio.Queue):
+    while True:
+        try:
+            yield queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+
+
+class SubscriptionRecord:
+    __slots__ = ("user_id", "is_subscribed", "subscription_expires_at")
+
+    def __init__(self, user_id, is_subscribed, subscription_expires_at):
+        self.user_id = user_id
+        self.is_subscribed = bool(is_subscribed)
+        self.subscription_expires_at = subscription_expires_at
+
+    def __repr__(self):
+        return (
+            f"SubscriptionRecord(user_id={self.user_id}, is_subscribed={self.is_subscribed}, "
+            f"subscription_expires_at={self.subscription_expires_at})"
+        )
+
+
+class SubscriptionCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300, enabled: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Off when other processes write the same database: their writes
+        # never invalidate this process's entries.
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # A clock bumped on every write, and the tick of each user's last
+        # write. A fill is dropped only if its own user was written after the
+        # read started, so writes to other users do not starve the cache.
+        self.version = 0
+        self._written = OrderedDict()
+        # Ticks of users pruned from _written are at most this.
+        self._floor = 0
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        if not self.enabled:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        record, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return record
+
+    def put(self, record: SubscriptionRecord):
+        self._write(record.user_id)
+        self._store(record)
+
+    def fill(self, record: SubscriptionRecord, version: int):
+        # version is the clock read before the database row was.
+        written = self._written.get(record.user_id)
+        if written is None:
+            fresh = version >= self._floor
+        else:
+            fresh = written <= version
+        if fresh:
+            self._store(record)
+
+    def _write(self, user_id):
+        self.version += 1
+        self._written[user_id] = self.version
+        self._written.move_to_end(user_id)
+        while len(self._written) > self.maxsize:
+            _, self._floor = self._written.popitem(last=False)
+
+    def _store(self, record: SubscriptionRecord):
+        if not self.enabled:
+            return
+        self._entries[record.user_id] = (record, time.monotonic())
+        self._entries.move_to_end(record.user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._write(user_id)
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LRUCache:
+    # Plain bounded LRU; values are replaced or dropped, never changed in place.
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+    def items(self):
+        # A copy, so entries can be popped while iterating.
+        return list(self._entries.items())
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
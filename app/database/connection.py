@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+logger = logging.getLogger("db")
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+)
+
+# sqlite3 keeps a per-connection LRU of prepared statements, so long-lived
+# connections reuse the compiled form of every query in models.py.
+CACHED_STATEMENTS = 256
+
+
+class Database:
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.readers = 0 if path == ":memory:" else readers
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._pool = asyncio.Queue()
+        self._reader_conns = []
+
+    async def _connect(self, read_only: bool = False):
+        conn = await aiosqlite.connect(self.path, cached_statements=CACHED_STATEMENTS)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def open(self):
+        logger.info("Opening SQLite connections at %s (1 writer, %s readers)", self.path, self.readers)
+        self._writer = await self._connect()
+        for _ in range(self.readers):
+            conn = await self._connect(read_only=True)
+            self._reader_conns.append(conn)
+            self._pool.put_nowait(conn)
+
+    async def close(self):
+        logger.info("Closing SQLite connections at %s", self.path)
+        async with self._write_lock:
+            for conn in self._reader_conns:
+                await conn.close()
+            self._reader_conns.clear()
+            self._pool = asyncio.Queue()
+            if self._writer is not None:
+                await self._writer.execute("PRAGMA optimize")
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def reader(self):
+        if not self.readers:
+            # An in-memory database is private to its connection, so reads go
+            # through the writer.
+            async with self._write_lock:
+                yield self._writer
+            return
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
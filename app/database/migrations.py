@@ -0,0 +1,401 @@
+import asyncio
+import logging
+
+from app.database.connection import Database
+
+logger = logging.getLogger("db")
+
+# Every migration must be idempotent: the schema version is bumped after the
+# migration finishes, so a crash in between re-runs it on the next start.
+MIGRATIONS = []
+
+EPOCH_MIGRATION_CHUNK = 5000
+
+
+def migration(version: int, description: str):
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+
+    return decorator
+
+
+def sql_migration(version: int, description: str, *statements: str):
+    async def apply(db: Database):
+        async with db.writer() as conn:
+            for statement in statements:
+                await conn.execute(statement)
+
+    MIGRATIONS.append((version, description, apply))
+    MIGRATIONS.sort(key=lambda m: m[0])
+
+
+sql_migration(
+    1,
+    "create users table",
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        phone_number TEXT,
+        username TEXT,
+        is_subscribed BOOLEAN DEFAULT FALSE,
+        subscription_expires_at TIMESTAMP
+    )
+    """,
+)
+
+# Serves the scheduler's expiring/expired range scans and the active
+# subscriber count in get_stats, and is the narrowest covering index for the
+# plain COUNT(*) over users.
+sql_migration(
+    2,
+    "index users by subscription state and expiry",
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_subscription_expiry
+    ON users (is_subscribed, subscription_expires_at)
+    """,
+)
+
+
+@migration(3, "store subscription_expires_at as integer epoch seconds")
+async def convert_expiry_to_epoch(db: Database, chunk_size: int = EPOCH_MIGRATION_CHUNK):
+    # Walks the table in primary key ranges and commits each chunk on its own,
+    # so no single transaction (and WAL file) grows with the table and a crash
+    # loses at most one chunk of work. Rows that are already integers are
+    # skipped, which makes the migration resumable.
+    last_id = 0  # Telegram user ids are positive
+    converted = 0
+    while True:
+        async with db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT MAX(user_id) FROM (
+                    SELECT user_id FROM users
+                    WHERE user_id > ?
+                    ORDER BY user_id
+                    LIMIT ?
+                )
+                """,
+                (last_id, chunk_size),
+            ) as cursor:
+                upper = (await cursor.fetchone())[0]
+        if upper is None:
+            break
+        async with db.writer() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE users
+                SET subscription_expires_at = CAST(strftime('%s', subscription_expires_at) AS INTEGER)
+                WHERE user_id > ? AND user_id <= ?
+                AND typeof(subscription_expires_at) = 'text'
+                """,
+                (last_id, upper),
+            )
+            converted += cursor.rowcount
+        last_id = upper
+        await asyncio.sleep(0)
+    logger.info("Converted %s subscription timestamps to epoch seconds", converted)
+
+
+# Materialized counters behind get_stats, kept in step by add_user and
+# update_subscription, plus one snapshot row per day for trends.
+sql_migration(
+    4,
+    "add statistics counters and daily snapshots",
+    """
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_snapshots (
+        day TEXT PRIMARY KEY,
+        total_users INTEGER NOT NULL,
+        active_subscribers INTEGER NOT NULL,
+        revenue INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO stats_counters (name, value) SELECT 'total_users', COUNT(*) FROM users",
+    """
+    INSERT OR IGNORE INTO stats_counters (name, value)
+    SELECT 'active_subscribers', COUNT(*) FROM users WHERE is_subscribed = 1
+    """,
+    "INSERT OR IGNORE INTO stats_counters (name, value) VALUES ('revenue', 0)",
+)
+
+
+# Issued single-use channel invite links. user_id is NULL while a link sits
+# in the pre-generated pool.
+sql_migration(
+    5,
+    "add invite links",
+    """
+    CREATE TABLE IF NOT EXISTS invite_links (
+        invite_link TEXT PRIMARY KEY,
+        user_id INTEGER,
+        expires_at INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        revoked INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_invite_links_user
+    ON invite_links (user_id, expires_at) WHERE revoked = 0
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_invite_links_pool
+    ON invite_links (expires_at) WHERE user_id IS NULL AND revoked = 0
+    """,
+)
+
+
+# Payment screenshots awaiting review. file_unique_id is stable across
+# re-sends of the same image, so a repeated screenshot is stored only once
+# (narrowed to pending requests by migration 12).
+sql_migration(
+    6,
+    "add payment requests",
+    """
+    CREATE TABLE IF NOT EXISTS payment_requests (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        file_unique_id TEXT NOT NULL UNIQUE,
+        status TEXT NOT NULL DEFAULT 'pending',
+        created_at INTEGER NOT NULL,
+        resolved_at INTEGER
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_payment_requests_pending
+    ON payment_requests (user_id) WHERE status = 'pending'
+    """,
+)
+
+
+# Leader lease for the scheduler, so only one instance runs the jobs, and the
+# last run of every job for catching up after downtime.
+sql_migration(
+    7,
+    "add scheduler leases and job runs",
+    """
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job TEXT PRIMARY KEY,
+        last_run_at INTEGER NOT NULL
+    )
+    """,
+)
+
+
+# Progress of long-running jobs, so they resume after a restart.
+sql_migration(
+    8,
+    "add job checkpoints",
+    """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """,
+)
+
+
+# Expiry reminders already sent. A subscription period is identified by its
+# expiry, so renewing re-arms every stage.
+sql_migration(
+    9,
+    "add reminder ledger",
+    """
+    CREATE TABLE IF NOT EXISTS reminders (
+        user_id INTEGER NOT NULL,
+        stage INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL,
+        sent_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, stage, expires_at)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_reminders_expires_at ON reminders (expires_at)
+    """,
+)
+
+
+# Append-only subscription history (kind: new, renewed, rejected, expired)
+# and the nightly rollups the admin report reads. Current subscribers get a
+# backfilled "new" event; what they paid is unknown, so amount is NULL.
+sql_migration(
+    10,
+    "add subscription events and rollups",
+    """
+    CREATE TABLE IF NOT EXISTS subscription_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        amount INTEGER,
+        expires_at INTEGER,
+        created_at INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_subscription_events_created_at ON subscription_events (created_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_subscription_events_user ON subscription_events (user_id, created_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_subscription_events_paid
+    ON subscription_events (expires_at) WHERE kind IN ('new', 'renewed')
+    """,
+    """
+    INSERT INTO subscription_events (user_id, kind, amount, expires_at, created_at)
+    SELECT user_id, 'new', NULL, subscription_expires_at,
+        MIN(subscription_expires_at - 30 * 86400, CAST(strftime('%s', 'now') AS INTEGER))
+    FROM users
+    WHERE is_subscribed = 1 AND subscription_expires_at IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM subscription_events e WHERE e.user_id = users.user_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_rollups (
+        day TEXT PRIMARY KEY,
+        new INTEGER NOT NULL,
+        renewed INTEGER NOT NULL,
+        churned INTEGER NOT NULL,
+        rejected INTEGER NOT NULL,
+        revenue INTEGER NOT NULL,
+        active INTEGER NOT NULL,
+        mrr INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cohort_retention (
+        cohort TEXT NOT NULL,
+        month TEXT NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (cohort, month)
+    )
+    """,
+)
+
+
+# Payment screenshots are assigned to one of several reviewers, and the
+# notification each reviewer got is mapped back to the user, so replies do
+# not depend on the caption.
+@migration(11, "add payment reviewers and admin message routes")
+async def add_admin_routes(db: Database):
+    async with db.writer() as conn:
+        async with conn.execute(
+            "SELECT 1 FROM pragma_table_info('payment_requests') WHERE name = 'reviewer_id'"
+        ) as cursor:
+            if await cursor.fetchone() is None:
+                await conn.execute("ALTER TABLE payment_requests ADD COLUMN reviewer_id INTEGER")
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_payment_requests_reviewer
+            ON payment_requests (reviewer_id) WHERE status = 'pending'
+            """
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS admin_routes (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                created_at INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, message_id)
+            ) WITHOUT ROWID
+            """
+        )
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_admin_routes_created_at ON admin_routes (created_at)")
+
+
+# A screenshot is a duplicate only while an earlier request with it is still
+# pending; after a rejection the same image may be sent again. SQLite cannot
+# drop a column constraint, so the table is rebuilt without it.
+@migration(12, "limit screenshot uniqueness to pending payment requests")
+async def scope_screenshot_uniqueness(db: Database):
+    async with db.writer() as conn:
+        async with conn.execute(
+            """
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'index' AND tbl_name = 'payment_requests' AND name LIKE 'sqlite_autoindex_%'
+            """
+        ) as cursor:
+            rebuild = await cursor.fetchone() is not None
+        if rebuild:
+            await conn.execute("DROP TABLE IF EXISTS payment_requests_new")
+            await conn.execute(
+                """
+                CREATE TABLE payment_requests_new (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_unique_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    created_at INTEGER NOT NULL,
+                    resolved_at INTEGER,
+                    reviewer_id INTEGER
+                )
+                """
+            )
+            await conn.execute(
+                """
+                INSERT INTO payment_requests_new
+                    (id, user_id, file_id, file_unique_id, status, created_at, resolved_at, reviewer_id)
+                SELECT id, user_id, file_id, file_unique_id, status, created_at, resolved_at, reviewer_id
+                FROM payment_requests
+                """
+            )
+            await conn.execute("DROP TABLE payment_requests")
+            await conn.execute("ALTER TABLE payment_requests_new RENAME TO payment_requests")
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_payment_requests_pending
+            ON payment_requests (user_id) WHERE status = 'pending'
+            """
+        )
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_payment_requests_reviewer
+            ON payment_requests (reviewer_id) WHERE status = 'pending'
+            """
+        )
+        await conn.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_requests_screenshot
+            ON payment_requests (file_unique_id) WHERE status = 'pending'
+            """
+        )
+
+
+async def get_schema_version(db: Database) -> int:
+    async with db.reader() as conn:
+        async with conn.execute("PRAGMA user_version") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def run_migrations(db: Database):
+    current = await get_schema_version(db)
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    if not pending:
+        logger.info("Database schema is up to date (version %s)", current)
+        return current
+    for version, description, apply in pending:
+        logger.info("Applying migration %s: %s", version, description)
+        await apply(db)
+        async with db.writer() as conn:
+            await conn.execute(f"PRAGMA user_version = {int(version)}")
+        current = version
+    logger.info("Database schema migrated to version %s", current)
+    return current
@@ -1,197 +1,606 @@
+import json
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 
-import aiosqlite
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from app.database.batching import WriteBehindQueue
+from app.database.cache import LRUCache, SubscriptionCache, SubscriptionRecord
+from app.database.repository import Repository, create_repository
+from app.utils.logs import get_sampled_logger
+from app.utils.metrics import db_timed
+from config.config import config
 
+logger = logging.getLogger("db")
+# Per-update lookups and registrations
+hot_logger = get_sampled_logger("db")
 
-class Settings(BaseSettings):
-    bot_token: str
-    admin_id: int
-    channel_id: str
-    payment_link: str = "https://example.com/payment"
-    db: dict = {"path": "./bot.db"}
+subscription_cache = SubscriptionCache(
+    maxsize=config.subscription_cache["size"], ttl=config.subscription_cache["ttl"]
+)
+# (chat_id, message_id) of a reviewer's screenshot notification -> user_id
+route_cache = LRUCache(maxsize=config.review["route_cache"])
 
-    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
+_repository: Repository | None = None
+_registration_queue: WriteBehindQueue | None = None
 
 
-config = Settings()
+# subscription_expires_at is stored as integer epoch seconds; handlers work
+# with naive UTC datetimes, matching datetime.utcnow().
+def to_epoch(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
 
-# Configure logger for database operations
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] [DB] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
-logger = logging.getLogger("db")
+
+def from_epoch(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+def _user_from_row(row):
+    user = dict(row)
+    user["subscription_expires_at"] = from_epoch(user["subscription_expires_at"])
+    return user
+
+
+def get_repository() -> Repository:
+    if _repository is None:
+        raise RuntimeError("Database is not initialized, call init_db first")
+    return _repository
 
 
+@db_timed
 async def init_db(config):
-    db_path = config.db["path"]
-    logger.info("Initializing SQLite database at %s", db_path)
-    try:
-        async with aiosqlite.connect(db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    first_name TEXT,
-                    last_name TEXT,
-                    phone_number TEXT,
-                    username TEXT,
-                    is_subscribed BOOLEAN DEFAULT FALSE,
-                    subscription_expires_at TIMESTAMP
-                )
-            """)
-            await db.commit()
-        logger.info("SQLite DB initialized successfully")
+    global _repository, _registration_queue
+    backend = config.db.get("backend", "sqlite")
+    logger.info("Initializing %s database", backend)
+    try:
+        if _repository is None:
+            repository = create_repository(config.db)
+            await repository.open()
+            _repository = repository
+        # Several bot replicas can share a PostgreSQL database, and a write on
+        # one of them would not reach the others' caches.
+        subscription_cache.enabled = backend == "sqlite"
+        if not subscription_cache.enabled:
+            subscription_cache.clear()
+            logger.info("Subscription cache disabled for the %s backend", backend)
+        if _registration_queue is None:
+            _registration_queue = WriteBehindQueue(
+                _insert_users,
+                flush_interval=config.registration_queue["flush_interval"],
+                batch_size=config.registration_queue["batch_size"],
+                max_pending=config.registration_queue["max_pending"],
+            )
+            _registration_queue.start()
+        logger.info("%s DB initialized successfully", backend)
     except Exception as e:
-        logger.error("Failed to initialize SQLite DB: %s", str(e))
+        logger.error("Failed to initialize %s DB: %s", backend, str(e))
         raise
 
 
-async def add_user(db_path, user_id, first_name, last_name, phone_number, username):
-    logger.info("Adding user: user_id=%s, username=%s", user_id, username)
+@db_timed
+async def close_db():
+    global _repository, _registration_queue
+    if _registration_queue is not None:
+        logger.info("Flushing pending registrations")
+        await _registration_queue.stop()
+        _registration_queue = None
+    if _repository is not None:
+        logger.info("Closing database")
+        await _repository.close()
+        _repository = None
+
+
+@db_timed
+async def _insert_users(rows):
+    await get_repository().insert_users(rows)
+    for row in rows:
+        subscription_cache.invalidate(row[0])
+
+
+@db_timed
+async def add_user(user_id, first_name, last_name, phone_number, username):
+    # Registrations are grouped into one transaction by the write-behind queue;
+    # this returns once the row is committed.
+    hot_logger.info("Adding user: user_id=%s, username=%s", user_id, username)
     try:
-        async with aiosqlite.connect(db_path) as db:
-            await db.execute(
-                """
-                INSERT OR IGNORE INTO users (user_id, first_name, last_name, phone_number, username)
-                VALUES (?, ?, ?, ?, ?)
-            """,
-                (user_id, first_name, last_name, phone_number, username),
-            )
-            await db.commit()
-            logger.info("User added: user_id=%s", user_id)
+        durable = await _registration_queue.submit(user_id, (user_id, first_name, last_name, phone_number, username))
+        await durable
+        hot_logger.info("User added: user_id=%s", user_id)
     except Exception as e:
         logger.error("Failed to add user %s: %s", user_id, str(e))
         raise
 
 
-async def get_user(db_path, user_id):
-    logger.info("Fetching user: user_id=%s", user_id)
+@db_timed
+async def get_user(user_id):
     try:
-        async with aiosqlite.connect(db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    logger.info(
-                        "User found: user_id=%s, is_subscribed=%s, expires_at=%s",
-                        user_id,
-                        row["is_subscribed"],
-                        row["subscription_expires_at"],
-                    )
-                else:
-                    logger.info("User not found: user_id=%s", user_id)
-                return row
+        # Taken before the read: a queued row is only dropped from pending
+        # after its batch commits, so it is visible in one place or the other.
+        pending = _pending_user(user_id)
+        row = await get_repository().get_user(user_id)
+        if row:
+            user = _user_from_row(row)
+            hot_logger.info(
+                "User found: user_id=%s, is_subscribed=%s, expires_at=%s",
+                user_id,
+                user["is_subscribed"],
+                user["subscription_expires_at"],
+            )
+            return user
+        if pending:
+            hot_logger.info("User pending registration: user_id=%s", user_id)
+            return pending
+        hot_logger.info("User not found: user_id=%s", user_id)
+        return None
     except Exception as e:
         logger.error("Failed to fetch user %s: %s", user_id, str(e))
         raise
 
 
-async def update_subscription(db_path, user_id, is_subscribed, expires_at):
+def _pending_user(user_id):
+    row = _registration_queue.pending.get(user_id) if _registration_queue else None
+    if row is None:
+        return None
+    return {
+        "user_id": row[0],
+        "first_name": row[1],
+        "last_name": row[2],
+        "phone_number": row[3],
+        "username": row[4],
+        "is_subscribed": 0,
+        "subscription_expires_at": None,
+    }
+
+
+@db_timed
+async def get_subscription(user_id):
+    record = subscription_cache.get(user_id)
+    if record is not None:
+        return record
+    version = subscription_cache.version
+    row = await get_user(user_id)
+    if row is None:
+        return None
+    record = SubscriptionRecord(user_id, row["is_subscribed"], row["subscription_expires_at"])
+    subscription_cache.fill(record, version)
+    return record
+
+
+@db_timed
+async def update_subscription(user_id, is_subscribed, expires_at, payment=0):
     logger.info(
         "Updating subscription: user_id=%s, is_subscribed=%s, expires_at=%s", user_id, is_subscribed, expires_at
     )
     try:
-        async with aiosqlite.connect(db_path) as db:
-            await db.execute(
-                """
-                UPDATE users
-                SET is_subscribed = ?, subscription_expires_at = ?
-                WHERE user_id = ?
-            """,
-                (is_subscribed, expires_at, user_id),
-            )
-            await db.commit()
-            logger.info("Subscription updated successfully: user_id=%s", user_id)
+        updated = await get_repository().update_subscription(
+            user_id, is_subscribed, to_epoch(expires_at), payment, to_epoch(datetime.utcnow())
+        )
+        if updated:
+            subscription_cache.put(SubscriptionRecord(user_id, is_subscribed, expires_at))
+        else:
+            subscription_cache.invalidate(user_id)
+        logger.info("Subscription updated successfully: user_id=%s", user_id)
     except Exception as e:
         logger.error("Failed to update subscription for user %s: %s", user_id, str(e))
         raise
 
 
-async def get_expiring_subscriptions(db_path, days_left):
-    logger.info("Fetching subscriptions expiring in %s days", days_left)
+@db_timed
+async def get_due_reminders(stage, after, until):
+    logger.info("Fetching subscriptions due for the %s-day reminder", stage)
     try:
-        cutoff = datetime.utcnow() + timedelta(days=days_left)
-        async with aiosqlite.connect(db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                """
-                SELECT user_id, subscription_expires_at
-                FROM users
-                WHERE is_subscribed = 1
-                AND subscription_expires_at <= ?
-            """,
-                (cutoff,),
-            ) as cursor:
-                rows = await cursor.fetchall()
-                logger.info("Found %s expiring subscriptions", len(rows))
-                return rows
+        rows = await get_repository().get_due_reminders(stage, to_epoch(after), to_epoch(until))
+        logger.info("Found %s subscriptions due for the %s-day reminder", len(rows), stage)
+        return [_user_from_row(row) for row in rows]
     except Exception as e:
-        logger.error("Failed to fetch expiring subscriptions: %s", str(e))
+        logger.error("Failed to fetch due reminders: %s", str(e))
         raise
 
 
-async def get_expired_subscriptions(db_path):
+@db_timed
+async def claim_reminders(stage, users):
+    rows = [(user["user_id"], to_epoch(user["subscription_expires_at"])) for user in users]
+    if not rows:
+        return set()
+    return set(await get_repository().claim_reminders(stage, rows, to_epoch(datetime.utcnow())))
+
+
+@db_timed
+async def release_reminder(user_id, stage, expires_at):
+    await get_repository().release_reminder(user_id, stage, to_epoch(expires_at))
+
+
+@db_timed
+async def purge_reminders():
+    purged = await get_repository().purge_reminders(to_epoch(datetime.utcnow()))
+    if purged:
+        logger.info("Purged %s reminder ledger entries of ended subscription periods", purged)
+    return purged
+
+
+@db_timed
+async def get_expired_subscriptions():
     logger.info("Fetching expired subscriptions")
     try:
         now = datetime.utcnow()
-        async with aiosqlite.connect(db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                """
-                SELECT user_id, subscription_expires_at
-                FROM users
-                WHERE is_subscribed = 1
-                AND subscription_expires_at <= ?
-            """,
-                (now,),
-            ) as cursor:
-                rows = await cursor.fetchall()
-                logger.info("Found %s expired subscriptions", len(rows))
-                return rows
+        rows = await get_repository().get_subscriptions_expiring(None, to_epoch(now))
+        logger.info("Found %s expired subscriptions", len(rows))
+        return [_user_from_row(row) for row in rows]
     except Exception as e:
         logger.error("Failed to fetch expired subscriptions: %s", str(e))
         raise
 
 
-async def get_stats(db_path):
+@db_timed
+async def get_subscriptions_expiring_between(after, until):
+    logger.info("Fetching subscriptions expiring between %s and %s", after, until)
+    try:
+        rows = await get_repository().get_subscriptions_expiring(to_epoch(after), to_epoch(until))
+        logger.info("Found %s subscriptions in range", len(rows))
+        return [_user_from_row(row) for row in rows]
+    except Exception as e:
+        logger.error("Failed to fetch subscriptions in range: %s", str(e))
+        raise
+
+
+@db_timed
+async def get_users_after(after_id, limit):
+    return [_user_from_row(row) for row in await get_repository().get_users_after(after_id, limit)]
+
+
+@db_timed
+async def upsert_users(rows):
+    # rows: dicts with user_id and any of first_name, last_name, phone_number,
+    # username, is_subscribed, subscription_expires_at. A user listed twice
+    # keeps the last row; without is_subscribed the stored subscription is kept.
+    by_id = {}
+    for row in rows:
+        is_subscribed = row.get("is_subscribed")
+        by_id[row["user_id"]] = (
+            row["user_id"],
+            row.get("first_name"),
+            row.get("last_name"),
+            row.get("phone_number"),
+            row.get("username"),
+            None if is_subscribed is None else bool(is_subscribed),
+            to_epoch(row.get("subscription_expires_at")),
+        )
+    if not by_id:
+        return 0, 0
+    inserted, updated = await get_repository().upsert_users(list(by_id.values()))
+    for user_id in by_id:
+        subscription_cache.invalidate(user_id)
+    return inserted, updated
+
+
+async def iter_users(batch_size=1000):
+    async for row in get_repository().iter_users(batch_size):
+        yield _user_from_row(row)
+
+
+@db_timed
+async def get_stats():
     logger.info("Fetching statistics")
     try:
-        now = datetime.utcnow()
-        async with aiosqlite.connect(db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT COUNT(*) AS count FROM users") as cur:
-                total_users = (await cur.fetchone())["count"]
-
-            async with db.execute(
-                """
-                SELECT COUNT(*) AS count
-                FROM users
-                WHERE is_subscribed = 1
-                AND subscription_expires_at > ?
-            """,
-                (now,),
-            ) as cur:
-                active_subscribers = (await cur.fetchone())["count"]
-
-            non_subscribers = total_users - active_subscribers
-            estimated_income = active_subscribers * 500  # ₽
-
-            stats = {
-                "total_users": total_users,
-                "active_subscribers": active_subscribers,
-                "non_subscribers": non_subscribers,
-                "estimated_income": estimated_income,
-            }
-
-            logger.info(
-                "Stats: total=%s, active=%s, non_subs=%s, income=%s₽",
-                total_users,
-                active_subscribers,
-                non_subscribers,
-                estimated_income,
-            )
-            return stats
+        today = datetime.utcnow().date()
+        day_ago = (today - timedelta(days=1)).isoformat()
+        week_ago = (today - timedelta(days=7)).isoformat()
+        repository = get_repository()
+        counters = await repository.get_counters()
+        # The counter follows is_subscribed; subscriptions past their expiry
+        # that the expiry timers have not swept yet are not active.
+        lapsed = await repository.count_lapsed_subscriptions(to_epoch(datetime.utcnow()))
+        snapshots = await repository.get_snapshots([day_ago, week_ago])
+        rollups = await repository.get_daily_rollups(day_ago)
+
+        total_users = counters.get("total_users", 0)
+        active_subscribers = counters.get("active_subscribers", 0) - lapsed
+        non_subscribers = total_users - active_subscribers
+        estimated_income = active_subscribers * config.subscription_price  # ₽
+
+        stats = {
+            "total_users": total_users,
+            "active_subscribers": active_subscribers,
+            "non_subscribers": non_subscribers,
+            "estimated_income": estimated_income,
+            "revenue": counters.get("revenue", 0),
+            "day_ago": snapshots.get(day_ago),
+            "week_ago": snapshots.get(week_ago),
+            "rollup": rollups[-1] if rollups else None,
+        }
+
+        logger.info(
+            "Stats: total=%s, active=%s, non_subs=%s, income=%s₽",
+            total_users,
+            active_subscribers,
+            non_subscribers,
+            estimated_income,
+        )
+        return stats
     except Exception as e:
         logger.error("Failed to fetch stats: %s", str(e))
         raise
+
+
+@db_timed
+async def reconcile_stats():
+    logger.info("Reconciling statistics counters")
+    try:
+        before, after = await get_repository().reconcile_counters()
+        drift = {name: value - before.get(name, 0) for name, value in after.items()}
+        if any(drift.values()):
+            logger.warning("Statistics counters drifted, corrected by %s", drift)
+        return drift
+    except Exception as e:
+        logger.error("Failed to reconcile stats: %s", str(e))
+        raise
+
+
+@db_timed
+async def take_stats_snapshot():
+    day = datetime.utcnow().date().isoformat()
+    logger.info("Taking statistics snapshot for %s", day)
+    try:
+        await get_repository().take_snapshot(day, to_epoch(datetime.utcnow()))
+    except Exception as e:
+        logger.error("Failed to take stats snapshot: %s", str(e))
+        raise
+
+
+@db_timed
+async def rollup_subscriptions(max_days=400):
+    # Rolls up every finished day since the last rollup (or since the first
+    # subscription event), so days missed during downtime are filled in.
+    repository = get_repository()
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    last_day = await repository.get_last_rollup_day()
+    if last_day is not None:
+        day = date.fromisoformat(last_day) + timedelta(days=1)
+    else:
+        first_event_at = await repository.get_first_event_at()
+        if first_event_at is None:
+            day = yesterday
+        else:
+            day = from_epoch(first_event_at).date()
+    day = max(day, yesterday - timedelta(days=max_days - 1))
+    rows = []
+    try:
+        while day <= yesterday:
+            start = datetime.combine(day, datetime.min.time())
+            rows.append(
+                await repository.rollup_day(
+                    day.isoformat(),
+                    to_epoch(start),
+                    to_epoch(start + timedelta(days=1)),
+                    config.subscription_price,
+                )
+            )
+            # Recounted on every day of the month, so the last one closes it.
+            month_start = start.replace(day=1)
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            await repository.rollup_cohorts(
+                month_start.strftime("%Y-%m"), to_epoch(month_start), to_epoch(min(next_month, start + timedelta(days=1)))
+            )
+            day += timedelta(days=1)
+    except Exception as e:
+        logger.error("Failed to roll up subscriptions for %s: %s", day, str(e))
+        raise
+    if rows:
+        logger.info("Rolled up subscription history for %s - %s", rows[0]["day"], rows[-1]["day"])
+    return rows
+
+
+@db_timed
+async def get_subscription_report(days=30, cohort_months=6):
+    repository = get_repository()
+    today = datetime.utcnow().date()
+    since_month = today.replace(day=1)
+    for _ in range(cohort_months - 1):
+        since_month = (since_month - timedelta(days=1)).replace(day=1)
+    return {
+        "days": await repository.get_daily_rollups((today - timedelta(days=days)).isoformat()),
+        "cohorts": await repository.get_cohort_retention(since_month.strftime("%Y-%m")),
+    }
+
+
+def _link_from_row(row):
+    return (row[0], from_epoch(row[1])) if row else None
+
+
+@db_timed
+async def get_user_invite_link(user_id, min_expires_at):
+    try:
+        return _link_from_row(await get_repository().get_user_invite_link(user_id, to_epoch(min_expires_at)))
+    except Exception as e:
+        logger.error("Failed to fetch invite link for user %s: %s", user_id, str(e))
+        raise
+
+
+@db_timed
+async def save_invite_links(links):
+    # links: iterable of (invite_link, user_id or None, expires_at)
+    try:
+        await get_repository().save_invite_links(
+            [(link, user_id, to_epoch(expires_at)) for link, user_id, expires_at in links],
+            to_epoch(datetime.utcnow()),
+        )
+    except Exception as e:
+        logger.error("Failed to save invite links: %s", str(e))
+        raise
+
+
+@db_timed
+async def claim_pooled_invite_link(user_id, min_expires_at):
+    try:
+        return _link_from_row(await get_repository().claim_pooled_invite_link(user_id, to_epoch(min_expires_at)))
+    except Exception as e:
+        logger.error("Failed to claim pooled invite link for user %s: %s", user_id, str(e))
+        raise
+
+
+@db_timed
+async def count_pooled_invite_links(min_expires_at):
+    return await get_repository().count_pooled_invite_links(to_epoch(min_expires_at))
+
+
+@db_timed
+async def get_stale_invite_links(now, min_expires_at, limit=500):
+    # Still-valid links that should no longer work: those held by users
+    # without an active subscription, and pooled links too close to expiry
+    # to be handed out.
+    try:
+        return await get_repository().get_stale_invite_links(to_epoch(now), to_epoch(min_expires_at), limit)
+    except Exception as e:
+        logger.error("Failed to fetch stale invite links: %s", str(e))
+        raise
+
+
+@db_timed
+async def revoke_invite_links(links):
+    try:
+        await get_repository().revoke_invite_links(list(links))
+    except Exception as e:
+        logger.error("Failed to mark invite links revoked: %s", str(e))
+        raise
+
+
+@db_timed
+async def purge_expired_invite_links(before):
+    try:
+        return await get_repository().purge_expired_invite_links(to_epoch(before))
+    except Exception as e:
+        logger.error("Failed to purge expired invite links: %s", str(e))
+        raise
+
+
+@db_timed
+async def add_payment_request(user_id, file_id, file_unique_id, reviewer_id=None):
+    # Returns the new request id, or None when the same screenshot is
+    # already pending review.
+    hot_logger.info("Recording payment request: user_id=%s, file_unique_id=%s", user_id, file_unique_id)
+    try:
+        return await get_repository().add_payment_request(
+            user_id, file_id, file_unique_id, reviewer_id, to_epoch(datetime.utcnow())
+        )
+    except Exception as e:
+        logger.error("Failed to record payment request for user %s: %s", user_id, str(e))
+        raise
+
+
+@db_timed
+async def delete_payment_request(request_id):
+    logger.info("Deleting payment request %s", request_id)
+    return await get_repository().delete_payment_request(request_id)
+
+
+@db_timed
+async def count_pending_by_reviewer():
+    return await get_repository().count_pending_by_reviewer()
+
+
+@db_timed
+async def add_admin_route(chat_id, message_id, user_id):
+    route_cache.put((chat_id, message_id), user_id)
+    await get_repository().add_admin_route(chat_id, message_id, user_id, to_epoch(datetime.utcnow()))
+
+
+@db_timed
+async def get_admin_route(chat_id, message_id):
+    user_id = route_cache.get((chat_id, message_id))
+    if user_id is None:
+        user_id = await get_repository().get_admin_route(chat_id, message_id)
+        if user_id is not None:
+            route_cache.put((chat_id, message_id), user_id)
+    return user_id
+
+
+@db_timed
+async def purge_admin_routes(max_age_days):
+    try:
+        purged = await get_repository().purge_admin_routes(
+            to_epoch(datetime.utcnow() - timedelta(days=max_age_days))
+        )
+        if purged:
+            logger.info("Purged %s admin message routes older than %s days", purged, max_age_days)
+        return purged
+    except Exception as e:
+        logger.error("Failed to purge admin message routes: %s", str(e))
+        raise
+
+
+@db_timed
+async def get_pending_payments(after_id=0, limit=10):
+    try:
+        rows = await get_repository().get_pending_payment_requests(after_id, limit)
+        for row in rows:
+            row["created_at"] = from_epoch(row["created_at"])
+        return rows
+    except Exception as e:
+        logger.error("Failed to fetch pending payments: %s", str(e))
+        raise
+
+
+@db_timed
+async def count_pending_payments():
+    return await get_repository().count_pending_payment_requests()
+
+
+@db_timed
+async def resolve_payments(user_ids, approved, expires_at=None, payment=0):
+    user_ids = list(dict.fromkeys(user_ids))
+    logger.info("Resolving payments for %s users: approved=%s", len(user_ids), approved)
+    try:
+        resolved = await get_repository().resolve_payment_requests(
+            user_ids, approved, to_epoch(expires_at), payment, to_epoch(datetime.utcnow())
+        )
+        if approved:
+            for user_id in resolved:
+                subscription_cache.put(SubscriptionRecord(user_id, True, expires_at))
+        logger.info("Resolved payments for %s users", len(resolved))
+        return resolved
+    except Exception as e:
+        logger.error("Failed to resolve payments: %s", str(e))
+        raise
+
+
+@db_timed
+async def acquire_lease(name, holder, ttl):
+    now = to_epoch(datetime.utcnow())
+    return await get_repository().acquire_lease(name, holder, now, now + ttl)
+
+
+@db_timed
+async def release_lease(name, holder):
+    await get_repository().release_lease(name, holder)
+
+
+@db_timed
+async def get_job_runs():
+    runs = await get_repository().get_job_runs()
+    return {job: datetime.fromtimestamp(ran_at, timezone.utc) for job, ran_at in runs.items()}
+
+
+@db_timed
+async def record_job_run(job, ran_at):
+    # ran_at is timezone-aware, as APScheduler reports fire times.
+    await get_repository().record_job_run(job, int(ran_at.timestamp()))
+
+
+@db_timed
+async def get_checkpoint(name):
+    value = await get_repository().get_checkpoint(name)
+    return json.loads(value) if value is not None else None
+
+
+@db_timed
+async def save_checkpoint(name, value):
+    await get_repository().save_checkpoint(name, json.dumps(value), to_epoch(datetime.utcnow()))
+
+
+@db_timed
+async def delete_checkpoint(name):
+    await get_repository().delete_checkpoint(name)
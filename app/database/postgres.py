@@ -0,0 +1,864 @@
+import logging
+
+import asyncpg
+
+from app.database.repository import Repository, rollup_row
+
+logger = logging.getLogger("db")
+
+# Arbitrary key for pg_advisory_lock, so only one replica migrates at a time.
+MIGRATION_LOCK_ID = 7_420_001
+
+MIGRATIONS = [
+    (
+        1,
+        "create users table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                first_name TEXT,
+                last_name TEXT,
+                phone_number TEXT,
+                username TEXT,
+                is_subscribed BOOLEAN NOT NULL DEFAULT FALSE,
+                subscription_expires_at BIGINT
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_users_subscription_expiry
+            ON users (subscription_expires_at) WHERE is_subscribed
+            """,
+        ],
+    ),
+    (
+        2,
+        "add statistics counters and daily snapshots",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stats_snapshots (
+                day TEXT PRIMARY KEY,
+                total_users BIGINT NOT NULL,
+                active_subscribers BIGINT NOT NULL,
+                revenue BIGINT NOT NULL
+            )
+            """,
+            """
+            INSERT INTO stats_counters (name, value)
+            SELECT 'total_users', COUNT(*) FROM users
+            UNION ALL SELECT 'active_subscribers', COUNT(*) FROM users WHERE is_subscribed
+            UNION ALL SELECT 'revenue', 0
+            ON CONFLICT (name) DO NOTHING
+            """,
+        ],
+    ),
+    (
+        3,
+        "add invite links",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS invite_links (
+                invite_link TEXT PRIMARY KEY,
+                user_id BIGINT,
+                expires_at BIGINT NOT NULL,
+                created_at BIGINT NOT NULL,
+                revoked BOOLEAN NOT NULL DEFAULT FALSE
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_invite_links_user
+            ON invite_links (user_id, expires_at) WHERE NOT revoked
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_invite_links_pool
+            ON invite_links (expires_at) WHERE user_id IS NULL AND NOT revoked
+            """,
+        ],
+    ),
+    (
+        4,
+        "add payment requests",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS payment_requests (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at BIGINT NOT NULL,
+                resolved_at BIGINT
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_payment_requests_pending
+            ON payment_requests (user_id) WHERE status = 'pending'
+            """,
+        ],
+    ),
+    (
+        5,
+        "add scheduler leases and job runs",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at BIGINT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS job_runs (
+                job TEXT PRIMARY KEY,
+                last_run_at BIGINT NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        6,
+        "add job checkpoints",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at BIGINT NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        7,
+        "add reminder ledger",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                user_id BIGINT NOT NULL,
+                stage INTEGER NOT NULL,
+                expires_at BIGINT NOT NULL,
+                sent_at BIGINT NOT NULL,
+                PRIMARY KEY (user_id, stage, expires_at)
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_reminders_expires_at ON reminders (expires_at)
+            """,
+        ],
+    ),
+    (
+        8,
+        "add subscription events and rollups",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS subscription_events (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                kind TEXT NOT NULL,
+                amount BIGINT,
+                expires_at BIGINT,
+                created_at BIGINT NOT NULL
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_subscription_events_created_at ON subscription_events (created_at)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_subscription_events_user ON subscription_events (user_id, created_at)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_subscription_events_paid
+            ON subscription_events (expires_at) WHERE kind IN ('new', 'renewed')
+            """,
+            """
+            INSERT INTO subscription_events (user_id, kind, amount, expires_at, created_at)
+            SELECT user_id, 'new', NULL, subscription_expires_at,
+                LEAST(subscription_expires_at - 30 * 86400, EXTRACT(EPOCH FROM now())::bigint)
+            FROM users
+            WHERE is_subscribed AND subscription_expires_at IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM subscription_events e WHERE e.user_id = users.user_id)
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day TEXT PRIMARY KEY,
+                new INTEGER NOT NULL,
+                renewed INTEGER NOT NULL,
+                churned INTEGER NOT NULL,
+                rejected INTEGER NOT NULL,
+                revenue BIGINT NOT NULL,
+                active INTEGER NOT NULL,
+                mrr BIGINT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS cohort_retention (
+                cohort TEXT NOT NULL,
+                month TEXT NOT NULL,
+                users INTEGER NOT NULL,
+                PRIMARY KEY (cohort, month)
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "add payment reviewers and admin message routes",
+        [
+            "ALTER TABLE payment_requests ADD COLUMN IF NOT EXISTS reviewer_id BIGINT",
+            """
+            CREATE INDEX IF NOT EXISTS idx_payment_requests_reviewer
+            ON payment_requests (reviewer_id) WHERE status = 'pending'
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS admin_routes (
+                chat_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                created_at BIGINT NOT NULL,
+                PRIMARY KEY (chat_id, message_id)
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_admin_routes_created_at ON admin_routes (created_at)
+            """,
+        ],
+    ),
+    (
+        10,
+        "limit screenshot uniqueness to pending payment requests",
+        [
+            "ALTER TABLE payment_requests DROP CONSTRAINT IF EXISTS payment_requests_file_unique_id_key",
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_requests_screenshot
+            ON payment_requests (file_unique_id) WHERE status = 'pending'
+            """,
+        ],
+    ),
+]
+
+
+def _affected(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "INSERT 0 5" or "DELETE 3".
+    return int(status.rsplit(" ", 1)[-1])
+
+
+async def _bump_counter(conn, name, delta):
+    if delta:
+        await conn.execute("UPDATE stats_counters SET value = value + $1 WHERE name = $2", delta, name)
+
+
+async def _add_events(conn, user_ids, created_at, kind=None, amount=0, expires_at=None):
+    # Without a kind the events are payments: "new" for a user's first one,
+    # "renewed" after that.
+    await conn.execute(
+        """
+        INSERT INTO subscription_events (user_id, kind, amount, expires_at, created_at)
+        SELECT t.user_id, COALESCE($2, CASE WHEN EXISTS (
+            SELECT 1 FROM subscription_events e WHERE e.user_id = t.user_id AND e.kind IN ('new', 'renewed')
+        ) THEN 'renewed' ELSE 'new' END), $3, $4, $5
+        FROM unnest($1::bigint[]) AS t (user_id)
+    """,
+        list(user_ids),
+        kind,
+        amount,
+        expires_at,
+        created_at,
+    )
+
+
+class PostgresRepository(Repository):
+    name = "postgres"
+
+    def __init__(self, host, port, user, password, database, min_size=2, max_size=10):
+        self.dsn = {"host": host, "port": port, "user": user, "password": password, "database": database}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def open(self):
+        logger.info(
+            "Opening PostgreSQL pool to %s:%s/%s (%s-%s connections)",
+            self.dsn["host"],
+            self.dsn["port"],
+            self.dsn["database"],
+            self.min_size,
+            self.max_size,
+        )
+        self.pool = await asyncpg.create_pool(**self.dsn, min_size=self.min_size, max_size=self.max_size)
+        await self.migrate()
+
+    async def migrate(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+            try:
+                await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                current = await conn.fetchval("SELECT MAX(version) FROM schema_version") or 0
+                for version, description, statements in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info("Applying migration %s: %s", version, description)
+                    async with conn.transaction():
+                        for statement in statements:
+                            await conn.execute(statement)
+                        await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", version)
+                    current = version
+                logger.info("Database schema is at version %s", current)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    # users
+
+    async def insert_users(self, rows):
+        columns = list(zip(*rows)) if rows else [[]] * 5
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                status = await conn.execute(
+                    """
+                    INSERT INTO users (user_id, first_name, last_name, phone_number, username)
+                    SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[])
+                    ON CONFLICT (user_id) DO NOTHING
+                """,
+                    *[list(column) for column in columns],
+                )
+                inserted = _affected(status)
+                await _bump_counter(conn, "total_users", inserted)
+        return inserted
+
+    async def get_user(self, user_id):
+        row = await self.pool.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+        return dict(row) if row else None
+
+    async def update_subscription(self, user_id, is_subscribed, expires_at, payment, changed_at):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                old = await conn.fetchval("SELECT is_subscribed FROM users WHERE user_id = $1 FOR UPDATE", user_id)
+                if old is None:
+                    return False
+                await conn.execute(
+                    "UPDATE users SET is_subscribed = $1, subscription_expires_at = $2 WHERE user_id = $3",
+                    bool(is_subscribed),
+                    expires_at,
+                    user_id,
+                )
+                await _bump_counter(conn, "active_subscribers", int(bool(is_subscribed)) - int(old))
+                await _bump_counter(conn, "revenue", payment)
+                if is_subscribed:
+                    await _add_events(conn, [user_id], changed_at, amount=payment, expires_at=expires_at)
+                elif old:
+                    await _add_events(conn, [user_id], changed_at, "expired")
+        return True
+
+    async def get_subscriptions_expiring(self, after, until):
+        rows = await self.pool.fetch(
+            """
+            SELECT user_id, subscription_expires_at
+            FROM users
+            WHERE is_subscribed
+            AND subscription_expires_at > $1
+            AND subscription_expires_at <= $2
+        """,
+            -1 if after is None else after,
+            until,
+        )
+        return [dict(row) for row in rows]
+
+    async def get_due_reminders(self, stage, after, until):
+        rows = await self.pool.fetch(
+            """
+            SELECT u.user_id, u.subscription_expires_at
+            FROM users u
+            WHERE u.is_subscribed
+            AND u.subscription_expires_at > $2
+            AND u.subscription_expires_at <= $3
+            AND NOT EXISTS (
+                SELECT 1 FROM reminders r
+                WHERE r.user_id = u.user_id AND r.stage = $1 AND r.expires_at = u.subscription_expires_at
+            )
+        """,
+            stage,
+            after,
+            until,
+        )
+        return [dict(row) for row in rows]
+
+    async def claim_reminders(self, stage, rows, sent_at):
+        rows = await self.pool.fetch(
+            """
+            INSERT INTO reminders (user_id, stage, expires_at, sent_at)
+            SELECT user_id, $1, expires_at, $4 FROM unnest($2::bigint[], $3::bigint[]) AS t (user_id, expires_at)
+            ON CONFLICT DO NOTHING
+            RETURNING user_id
+        """,
+            stage,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            sent_at,
+        )
+        return [row["user_id"] for row in rows]
+
+    async def release_reminder(self, user_id, stage, expires_at):
+        await self.pool.execute(
+            "DELETE FROM reminders WHERE user_id = $1 AND stage = $2 AND expires_at = $3", user_id, stage, expires_at
+        )
+
+    async def purge_reminders(self, before):
+        return _affected(await self.pool.execute("DELETE FROM reminders WHERE expires_at <= $1", before))
+
+    async def get_users_after(self, after_id, limit):
+        rows = await self.pool.fetch("SELECT * FROM users WHERE user_id > $1 ORDER BY user_id LIMIT $2", after_id, limit)
+        return [dict(row) for row in rows]
+
+    async def upsert_users(self, rows):
+        # Rows without is_subscribed leave the subscription fields alone.
+        with_subscription = [row for row in rows if row[5] is not None]
+        subscribed = [list(column) for column in zip(*with_subscription)]
+        names = [list(column) for column in zip(*(row[:5] for row in rows if row[5] is None))]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                existing = {
+                    row["user_id"]: row["is_subscribed"]
+                    for row in await conn.fetch(
+                        "SELECT user_id, is_subscribed FROM users WHERE user_id = ANY($1::bigint[]) FOR UPDATE",
+                        [row[0] for row in rows],
+                    )
+                }
+                if subscribed:
+                    await conn.execute(
+                        """
+                        INSERT INTO users (user_id, first_name, last_name, phone_number, username,
+                            is_subscribed, subscription_expires_at)
+                        SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[],
+                            $6::boolean[], $7::bigint[])
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                            last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+                            phone_number = COALESCE(EXCLUDED.phone_number, users.phone_number),
+                            username = COALESCE(EXCLUDED.username, users.username),
+                            is_subscribed = EXCLUDED.is_subscribed,
+                            subscription_expires_at = EXCLUDED.subscription_expires_at
+                    """,
+                        *subscribed[:5],
+                        [bool(value) for value in subscribed[5]],
+                        subscribed[6],
+                    )
+                if names:
+                    await conn.execute(
+                        """
+                        INSERT INTO users (user_id, first_name, last_name, phone_number, username)
+                        SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::text[])
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                            last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+                            phone_number = COALESCE(EXCLUDED.phone_number, users.phone_number),
+                            username = COALESCE(EXCLUDED.username, users.username)
+                    """,
+                        *names,
+                    )
+                inserted = len(rows) - len(existing)
+                active = sum(1 for row in with_subscription if row[5])
+                active -= sum(existing.get(row[0], False) for row in with_subscription)
+                await _bump_counter(conn, "total_users", inserted)
+                await _bump_counter(conn, "active_subscribers", active)
+        return inserted, len(existing)
+
+    async def iter_users(self, batch_size=1000):
+        # asyncpg cursors are server-side and need a transaction.
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor("SELECT * FROM users ORDER BY user_id", prefetch=batch_size):
+                    yield dict(row)
+
+    # statistics
+
+    async def get_counters(self):
+        rows = await self.pool.fetch("SELECT name, value FROM stats_counters")
+        return {row["name"]: row["value"] for row in rows}
+
+    async def get_snapshots(self, days):
+        rows = await self.pool.fetch("SELECT * FROM stats_snapshots WHERE day = ANY($1::text[])", list(days))
+        return {row["day"]: dict(row) for row in rows}
+
+    async def reconcile_counters(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                before = {row["name"]: row["value"] for row in await conn.fetch("SELECT name, value FROM stats_counters")}
+                row = await conn.fetchrow(
+                    "SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE is_subscribed) AS active FROM users"
+                )
+                after = {"total_users": row["total"], "active_subscribers": row["active"]}
+                await conn.executemany(
+                    """
+                    INSERT INTO stats_counters (name, value) VALUES ($1, $2)
+                    ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value
+                """,
+                    list(after.items()),
+                )
+        return before, after
+
+    async def count_lapsed_subscriptions(self, now):
+        return await self.pool.fetchval(
+            """
+            SELECT COUNT(*) FROM users
+            WHERE is_subscribed AND (subscription_expires_at IS NULL OR subscription_expires_at <= $1)
+        """,
+            now,
+        )
+
+    async def take_snapshot(self, day, now):
+        lapsed = await self.count_lapsed_subscriptions(now)
+        await self.pool.execute(
+            """
+            INSERT INTO stats_snapshots (day, total_users, active_subscribers, revenue)
+            SELECT $1,
+                COALESCE(MAX(value) FILTER (WHERE name = 'total_users'), 0),
+                COALESCE(MAX(value) FILTER (WHERE name = 'active_subscribers'), 0) - $2,
+                COALESCE(MAX(value) FILTER (WHERE name = 'revenue'), 0)
+            FROM stats_counters
+            ON CONFLICT (day) DO UPDATE SET
+                total_users = EXCLUDED.total_users,
+                active_subscribers = EXCLUDED.active_subscribers,
+                revenue = EXCLUDED.revenue
+        """,
+            day,
+            lapsed,
+        )
+
+    async def rollup_day(self, day, start, end, price):
+        rows = await self.pool.fetch(
+            """
+            SELECT kind, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS amount FROM subscription_events
+            WHERE created_at >= $1 AND created_at < $2
+            GROUP BY kind
+        """,
+            start,
+            end,
+        )
+        kinds = {row["kind"]: (row["count"], row["amount"]) for row in rows}
+        # Subscribed at the end of the day: the user's latest payment or
+        # expiry before then is a payment that runs past it.
+        totals = await self.pool.fetchrow(
+            """
+            SELECT COUNT(*) AS active, COALESCE(SUM(COALESCE(e.amount, $1)), 0) AS mrr
+            FROM subscription_events e
+            WHERE e.kind IN ('new', 'renewed') AND e.expires_at > $2 AND e.created_at < $2
+            AND NOT EXISTS (
+                SELECT 1 FROM subscription_events l
+                WHERE l.user_id = e.user_id AND l.kind IN ('new', 'renewed', 'expired')
+                AND l.created_at < $2 AND l.id > e.id
+            )
+        """,
+            price,
+            end,
+        )
+        row = rollup_row(day, kinds, totals["active"], totals["mrr"])
+        await self.pool.execute(
+            """
+            INSERT INTO daily_rollups (day, new, renewed, churned, rejected, revenue, active, mrr)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ON CONFLICT (day) DO UPDATE SET
+                new = EXCLUDED.new,
+                renewed = EXCLUDED.renewed,
+                churned = EXCLUDED.churned,
+                rejected = EXCLUDED.rejected,
+                revenue = EXCLUDED.revenue,
+                active = EXCLUDED.active,
+                mrr = EXCLUDED.mrr
+        """,
+            *row.values(),
+        )
+        return row
+
+    async def rollup_cohorts(self, month, start, end):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM cohort_retention WHERE month = $1", month)
+                await conn.execute(
+                    """
+                    INSERT INTO cohort_retention (cohort, month, users)
+                    SELECT to_char(to_timestamp(first_paid) AT TIME ZONE 'UTC', 'YYYY-MM'), $1, COUNT(*)
+                    FROM (
+                        SELECT (
+                            SELECT MIN(f.created_at) FROM subscription_events f
+                            WHERE f.user_id = e.user_id AND f.kind IN ('new', 'renewed')
+                        ) AS first_paid
+                        FROM subscription_events e
+                        WHERE e.kind IN ('new', 'renewed') AND e.expires_at > $2 AND e.created_at < $3
+                        GROUP BY e.user_id
+                    ) AS users_in_month
+                    GROUP BY 1
+                """,
+                    month,
+                    start,
+                    end,
+                )
+
+    async def get_daily_rollups(self, since):
+        rows = await self.pool.fetch("SELECT * FROM daily_rollups WHERE day >= $1 ORDER BY day", since)
+        return [dict(row) for row in rows]
+
+    async def get_cohort_retention(self, since):
+        rows = await self.pool.fetch(
+            "SELECT * FROM cohort_retention WHERE cohort >= $1 ORDER BY cohort, month", since
+        )
+        return [dict(row) for row in rows]
+
+    async def get_last_rollup_day(self):
+        return await self.pool.fetchval("SELECT MAX(day) FROM daily_rollups")
+
+    async def get_first_event_at(self):
+        return await self.pool.fetchval("SELECT MIN(created_at) FROM subscription_events")
+
+    # invite links
+
+    async def get_user_invite_link(self, user_id, min_expires_at):
+        row = await self.pool.fetchrow(
+            """
+            SELECT invite_link, expires_at
+            FROM invite_links
+            WHERE user_id = $1 AND NOT revoked AND expires_at > $2
+            ORDER BY expires_at DESC
+            LIMIT 1
+        """,
+            user_id,
+            min_expires_at,
+        )
+        return (row["invite_link"], row["expires_at"]) if row else None
+
+    async def save_invite_links(self, links, created_at):
+        await self.pool.executemany(
+            """
+            INSERT INTO invite_links (invite_link, user_id, expires_at, created_at)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (invite_link) DO NOTHING
+        """,
+            [(link, user_id, expires_at, created_at) for link, user_id, expires_at in links],
+        )
+
+    async def claim_pooled_invite_link(self, user_id, min_expires_at):
+        # SKIP LOCKED lets several replicas claim from the pool concurrently
+        # without handing the same link out twice.
+        row = await self.pool.fetchrow(
+            """
+            UPDATE invite_links
+            SET user_id = $1
+            WHERE invite_link = (
+                SELECT invite_link FROM invite_links
+                WHERE user_id IS NULL AND NOT revoked AND expires_at > $2
+                ORDER BY expires_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING invite_link, expires_at
+        """,
+            user_id,
+            min_expires_at,
+        )
+        return (row["invite_link"], row["expires_at"]) if row else None
+
+    async def count_pooled_invite_links(self, min_expires_at):
+        return await self.pool.fetchval(
+            "SELECT COUNT(*) FROM invite_links WHERE user_id IS NULL AND NOT revoked AND expires_at > $1",
+            min_expires_at,
+        )
+
+    async def get_stale_invite_links(self, now, min_expires_at, limit):
+        rows = await self.pool.fetch(
+            """
+            (
+                SELECT l.invite_link
+                FROM invite_links AS l
+                JOIN users AS u ON u.user_id = l.user_id
+                WHERE NOT l.revoked AND l.expires_at > $1 AND NOT u.is_subscribed
+            )
+            UNION ALL
+            (
+                SELECT invite_link
+                FROM invite_links
+                WHERE user_id IS NULL AND NOT revoked AND expires_at > $1 AND expires_at <= $2
+            )
+            LIMIT $3
+        """,
+            now,
+            min_expires_at,
+            limit,
+        )
+        return [row[0] for row in rows]
+
+    async def revoke_invite_links(self, links):
+        await self.pool.execute(
+            "UPDATE invite_links SET revoked = TRUE WHERE invite_link = ANY($1::text[])", list(links)
+        )
+
+    async def purge_expired_invite_links(self, before):
+        status = await self.pool.execute("DELETE FROM invite_links WHERE expires_at <= $1", before)
+        return _affected(status)
+
+    # payment requests
+
+    async def add_payment_request(self, user_id, file_id, file_unique_id, reviewer_id, created_at):
+        return await self.pool.fetchval(
+            """
+            INSERT INTO payment_requests (user_id, file_id, file_unique_id, reviewer_id, created_at)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (file_unique_id) WHERE status = 'pending' DO NOTHING
+            RETURNING id
+        """,
+            user_id,
+            file_id,
+            file_unique_id,
+            reviewer_id,
+            created_at,
+        )
+
+    async def delete_payment_request(self, request_id):
+        status = await self.pool.execute(
+            "DELETE FROM payment_requests WHERE id = $1 AND status = 'pending'", request_id
+        )
+        return _affected(status) > 0
+
+    async def get_pending_payment_requests(self, after_id, limit):
+        rows = await self.pool.fetch(
+            """
+            SELECT p.id, p.user_id, p.file_id, p.created_at, u.first_name, u.username
+            FROM payment_requests AS p
+            LEFT JOIN users AS u ON u.user_id = p.user_id
+            WHERE p.status = 'pending' AND p.id > $1
+            ORDER BY p.id
+            LIMIT $2
+        """,
+            after_id,
+            limit,
+        )
+        return [dict(row) for row in rows]
+
+    async def count_pending_payment_requests(self):
+        return await self.pool.fetchval("SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'")
+
+    async def count_pending_by_reviewer(self):
+        rows = await self.pool.fetch(
+            """
+            SELECT reviewer_id, COUNT(*) AS count FROM payment_requests
+            WHERE status = 'pending' AND reviewer_id IS NOT NULL
+            GROUP BY reviewer_id
+        """
+        )
+        return {row["reviewer_id"]: row["count"] for row in rows}
+
+    async def resolve_payment_requests(self, user_ids, approved, expires_at, payment, resolved_at):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                closed = await conn.fetch(
+                    """
+                    UPDATE payment_requests SET status = $1, resolved_at = $2
+                    WHERE status = 'pending' AND user_id = ANY($3::bigint[])
+                    RETURNING user_id
+                """,
+                    "approved" if approved else "rejected",
+                    resolved_at,
+                    list(user_ids),
+                )
+                user_ids = list({row["user_id"] for row in closed})
+                users = await conn.fetch(
+                    "SELECT user_id, is_subscribed FROM users WHERE user_id = ANY($1::bigint[]) FOR UPDATE", user_ids
+                )
+                if approved and users:
+                    await conn.execute(
+                        """
+                        UPDATE users SET is_subscribed = TRUE, subscription_expires_at = $1
+                        WHERE user_id = ANY($2::bigint[])
+                    """,
+                        expires_at,
+                        user_ids,
+                    )
+                    await _bump_counter(conn, "active_subscribers", sum(1 for row in users if not row["is_subscribed"]))
+                    await _bump_counter(conn, "revenue", payment * len(users))
+                    await _add_events(
+                        conn, [row["user_id"] for row in users], resolved_at, amount=payment, expires_at=expires_at
+                    )
+                elif users:
+                    await _add_events(conn, [row["user_id"] for row in users], resolved_at, "rejected")
+        return [row["user_id"] for row in users]
+
+    # admin message routes
+
+    async def add_admin_route(self, chat_id, message_id, user_id, created_at):
+        await self.pool.execute(
+            """
+            INSERT INTO admin_routes (chat_id, message_id, user_id, created_at) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (chat_id, message_id) DO UPDATE SET user_id = EXCLUDED.user_id, created_at = EXCLUDED.created_at
+        """,
+            chat_id,
+            message_id,
+            user_id,
+            created_at,
+        )
+
+    async def get_admin_route(self, chat_id, message_id):
+        return await self.pool.fetchval(
+            "SELECT user_id FROM admin_routes WHERE chat_id = $1 AND message_id = $2", chat_id, message_id
+        )
+
+    async def purge_admin_routes(self, before):
+        return _affected(await self.pool.execute("DELETE FROM admin_routes WHERE created_at < $1", before))
+
+    # scheduler
+
+    async def acquire_lease(self, name, holder, now, expires_at):
+        row = await self.pool.fetchrow(
+            """
+            INSERT INTO leases (name, holder, expires_at) VALUES ($1, $2, $3)
+            ON CONFLICT (name) DO UPDATE SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+            WHERE leases.holder = EXCLUDED.holder OR leases.expires_at <= $4
+            RETURNING holder
+        """,
+            name,
+            holder,
+            expires_at,
+            now,
+        )
+        return row is not None
+
+    async def release_lease(self, name, holder):
+        await self.pool.execute("DELETE FROM leases WHERE name = $1 AND holder = $2", name, holder)
+
+    async def get_job_runs(self):
+        rows = await self.pool.fetch("SELECT job, last_run_at FROM job_runs")
+        return {row["job"]: row["last_run_at"] for row in rows}
+
+    async def record_job_run(self, job, ran_at):
+        await self.pool.execute(
+            """
+            INSERT INTO job_runs (job, last_run_at) VALUES ($1, $2)
+            ON CONFLICT (job) DO UPDATE SET last_run_at = EXCLUDED.last_run_at
+        """,
+            job,
+            ran_at,
+        )
+
+    async def get_checkpoint(self, name):
+        return await self.pool.fetchval("SELECT value FROM checkpoints WHERE name = $1", name)
+
+    async def save_checkpoint(self, name, value, updated_at):
+        await self.pool.execute(
+            """
+            INSERT INTO checkpoints (name, value, updated_at) VALUES ($1, $2, $3)
+            ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+        """,
+            name,
+            value,
+            updated_at,
+        )
+
+    async def delete_checkpoint(self, name):
+        await self.pool.execute("DELETE FROM checkpoints WHERE name = $1", name)
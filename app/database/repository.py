@@ -0,0 +1,252 @@
+from abc import ABC, abstractmethod
+
+# Storage backends for app.database.models. Timestamps cross this boundary as
+# integer epoch seconds and user rows as plain dicts; models.py converts them
+# to datetimes for the handlers.
+
+
+def rollup_row(day, kinds, active, mrr):
+    # kinds: {kind: (count, amount)} for the day's subscription events
+    return {
+        "day": day,
+        "new": kinds.get("new", (0, 0))[0],
+        "renewed": kinds.get("renewed", (0, 0))[0],
+        "churned": kinds.get("expired", (0, 0))[0],
+        "rejected": kinds.get("rejected", (0, 0))[0],
+        "revenue": sum(amount for _, amount in kinds.values()),
+        "active": active,
+        "mrr": mrr,
+    }
+
+
+class Repository(ABC):
+    name = "repository"
+
+    @abstractmethod
+    async def open(self):
+        """Connect and bring the schema up to date."""
+
+    @abstractmethod
+    async def close(self):
+        """Release every connection."""
+
+    # users
+
+    @abstractmethod
+    async def insert_users(self, rows) -> int:
+        """Insert (user_id, first_name, last_name, phone_number, username) rows,
+        ignoring existing users, and return how many were new."""
+
+    @abstractmethod
+    async def get_user(self, user_id):
+        """Return the user row as a dict, or None."""
+
+    @abstractmethod
+    async def update_subscription(self, user_id, is_subscribed, expires_at, payment, changed_at) -> bool:
+        """Update one user's subscription, the counters and the subscription history;
+        False if the user is unknown."""
+
+    @abstractmethod
+    async def get_subscriptions_expiring(self, after, until):
+        """Active subscriptions with after < expires_at <= until; after may be None."""
+
+    @abstractmethod
+    async def get_due_reminders(self, stage, after, until):
+        """Active subscriptions with after < expires_at <= until not yet in the reminder ledger for stage."""
+
+    @abstractmethod
+    async def claim_reminders(self, stage, rows, sent_at) -> list[int]:
+        """Record (user_id, expires_at) rows in the ledger; return the user_ids that were not there yet."""
+
+    @abstractmethod
+    async def release_reminder(self, user_id, stage, expires_at):
+        """Remove a ledger entry so the reminder is tried again."""
+
+    @abstractmethod
+    async def purge_reminders(self, before) -> int:
+        """Delete ledger entries of periods that ended at or before before; return the count."""
+
+    @abstractmethod
+    async def get_users_after(self, after_id, limit):
+        """Up to limit user rows with user_id > after_id, in user_id order."""
+
+    @abstractmethod
+    async def upsert_users(self, rows) -> tuple[int, int]:
+        """In one transaction insert or update (user_id, first_name, last_name, phone_number,
+        username, is_subscribed, expires_at) rows with distinct user_ids; subscription fields
+        are overwritten unless is_subscribed is None, names only filled in where given.
+        Return (inserted, updated)."""
+
+    @abstractmethod
+    def iter_users(self, batch_size):
+        """Async iterator over every user row in user_id order, read through a cursor."""
+
+    # statistics
+
+    @abstractmethod
+    async def get_counters(self) -> dict:
+        """Return the materialized counters by name."""
+
+    @abstractmethod
+    async def get_snapshots(self, days) -> dict:
+        """Return daily snapshot rows for the given ISO dates, keyed by date."""
+
+    @abstractmethod
+    async def reconcile_counters(self) -> tuple[dict, dict]:
+        """Recount users into the counters and return (before, after)."""
+
+    @abstractmethod
+    async def count_lapsed_subscriptions(self, now) -> int:
+        """Count users still flagged subscribed whose expiry is missing or at or before now."""
+
+    @abstractmethod
+    async def take_snapshot(self, day, now):
+        """Store the current counters as the snapshot for the ISO date, without lapsed subscriptions."""
+
+    @abstractmethod
+    async def rollup_day(self, day, start, end, price) -> dict:
+        """Aggregate the history of start <= created_at < end into the daily rollup for the ISO date
+        and return it; payments of unknown amount count as price towards MRR."""
+
+    @abstractmethod
+    async def rollup_cohorts(self, month, start, end):
+        """Recount, per first-payment month, the users subscribed at some point in [start, end)."""
+
+    @abstractmethod
+    async def get_daily_rollups(self, since) -> list[dict]:
+        """Daily rollups from the ISO date on, oldest first."""
+
+    @abstractmethod
+    async def get_cohort_retention(self, since) -> list[dict]:
+        """Cohort rows for cohorts from the YYYY-MM month on, by cohort and month."""
+
+    @abstractmethod
+    async def get_last_rollup_day(self):
+        """ISO date of the newest daily rollup, or None."""
+
+    @abstractmethod
+    async def get_first_event_at(self):
+        """created_at of the oldest subscription event, or None."""
+
+    # invite links
+
+    @abstractmethod
+    async def get_user_invite_link(self, user_id, min_expires_at):
+        """Return (invite_link, expires_at) for the user's newest usable link, or None."""
+
+    @abstractmethod
+    async def save_invite_links(self, links, created_at):
+        """Store (invite_link, user_id or None, expires_at) rows."""
+
+    @abstractmethod
+    async def claim_pooled_invite_link(self, user_id, min_expires_at):
+        """Assign a pooled link to the user and return (invite_link, expires_at), or None."""
+
+    @abstractmethod
+    async def count_pooled_invite_links(self, min_expires_at) -> int:
+        """Count pooled links that expire after min_expires_at."""
+
+    @abstractmethod
+    async def get_stale_invite_links(self, now, min_expires_at, limit):
+        """Unexpired links held by unsubscribed users or pooled links about to expire."""
+
+    @abstractmethod
+    async def revoke_invite_links(self, links):
+        """Mark the links revoked."""
+
+    @abstractmethod
+    async def purge_expired_invite_links(self, before) -> int:
+        """Delete links that expired before the given time and return how many."""
+
+    # payment requests
+
+    @abstractmethod
+    async def add_payment_request(self, user_id, file_id, file_unique_id, reviewer_id, created_at):
+        """Store a pending request assigned to reviewer_id and return its id, or None if the
+        screenshot is already pending review."""
+
+    @abstractmethod
+    async def delete_payment_request(self, request_id) -> bool:
+        """Forget a pending request, e.g. one no admin could be notified of."""
+
+    @abstractmethod
+    async def get_pending_payment_requests(self, after_id, limit):
+        """Pending requests with id > after_id in id order, joined with the user's name."""
+
+    @abstractmethod
+    async def count_pending_payment_requests(self) -> int:
+        """Count pending requests."""
+
+    @abstractmethod
+    async def count_pending_by_reviewer(self) -> dict:
+        """Pending requests per reviewer_id."""
+
+    @abstractmethod
+    async def resolve_payment_requests(self, user_ids, approved, expires_at, payment, resolved_at):
+        """In one transaction close the users' pending requests and, for the users that had one, record
+        the subscription history and, when approved, activate their subscriptions; return those user ids."""
+
+    # admin message routes
+
+    @abstractmethod
+    async def add_admin_route(self, chat_id, message_id, user_id, created_at):
+        """Remember which user an admin's notification message is about."""
+
+    @abstractmethod
+    async def get_admin_route(self, chat_id, message_id):
+        """Return the user_id for an admin's notification message, or None."""
+
+    @abstractmethod
+    async def purge_admin_routes(self, before) -> int:
+        """Delete routes created before the given time and return how many."""
+
+    # scheduler
+
+    @abstractmethod
+    async def acquire_lease(self, name, holder, now, expires_at) -> bool:
+        """Take or renew the named lease if it is free, expired or already ours."""
+
+    @abstractmethod
+    async def release_lease(self, name, holder):
+        """Drop the lease if we hold it."""
+
+    @abstractmethod
+    async def get_job_runs(self) -> dict:
+        """Return the last run time of every job, keyed by job id."""
+
+    @abstractmethod
+    async def record_job_run(self, job, ran_at):
+        """Store the job's last run time."""
+
+    @abstractmethod
+    async def get_checkpoint(self, name):
+        """Return the stored checkpoint value, or None."""
+
+    @abstractmethod
+    async def save_checkpoint(self, name, value, updated_at):
+        """Store a checkpoint value (a string)."""
+
+    @abstractmethod
+    async def delete_checkpoint(self, name):
+        """Forget the checkpoint."""
+
+
+def create_repository(settings: dict) -> Repository:
+    backend = settings.get("backend", "sqlite")
+    if backend == "sqlite":
+        from app.database.sqlite import SqliteRepository
+
+        return SqliteRepository(settings["path"], readers=settings.get("readers", 4))
+    if backend == "postgres":
+        from app.database.postgres import PostgresRepository
+
+        return PostgresRepository(
+            host=settings.get("host", "localhost"),
+            port=settings.get("port", 5432),
+            user=settings.get("user", "postgres"),
+            password=settings.get("password"),
+            database=settings.get("database", "postgres"),
+            min_size=settings.get("min_size", 2),
+            max_size=settings.get("max_size", 10),
+        )
+    raise ValueError(f"Unknown database backend: {backend}")
@@ -0,0 +1,588 @@
+import json
+import logging
+
+from app.database.connection import Database
+from app.database.migrations import run_migrations
+from app.database.repository import Repository, rollup_row
+
+logger = logging.getLogger("db")
+
+
+async def _bump_counter(conn, name, delta):
+    if delta:
+        await conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = ?", (delta, name))
+
+
+async def _add_events(conn, user_ids, created_at, kind=None, amount=0, expires_at=None):
+    # Without a kind the events are payments: "new" for a user's first one,
+    # "renewed" after that.
+    await conn.execute(
+        """
+        INSERT INTO subscription_events (user_id, kind, amount, expires_at, created_at)
+        SELECT value, COALESCE(?, CASE WHEN EXISTS (
+            SELECT 1 FROM subscription_events e WHERE e.user_id = value AND e.kind IN ('new', 'renewed')
+        ) THEN 'renewed' ELSE 'new' END), ?, ?, ?
+        FROM json_each(?)
+    """,
+        (kind, amount, expires_at, created_at, json.dumps(list(user_ids))),
+    )
+
+
+class SqliteRepository(Repository):
+    name = "sqlite"
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.db = Database(path, readers)
+
+    async def open(self):
+        logger.info("Opening SQLite database at %s", self.path)
+        await self.db.open()
+        await run_migrations(self.db)
+
+    async def close(self):
+        await self.db.close()
+
+    # users
+
+    async def insert_users(self, rows):
+        async with self.db.writer() as conn:
+            cursor = await conn.executemany(
+                """
+                INSERT OR IGNORE INTO users (user_id, first_name, last_name, phone_number, username)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                rows,
+            )
+            # rowcount only counts rows that were actually inserted.
+            await _bump_counter(conn, "total_users", cursor.rowcount)
+        return cursor.rowcount
+
+    async def get_user(self, user_id):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def update_subscription(self, user_id, is_subscribed, expires_at, payment, changed_at):
+        async with self.db.writer() as conn:
+            async with conn.execute("SELECT is_subscribed FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                old = await cursor.fetchone()
+            if old is None:
+                return False
+            await conn.execute(
+                """
+                UPDATE users
+                SET is_subscribed = ?, subscription_expires_at = ?
+                WHERE user_id = ?
+            """,
+                (is_subscribed, expires_at, user_id),
+            )
+            await _bump_counter(conn, "active_subscribers", int(bool(is_subscribed)) - int(bool(old[0])))
+            await _bump_counter(conn, "revenue", payment)
+            if is_subscribed:
+                await _add_events(conn, [user_id], changed_at, amount=payment, expires_at=expires_at)
+            elif old[0]:
+                await _add_events(conn, [user_id], changed_at, "expired")
+        return True
+
+    async def get_subscriptions_expiring(self, after, until):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT user_id, subscription_expires_at
+                FROM users
+                WHERE is_subscribed = 1
+                AND subscription_expires_at > ?
+                AND subscription_expires_at <= ?
+            """,
+                (-1 if after is None else after, until),
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_due_reminders(self, stage, after, until):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT u.user_id, u.subscription_expires_at
+                FROM users u
+                WHERE u.is_subscribed = 1
+                AND u.subscription_expires_at > ?
+                AND u.subscription_expires_at <= ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM reminders r
+                    WHERE r.user_id = u.user_id AND r.stage = ? AND r.expires_at = u.subscription_expires_at
+                )
+            """,
+                (after, until, stage),
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def claim_reminders(self, stage, rows, sent_at):
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                """
+                INSERT INTO reminders (user_id, stage, expires_at, sent_at)
+                SELECT json_extract(value, '$[0]'), ?, json_extract(value, '$[1]'), ? FROM json_each(?) WHERE 1
+                ON CONFLICT DO NOTHING
+                RETURNING user_id
+            """,
+                (stage, sent_at, json.dumps([list(row) for row in rows])),
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def release_reminder(self, user_id, stage, expires_at):
+        async with self.db.writer() as conn:
+            await conn.execute(
+                "DELETE FROM reminders WHERE user_id = ? AND stage = ? AND expires_at = ?", (user_id, stage, expires_at)
+            )
+
+    async def purge_reminders(self, before):
+        async with self.db.writer() as conn:
+            cursor = await conn.execute("DELETE FROM reminders WHERE expires_at <= ?", (before,))
+        return cursor.rowcount
+
+    async def get_users_after(self, after_id, limit):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (after_id, limit)
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def upsert_users(self, rows):
+        ids = json.dumps([row[0] for row in rows])
+        # Rows without is_subscribed leave the subscription fields alone.
+        with_subscription = [row for row in rows if row[5] is not None]
+        names = [row[:5] for row in rows if row[5] is None]
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                "SELECT user_id, is_subscribed FROM users WHERE user_id IN (SELECT value FROM json_each(?))", (ids,)
+            ) as cursor:
+                existing = {row[0]: bool(row[1]) for row in await cursor.fetchall()}
+            await conn.executemany(
+                """
+                INSERT INTO users (user_id, first_name, last_name, phone_number, username,
+                    is_subscribed, subscription_expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    first_name = COALESCE(excluded.first_name, first_name),
+                    last_name = COALESCE(excluded.last_name, last_name),
+                    phone_number = COALESCE(excluded.phone_number, phone_number),
+                    username = COALESCE(excluded.username, username),
+                    is_subscribed = excluded.is_subscribed,
+                    subscription_expires_at = excluded.subscription_expires_at
+            """,
+                with_subscription,
+            )
+            await conn.executemany(
+                """
+                INSERT INTO users (user_id, first_name, last_name, phone_number, username)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    first_name = COALESCE(excluded.first_name, first_name),
+                    last_name = COALESCE(excluded.last_name, last_name),
+                    phone_number = COALESCE(excluded.phone_number, phone_number),
+                    username = COALESCE(excluded.username, username)
+            """,
+                names,
+            )
+            inserted = len(rows) - len(existing)
+            active = sum(1 for row in with_subscription if row[5])
+            active -= sum(existing.get(row[0], False) for row in with_subscription)
+            await _bump_counter(conn, "total_users", inserted)
+            await _bump_counter(conn, "active_subscribers", active)
+        return inserted, len(existing)
+
+    async def iter_users(self, batch_size=1000):
+        # SQLite steps the statement lazily, so only one batch is in memory.
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT * FROM users ORDER BY user_id") as cursor:
+                while rows := await cursor.fetchmany(batch_size):
+                    for row in rows:
+                        yield dict(row)
+
+    # statistics
+
+    async def get_counters(self):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT name, value FROM stats_counters") as cursor:
+                return {row["name"]: row["value"] for row in await cursor.fetchall()}
+
+    async def get_snapshots(self, days):
+        days = list(days)
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                f"SELECT * FROM stats_snapshots WHERE day IN ({', '.join('?' * len(days))})", days
+            ) as cursor:
+                return {row["day"]: dict(row) for row in await cursor.fetchall()}
+
+    async def reconcile_counters(self):
+        async with self.db.writer() as conn:
+            async with conn.execute("SELECT name, value FROM stats_counters") as cursor:
+                before = {row["name"]: row["value"] for row in await cursor.fetchall()}
+            async with conn.execute("SELECT COUNT(*), COALESCE(SUM(is_subscribed = 1), 0) FROM users") as cursor:
+                total_users, active_subscribers = await cursor.fetchone()
+            after = {"total_users": total_users, "active_subscribers": active_subscribers}
+            await conn.executemany(
+                "INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)", list(after.items())
+            )
+        return before, after
+
+    async def count_lapsed_subscriptions(self, now):
+        # Two index range counts: a NULL expiry never matches "<= ?".
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM users WHERE is_subscribed = 1 AND subscription_expires_at IS NULL)
+                    + (SELECT COUNT(*) FROM users WHERE is_subscribed = 1 AND subscription_expires_at <= ?)
+            """,
+                (now,),
+            ) as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def take_snapshot(self, day, now):
+        lapsed = await self.count_lapsed_subscriptions(now)
+        async with self.db.writer() as conn:
+            await conn.execute(
+                """
+                INSERT OR REPLACE INTO stats_snapshots (day, total_users, active_subscribers, revenue)
+                SELECT ?,
+                    COALESCE(MAX(CASE WHEN name = 'total_users' THEN value END), 0),
+                    COALESCE(MAX(CASE WHEN name = 'active_subscribers' THEN value END), 0) - ?,
+                    COALESCE(MAX(CASE WHEN name = 'revenue' THEN value END), 0)
+                FROM stats_counters
+            """,
+                (day, lapsed),
+            )
+
+    async def rollup_day(self, day, start, end, price):
+        # Aggregated on a reader, so writers only wait for the final insert.
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT kind, COUNT(*), COALESCE(SUM(amount), 0) FROM subscription_events
+                WHERE created_at >= ? AND created_at < ?
+                GROUP BY kind
+            """,
+                (start, end),
+            ) as cursor:
+                kinds = {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+            # Subscribed at the end of the day: the user's latest payment or
+            # expiry before then is a payment that runs past it.
+            async with conn.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(COALESCE(e.amount, ?)), 0)
+                FROM subscription_events e
+                WHERE e.kind IN ('new', 'renewed') AND e.expires_at > ? AND e.created_at < ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM subscription_events l
+                    WHERE l.user_id = e.user_id AND l.kind IN ('new', 'renewed', 'expired')
+                    AND l.created_at < ? AND l.id > e.id
+                )
+            """,
+                (price, end, end, end),
+            ) as cursor:
+                active, mrr = await cursor.fetchone()
+        row = rollup_row(day, kinds, active, mrr)
+        async with self.db.writer() as conn:
+            await conn.execute(
+                """
+                INSERT OR REPLACE INTO daily_rollups (day, new, renewed, churned, rejected, revenue, active, mrr)
+                VALUES (:day, :new, :renewed, :churned, :rejected, :revenue, :active, :mrr)
+            """,
+                row,
+            )
+        return row
+
+    async def rollup_cohorts(self, month, start, end):
+        async with self.db.writer() as conn:
+            await conn.execute("DELETE FROM cohort_retention WHERE month = ?", (month,))
+            await conn.execute(
+                """
+                INSERT INTO cohort_retention (cohort, month, users)
+                SELECT strftime('%Y-%m', first_paid, 'unixepoch'), ?, COUNT(*)
+                FROM (
+                    SELECT (
+                        SELECT MIN(f.created_at) FROM subscription_events f
+                        WHERE f.user_id = e.user_id AND f.kind IN ('new', 'renewed')
+                    ) AS first_paid
+                    FROM subscription_events e
+                    WHERE e.kind IN ('new', 'renewed') AND e.expires_at > ? AND e.created_at < ?
+                    GROUP BY e.user_id
+                )
+                GROUP BY 1
+            """,
+                (month, start, end),
+            )
+
+    async def get_daily_rollups(self, since):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT * FROM daily_rollups WHERE day >= ? ORDER BY day", (since,)) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_cohort_retention(self, since):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                "SELECT * FROM cohort_retention WHERE cohort >= ? ORDER BY cohort, month", (since,)
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_last_rollup_day(self):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT MAX(day) FROM daily_rollups") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def get_first_event_at(self):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT MIN(created_at) FROM subscription_events") as cursor:
+                return (await cursor.fetchone())[0]
+
+    # invite links
+
+    async def get_user_invite_link(self, user_id, min_expires_at):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT invite_link, expires_at
+                FROM invite_links
+                WHERE user_id = ? AND revoked = 0 AND expires_at > ?
+                ORDER BY expires_at DESC
+                LIMIT 1
+            """,
+                (user_id, min_expires_at),
+            ) as cursor:
+                row = await cursor.fetchone()
+                return (row["invite_link"], row["expires_at"]) if row else None
+
+    async def save_invite_links(self, links, created_at):
+        async with self.db.writer() as conn:
+            await conn.executemany(
+                """
+                INSERT OR IGNORE INTO invite_links (invite_link, user_id, expires_at, created_at)
+                VALUES (?, ?, ?, ?)
+            """,
+                [(link, user_id, expires_at, created_at) for link, user_id, expires_at in links],
+            )
+
+    async def claim_pooled_invite_link(self, user_id, min_expires_at):
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                """
+                UPDATE invite_links
+                SET user_id = ?
+                WHERE invite_link = (
+                    SELECT invite_link FROM invite_links
+                    WHERE user_id IS NULL AND revoked = 0 AND expires_at > ?
+                    ORDER BY expires_at
+                    LIMIT 1
+                )
+                RETURNING invite_link, expires_at
+            """,
+                (user_id, min_expires_at),
+            ) as cursor:
+                row = await cursor.fetchone()
+        return (row["invite_link"], row["expires_at"]) if row else None
+
+    async def count_pooled_invite_links(self, min_expires_at):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT COUNT(*) FROM invite_links
+                WHERE user_id IS NULL AND revoked = 0 AND expires_at > ?
+            """,
+                (min_expires_at,),
+            ) as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def get_stale_invite_links(self, now, min_expires_at, limit):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT l.invite_link
+                FROM invite_links AS l
+                JOIN users AS u ON u.user_id = l.user_id
+                WHERE l.revoked = 0 AND l.expires_at > ? AND u.is_subscribed = 0
+                UNION ALL
+                SELECT invite_link
+                FROM invite_links
+                WHERE user_id IS NULL AND revoked = 0 AND expires_at > ? AND expires_at <= ?
+                LIMIT ?
+            """,
+                (now, now, min_expires_at, limit),
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def revoke_invite_links(self, links):
+        async with self.db.writer() as conn:
+            await conn.executemany(
+                "UPDATE invite_links SET revoked = 1 WHERE invite_link = ?", [(link,) for link in links]
+            )
+
+    async def purge_expired_invite_links(self, before):
+        async with self.db.writer() as conn:
+            cursor = await conn.execute("DELETE FROM invite_links WHERE expires_at <= ?", (before,))
+        return cursor.rowcount
+
+    # payment requests
+
+    async def add_payment_request(self, user_id, file_id, file_unique_id, reviewer_id, created_at):
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                """
+                INSERT OR IGNORE INTO payment_requests (user_id, file_id, file_unique_id, reviewer_id, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                RETURNING id
+            """,
+                (user_id, file_id, file_unique_id, reviewer_id, created_at),
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def delete_payment_request(self, request_id):
+        async with self.db.writer() as conn:
+            cursor = await conn.execute(
+                "DELETE FROM payment_requests WHERE id = ? AND status = 'pending'", (request_id,)
+            )
+        return cursor.rowcount > 0
+
+    async def get_pending_payment_requests(self, after_id, limit):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT p.id, p.user_id, p.file_id, p.created_at, u.first_name, u.username
+                FROM payment_requests AS p
+                LEFT JOIN users AS u ON u.user_id = p.user_id
+                WHERE p.status = 'pending' AND p.id > ?
+                ORDER BY p.id
+                LIMIT ?
+            """,
+                (after_id, limit),
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def count_pending_payment_requests(self):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'") as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def count_pending_by_reviewer(self):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                """
+                SELECT reviewer_id, COUNT(*) FROM payment_requests
+                WHERE status = 'pending' AND reviewer_id IS NOT NULL
+                GROUP BY reviewer_id
+            """
+            ) as cursor:
+                return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def resolve_payment_requests(self, user_ids, approved, expires_at, payment, resolved_at):
+        # The id list is bound as one JSON parameter, so any number of users
+        # fits in a single statement. Only users whose pending requests this
+        # call closed are touched, so a repeated approval is a no-op.
+        ids = json.dumps(list(user_ids))
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                """
+                UPDATE payment_requests SET status = ?, resolved_at = ?
+                WHERE status = 'pending' AND user_id IN (SELECT value FROM json_each(?))
+                RETURNING user_id
+            """,
+                ("approved" if approved else "rejected", resolved_at, ids),
+            ) as cursor:
+                ids = json.dumps(list({row[0] for row in await cursor.fetchall()}))
+            async with conn.execute(
+                "SELECT user_id, is_subscribed FROM users WHERE user_id IN (SELECT value FROM json_each(?))", (ids,)
+            ) as cursor:
+                users = await cursor.fetchall()
+            if approved and users:
+                await conn.execute(
+                    """
+                    UPDATE users SET is_subscribed = 1, subscription_expires_at = ?
+                    WHERE user_id IN (SELECT value FROM json_each(?))
+                """,
+                    (expires_at, ids),
+                )
+                await _bump_counter(conn, "active_subscribers", sum(1 for row in users if not row[1]))
+                await _bump_counter(conn, "revenue", payment * len(users))
+                await _add_events(conn, [row[0] for row in users], resolved_at, amount=payment, expires_at=expires_at)
+            elif users:
+                await _add_events(conn, [row[0] for row in users], resolved_at, "rejected")
+        return [row[0] for row in users]
+
+    # admin message routes
+
+    async def add_admin_route(self, chat_id, message_id, user_id, created_at):
+        async with self.db.writer() as conn:
+            await conn.execute(
+                "INSERT OR REPLACE INTO admin_routes (chat_id, message_id, user_id, created_at) VALUES (?, ?, ?, ?)",
+                (chat_id, message_id, user_id, created_at),
+            )
+
+    async def get_admin_route(self, chat_id, message_id):
+        async with self.db.reader() as conn:
+            async with conn.execute(
+                "SELECT user_id FROM admin_routes WHERE chat_id = ? AND message_id = ?", (chat_id, message_id)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def purge_admin_routes(self, before):
+        async with self.db.writer() as conn:
+            cursor = await conn.execute("DELETE FROM admin_routes WHERE created_at < ?", (before,))
+        return cursor.rowcount
+
+    # scheduler
+
+    async def acquire_lease(self, name, holder, now, expires_at):
+        async with self.db.writer() as conn:
+            async with conn.execute(
+                """
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+                RETURNING holder
+            """,
+                (name, holder, expires_at, now),
+            ) as cursor:
+                return await cursor.fetchone() is not None
+
+    async def release_lease(self, name, holder):
+        async with self.db.writer() as conn:
+            await conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    async def get_job_runs(self):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT job, last_run_at FROM job_runs") as cursor:
+                return {row["job"]: row["last_run_at"] for row in await cursor.fetchall()}
+
+    async def record_job_run(self, job, ran_at):
+        async with self.db.writer() as conn:
+            await conn.execute(
+                """
+                INSERT INTO job_runs (job, last_run_at) VALUES (?, ?)
+                ON CONFLICT (job) DO UPDATE SET last_run_at = excluded.last_run_at
+            """,
+                (job, ran_at),
+            )
+
+    async def get_checkpoint(self, name):
+        async with self.db.reader() as conn:
+            async with conn.execute("SELECT value FROM checkpoints WHERE name = ?", (name,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def save_checkpoint(self, name, value, updated_at):
+        async with self.db.writer() as conn:
+            await conn.execute(
+                """
+                INSERT INTO checkpoints (name, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            """,
+                (name, value, updated_at),
+            )
+
+    async def delete_checkpoint(self, name):
+        async with self.db.writer() as conn:
+            await conn.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import re
 from datetime import datetime, timedelta
@@ -6,33 +7,77 @@ from aiogram import F, Router, types
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from app.database.models import get_stats, update_subscription
+from app.database.models import (
+    count_pending_payments,
+    get_admin_route,
+    get_pending_payments,
+    get_stats,
+    get_subscription_report,
+    resolve_payments,
+    subscription_cache,
+)
+from app.middlewares.antiflood import AntiFloodMiddleware
+from app.middlewares.ordering import OrderedUpdatesMiddleware
+from app.utils.delivery import SENT, DeliveryEngine
+from app.utils.expiry import ExpiryTimers
+from app.utils.reconcile import claim, reconcile_membership
+from app.utils.reviewers import ReviewerPool
+from app.utils.session import TelegramSession
+from app.utils.stats import format_report, format_stats
 from config.config import config
 
 router = Router()
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] [Admin] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
 logger = logging.getLogger(__name__)
 
+PENDING_PAGE_SIZE = 10
+
+# Strong references to jobs started from commands, so they are not
+# garbage-collected mid-run.
+_background_tasks = set()
+
 
 @router.message(Command("a"))
-async def admin_stats(message: types.Message):
+async def admin_stats(
+    message: types.Message,
+    antiflood: AntiFloodMiddleware,
+    ordering: OrderedUpdatesMiddleware,
+    reviewers: ReviewerPool,
+):
     logger.info("Received /a command from user_id=%s", message.from_user.id)
-    if message.from_user.id != config.admin_id:
+    if message.from_user.id not in config.admins:
         logger.warning("Unauthorized access to /a by user_id=%s", message.from_user.id)
         await message.answer("У вас нет прав для этого действия.")
         return
     logger.info("Admin %s requesting statistics", message.from_user.id)
     try:
-        stats = await get_stats(config.db["path"])
+        stats = await get_stats()
+        cache_stats = subscription_cache.stats()
+        flood_stats = antiflood.stats()
+        queue_stats = ordering.stats()
+        load = await reviewers.load()
+        if cache_stats["enabled"]:
+            cache_line = (
+                f"Кэш подписок: {cache_stats['hits']} попаданий, {cache_stats['misses']} промахов "
+                f"({cache_stats['hit_rate']:.0%}), записей: {cache_stats['size']}"
+            )
+        else:
+            cache_line = "Кэш подписок: выключен"
         response = (
-            f"📊 Статистика:\n"
-            f"Всего пользователей: {stats['total_users']}\n"
-            f"Активные подписчики: {stats['active_subscribers']}\n"
-            f"Без подписки: {stats['non_subscribers']}\n"
-            f"Оценочный месячный доход: {stats['estimated_income']}₽"
+            f"{format_stats('📊 Статистика', stats)}\n"
+            f"{cache_line}\n"
+            f"Антифлуд: отброшено {flood_stats['dropped']}, "
+            f"объединено скриншотов {flood_stats['coalesced_photos']}\n"
+            f"Очередь обновлений: пользователей {queue_stats['keys']}, ожидают {queue_stats['queued']}, "
+            f"отброшено {queue_stats['dropped']}"
         )
+        if len(load) > 1:
+            response += "\nНа проверке: " + ", ".join(f"{reviewer}: {count}" for reviewer, count in load.items())
+        if isinstance(message.bot.session, TelegramSession):
+            api_stats = message.bot.session.stats()
+            response += (
+                f"\nBot API: предохранитель {api_stats['state']}, ошибок подряд {api_stats['failures']}, "
+                f"отклонено {api_stats['rejected']}"
+            )
         logger.info("Sending stats to admin: %s", response)
         await message.answer(response)
     except Exception as e:
@@ -40,30 +85,75 @@ async def admin_stats(message: types.Message):
         await message.answer("Произошла ошибка при получении статистики.")
 
 
+@router.message(Command("report"))
+async def subscription_report(message: types.Message):
+    if message.from_user.id not in config.admins:
+        logger.warning("Unauthorized access to /report by user_id=%s", message.from_user.id)
+        await message.answer("У вас нет прав для этого действия.")
+        return
+    args = message.text.split()[1:]
+    days = int(args[0]) if args and args[0].isdigit() else 30
+    try:
+        # Reads only the nightly rollups, never the raw history.
+        report = await get_subscription_report(days)
+        await message.answer(format_report(days, report))
+    except Exception as e:
+        logger.error("Failed to build subscription report: %s", str(e))
+        await message.answer("Произошла ошибка при получении отчёта.")
+
+
+def _channel_keyboard():
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Перейти в канал", url=f"https://t.me/{config.channel_id}")]]
+    )
+
+
+async def _approve_users(bot, user_ids, delivery: DeliveryEngine, expiry_timers: ExpiryTimers):
+    # One transaction for every user, then notifications through the
+    # delivery engine's rate-limited workers.
+    expires_at = datetime.utcnow() + timedelta(days=30)
+    approved = await resolve_payments(user_ids, True, expires_at, payment=config.subscription_price)
+    for user_id in approved:
+        expiry_timers.schedule(user_id, expires_at)
+    text = f"Ваша подписка подтверждена до {expires_at.strftime('%d.%m.%Y')}!"
+    report = await delivery.run(
+        delivery.send_message(bot, user_id, text, reply_markup=_channel_keyboard()) for user_id in approved
+    )
+    logger.info("Approved subscriptions for %s users until %s: %s", len(approved), expires_at, report)
+    return approved, expires_at, report
+
+
+async def _reject_users(bot, user_ids, delivery: DeliveryEngine):
+    rejected = await resolve_payments(user_ids, False)
+    report = await delivery.run(
+        delivery.send_message(bot, user_id, "Ваша оплата была отклонена. Пожалуйста, свяжитесь с поддержкой.")
+        for user_id in rejected
+    )
+    logger.info("Rejected payments for %s users: %s", len(rejected), report)
+    return rejected, report
+
+
 @router.callback_query(lambda c: c.data.startswith("approve_"))
-async def approve_subscription(callback: types.CallbackQuery):
-    if callback.from_user.id != config.admin_id:
+async def approve_subscription(
+    callback: types.CallbackQuery, delivery: DeliveryEngine, expiry_timers: ExpiryTimers
+):
+    if callback.from_user.id not in config.admins:
         logger.warning("Unauthorized callback approve by user_id=%s", callback.from_user.id)
         await callback.answer("У вас нет прав для этого действия.", show_alert=True)
         return
     user_id = int(callback.data.split("_")[1])
-    expires_at = datetime.utcnow() + timedelta(days=30)
     try:
-        await update_subscription(callback.bot.pool, user_id, True, expires_at)
-        logger.info("Approved subscription for user_id=%s until %s", user_id, expires_at)
+        approved, expires_at, _ = await _approve_users(callback.bot, [user_id], delivery, expiry_timers)
+        if not approved:
+            # Already handled by another tap or another reviewer.
+            logger.warning("No pending payment to approve for user_id=%s", user_id)
+            await callback.message.edit_reply_markup(reply_markup=None)
+            await callback.answer("Нет ожидающей заявки: она уже обработана.", show_alert=True)
+            return
         await callback.message.edit_reply_markup(reply_markup=None)  # Remove buttons
         await callback.message.answer(
             f"Подписка для пользователя {user_id} подтверждена до {expires_at.strftime('%d.%m.%Y')}."
         )
-        await callback.bot.send_message(
-            user_id,
-            f"Ваша подписка подтверждена до {expires_at.strftime('%d.%m.%Y')}!",
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Перейти в канал", url=f"https://t.me/{config.channel_id}")]
-                ]
-            ),
-        )
         await callback.answer("Подписка подтверждена.")
     except Exception as e:
         logger.error("Failed to approve subscription for user_id=%s: %s", user_id, str(e))
@@ -71,41 +161,186 @@ async def approve_subscription(callback: types.CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("reject_"))
-async def reject_subscription(callback: types.CallbackQuery):
-    if callback.from_user.id != config.admin_id:
+async def reject_subscription(callback: types.CallbackQuery, delivery: DeliveryEngine):
+    if callback.from_user.id not in config.admins:
         logger.warning("Unauthorized callback reject by user_id=%s", callback.from_user.id)
         await callback.answer("У вас нет прав для этого действия.", show_alert=True)
         return
     user_id = int(callback.data.split("_")[1])
     try:
-        logger.info("Rejected subscription for user_id=%s", user_id)
+        rejected, _ = await _reject_users(callback.bot, [user_id], delivery)
         await callback.message.edit_reply_markup(reply_markup=None)  # Remove buttons
+        if not rejected:
+            logger.warning("No pending payment to reject for user_id=%s", user_id)
+            await callback.answer("Нет ожидающей заявки: она уже обработана.", show_alert=True)
+            return
         await callback.message.answer(f"Подписка для пользователя {user_id} отклонена.")
-        await callback.bot.send_message(user_id, "Ваша оплата была отклонена. Пожалуйста, свяжитесь с поддержкой.")
         await callback.answer("Подписка отклонена.")
     except Exception as e:
         logger.error("Failed to reject subscription for user_id=%s: %s", user_id, str(e))
         await callback.answer("Ошибка при отклонении подписки.", show_alert=True)
 
 
-@router.message(F.reply_to_message & F.from_user.id == config.admin_id)
-async def handle_admin_reply(message: types.Message):
-    logger.info("Received reply from admin_id=%s", message.from_user.id)
-    if not message.reply_to_message or not message.reply_to_message.caption:
-        logger.warning("Admin reply has no valid reply_to_message or caption")
-        await message.answer("Пожалуйста, ответьте на сообщение с информацией о пользователе.")
+async def _pending_page(after_id=0):
+    rows = await get_pending_payments(after_id, PENDING_PAGE_SIZE)
+    if not rows:
+        return "Нет заявок, ожидающих проверки.", None
+    total = await count_pending_payments()
+    lines = [f"🧾 Заявки на проверку: {total}", ""]
+    for row in rows:
+        lines.append(
+            f"#{row['id']} · ID: {row['user_id']} · {row['first_name'] or '—'} (@{row['username'] or 'нет'}) · "
+            f"{row['created_at'].strftime('%d.%m %H:%M')}"
+        )
+    lines.append("")
+    lines.append("Выборочно: /approve ID ID ... или /reject ID ID ...")
+    last_id = rows[-1]["id"]
+    buttons = [
+        [
+            InlineKeyboardButton(text="✅ Подтвердить страницу", callback_data=f"pending_approve_{after_id}_{last_id}"),
+            InlineKeyboardButton(text="❌ Отклонить страницу", callback_data=f"pending_reject_{after_id}_{last_id}"),
+        ]
+    ]
+    if len(rows) == PENDING_PAGE_SIZE:
+        buttons.append([InlineKeyboardButton(text="Далее ▶️", callback_data=f"pending_page_{last_id}")])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@router.message(Command("pending"))
+async def list_pending_payments(message: types.Message):
+    if message.from_user.id not in config.admins:
+        logger.warning("Unauthorized access to /pending by user_id=%s", message.from_user.id)
+        await message.answer("У вас нет прав для этого действия.")
         return
-    caption = message.reply_to_message.caption
-    user_id_match = re.search(r"ID: (\d+)", caption)
-    if not user_id_match:
-        logger.warning("Could not extract user ID from caption: %s", caption)
-        await message.answer("Не удалось определить ID пользователя из сообщения.")
+    try:
+        text, keyboard = await _pending_page()
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Failed to list pending payments: %s", str(e))
+        await message.answer("Произошла ошибка при получении заявок.")
+
+
+@router.callback_query(F.data.startswith("pending_"))
+async def handle_pending_page(callback: types.CallbackQuery, delivery: DeliveryEngine, expiry_timers: ExpiryTimers):
+    if callback.from_user.id not in config.admins:
+        logger.warning("Unauthorized pending callback by user_id=%s", callback.from_user.id)
+        await callback.answer("У вас нет прав для этого действия.", show_alert=True)
         return
-    user_id = int(user_id_match.group(1))
+    action, *bounds = callback.data.split("_")[1:]
     try:
-        await message.bot.send_message(user_id, message.text)
-        logger.info("Admin replied to user_id=%s with message: %s", user_id, message.text)
-        await message.answer(f"Сообщение отправлено пользователю {user_id}.")
+        if action == "page":
+            after_id = int(bounds[0])
+            answer = None
+        else:
+            # Only the requests that were shown on this page, even if newer
+            # ones have arrived since.
+            after_id, last_id = int(bounds[0]), int(bounds[1])
+            rows = await get_pending_payments(after_id, PENDING_PAGE_SIZE)
+            user_ids = [row["user_id"] for row in rows if row["id"] <= last_id]
+            if action == "approve":
+                resolved, _, report = await _approve_users(callback.bot, user_ids, delivery, expiry_timers)
+                answer = f"Подтверждено: {len(resolved)}. Уведомления — {report.summary()}"
+            else:
+                resolved, report = await _reject_users(callback.bot, user_ids, delivery)
+                answer = f"Отклонено: {len(resolved)}. Уведомления — {report.summary()}"
+        text, keyboard = await _pending_page(after_id)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        if answer:
+            await callback.message.answer(answer)
+        await callback.answer()
     except Exception as e:
-        logger.error("Failed to send reply to user_id=%s: %s", user_id, str(e))
+        logger.error("Failed to handle pending callback %s: %s", callback.data, str(e))
+        await callback.answer("Ошибка при обработке заявок.", show_alert=True)
+
+
+def _parse_user_ids(message: types.Message):
+    try:
+        return [int(arg) for arg in message.text.split()[1:]]
+    except ValueError:
+        return []
+
+
+def _not_pending(user_ids, resolved):
+    skipped = set(user_ids) - set(resolved)
+    if not skipped:
+        return ""
+    return f"\nНет ожидающих заявок: {', '.join(map(str, sorted(skipped)))}"
+
+
+@router.message(Command("approve"))
+async def bulk_approve(message: types.Message, delivery: DeliveryEngine, expiry_timers: ExpiryTimers):
+    if message.from_user.id not in config.admins:
+        logger.warning("Unauthorized access to /approve by user_id=%s", message.from_user.id)
+        await message.answer("У вас нет прав для этого действия.")
+        return
+    user_ids = _parse_user_ids(message)
+    if not user_ids:
+        await message.answer("Укажите ID пользователей: /approve ID ID ...")
+        return
+    try:
+        approved, expires_at, report = await _approve_users(message.bot, user_ids, delivery, expiry_timers)
+        response = (
+            f"Подтверждено подписок: {len(approved)} (до {expires_at.strftime('%d.%m.%Y')}).\n"
+            f"Уведомления — {report.summary()}"
+        )
+        await message.answer(response + _not_pending(user_ids, approved))
+    except Exception as e:
+        logger.error("Failed to bulk approve %s users: %s", len(user_ids), str(e))
+        await message.answer("Ошибка при подтверждении подписок.")
+
+
+@router.message(Command("reject"))
+async def bulk_reject(message: types.Message, delivery: DeliveryEngine):
+    if message.from_user.id not in config.admins:
+        logger.warning("Unauthorized access to /reject by user_id=%s", message.from_user.id)
+        await message.answer("У вас нет прав для этого действия.")
+        return
+    user_ids = _parse_user_ids(message)
+    if not user_ids:
+        await message.answer("Укажите ID пользователей: /reject ID ID ...")
+        return
+    try:
+        rejected, report = await _reject_users(message.bot, user_ids, delivery)
+        response = f"Отклонено заявок пользователей: {len(rejected)}.\nУведомления — {report.summary()}"
+        await message.answer(response + _not_pending(user_ids, rejected))
+    except Exception as e:
+        logger.error("Failed to bulk reject %s users: %s", len(user_ids), str(e))
+        await message.answer("Ошибка при отклонении заявок.")
+
+
+@router.message(Command("reconcile"))
+async def start_reconcile(message: types.Message, delivery: DeliveryEngine):
+    if message.from_user.id not in config.admins:
+        logger.warning("Unauthorized access to /reconcile by user_id=%s", message.from_user.id)
+        await message.answer("У вас нет прав для этого действия.")
+        return
+    holder = await claim()
+    if holder is None:
+        await message.answer("Сверка участников канала уже выполняется.")
+        return
+    logger.info("Admin %s started membership reconciliation", message.from_user.id)
+    task = asyncio.create_task(reconcile_membership(message.bot, delivery, holder))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    await message.answer("🔍 Сверка участников канала запущена. Отчёт придёт по завершении.")
+
+
+@router.message(F.reply_to_message & F.from_user.id.in_(config.admins))
+async def handle_admin_reply(message: types.Message, delivery: DeliveryEngine):
+    logger.info("Received reply from admin_id=%s", message.from_user.id)
+    user_id = await get_admin_route(message.chat.id, message.reply_to_message.message_id)
+    if user_id is None and message.reply_to_message.caption:
+        # Notifications sent before routes were stored
+        user_id_match = re.search(r"ID: (\d+)", message.reply_to_message.caption)
+        user_id = int(user_id_match.group(1)) if user_id_match else None
+    if user_id is None:
+        logger.warning("Admin reply to message %s has no known user", message.reply_to_message.message_id)
+        await message.answer("Пожалуйста, ответьте на сообщение со скриншотом пользователя.")
+        return
+    status = await delivery.send_message(message.bot, user_id, message.text)
+    if status == SENT:
+        logger.info("Admin replied to user_id=%s (%s characters)", user_id, len(message.text or ""))
+        await message.answer(f"Сообщение отправлено пользователю {user_id}.")
+    else:
+        logger.error("Failed to send reply to user_id=%s: %s", user_id, status)
         await message.answer("Ошибка при отправке сообщения пользователю.")
@@ -1,18 +1,25 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from aiogram import Bot, F, Router, types
+from aiogram import F, Router, types
 from aiogram.filters import IS_MEMBER, IS_NOT_MEMBER, ChatMemberUpdatedFilter
 from aiogram.types import ContentType, InlineKeyboardButton, InlineKeyboardMarkup
 
-from app.database.models import add_user, get_user
+from app.database.models import (
+    add_admin_route,
+    add_payment_request,
+    add_user,
+    delete_payment_request,
+    get_subscription,
+)
+from app.utils.invite_links import InviteLinkManager
+from app.utils.logs import get_sampled_logger
+from app.utils.reviewers import ReviewerPool
 from config.config import config
 
 router = Router()
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] [Users] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
 logger = logging.getLogger(__name__)
+hot_logger = get_sampled_logger(__name__)
 
 
 def get_payment_keyboard():
@@ -21,51 +28,36 @@ def get_payment_keyboard():
     )
 
 
-async def get_channel_invite_link(bot: Bot, user_id: int):
-    logger.info("Generating invite link for user_id=%s", user_id)
-    try:
-        invite_link = await bot.create_chat_invite_link(
-            chat_id=config.channel_id,
-            member_limit=1,
-            expire_date=int((datetime.utcnow() + timedelta(hours=24)).timestamp()),
-        )
-        logger.info("Invite link generated for user_id=%s: %s", user_id, invite_link.invite_link)
-        return invite_link.invite_link
-    except Exception as e:
-        logger.error("Failed to generate invite link for user_id=%s: %s", user_id, str(e))
-        raise
-
-
 @router.message(F.command == "start")
-async def start_command(message: types.Message):
+async def start_command(message: types.Message, invite_links: InviteLinkManager):
     user = message.from_user
-    logger.info("Processing /start for user_id=%s, username=%s", user.id, user.username)
+    hot_logger.info("Processing /start for user_id=%s, username=%s", user.id, user.username)
     try:
-        await add_user(config.db["path"], user.id, user.first_name, user.last_name, None, user.username)
-        logger.info("add_user called for user_id=%s", user.id)
-        user_data = await get_user(config.db["path"], user.id)
+        await add_user(user.id, user.first_name, user.last_name, None, user.username)
+        hot_logger.info("add_user called for user_id=%s", user.id)
+        user_data = await get_subscription(user.id)
         if user_data:
-            logger.info(
+            hot_logger.info(
                 "User retrieved after add: user_id=%s, is_subscribed=%s, expires_at=%s",
                 user.id,
-                user_data["is_subscribed"],
-                user_data["subscription_expires_at"],
+                user_data.is_subscribed,
+                user_data.subscription_expires_at,
             )
         else:
             logger.error("User not found after add_user: user_id=%s", user.id)
-        if user_data and user_data["is_subscribed"] and user_data["subscription_expires_at"] > datetime.utcnow():
-            logger.info("User %s has active subscription until %s", user.id, user_data["subscription_expires_at"])
-            invite_link = await get_channel_invite_link(message.bot, user.id)
+        if user_data and user_data.is_subscribed and user_data.subscription_expires_at > datetime.utcnow():
+            hot_logger.info("User %s has active subscription until %s", user.id, user_data.subscription_expires_at)
+            invite_link = await invite_links.get_link(user.id)
             await message.answer(
                 f"🎉 Добро пожаловать обратно, {user.first_name}! 💪\n"
-                f"Ваша подписка на эксклюзивный контент Antow New Life активна до {user_data['subscription_expires_at'].strftime('%d.%m.%Y')}.\n"
+                f"Ваша подписка на эксклюзивный контент Antow New Life активна до {user_data.subscription_expires_at.strftime('%d.%m.%Y')}.\n"
                 f"Присоединяйтесь к нашему премиум-каналу с тренировками, планами питания здоровым образом жизни: {invite_link}",
                 reply_markup=InlineKeyboardMarkup(
                     inline_keyboard=[[InlineKeyboardButton(text="🏋️‍♂️ Перейти в канал", url=invite_link)]]
                 ),
             )
         else:
-            logger.info("User %s has no active subscription", user.id)
+            hot_logger.info("User %s has no active subscription", user.id)
             await message.answer(
                 f"🎉 Добро пожаловать в Antow New Life, {user.first_name}! 💪\n"
                 f"Хотите получить доступ к эксклюзивным материалам от Антона Гусева? 🔥\n"
@@ -90,29 +82,40 @@ async def start_command(message: types.Message):
         raise
 
 
+async def _send_to_reviewer(bot, reviewer_id, file_id, caption, keyboard):
+    try:
+        return await bot.send_photo(reviewer_id, photo=file_id, caption=caption, reply_markup=keyboard)
+    except Exception as e:
+        if reviewer_id == config.admin_id:
+            raise
+        # A reviewer who never started the bot or blocked it cannot be
+        # messaged; the main admin gets the screenshot instead.
+        logger.error("Cannot reach reviewer %s, sending to the admin: %s", reviewer_id, str(e))
+        return await bot.send_photo(config.admin_id, photo=file_id, caption=caption, reply_markup=keyboard)
+
+
 @router.message(F.content_type.in_([ContentType.TEXT, ContentType.PHOTO]))
-async def handle_message(message: types.Message):
-    logger.info("Handling message from user_id=%s, content_type=%s", message.from_user.id, message.content_type)
-    user = await get_user(config.db["path"], message.from_user.id)
+async def handle_message(message: types.Message, invite_links: InviteLinkManager, reviewers: ReviewerPool):
+    hot_logger.info("Handling message from user_id=%s, content_type=%s", message.from_user.id, message.content_type)
+    user = await get_subscription(message.from_user.id)
     if user:
-        logger.info(
+        hot_logger.info(
             "User found: user_id=%s, is_subscribed=%s, expires_at=%s",
             message.from_user.id,
-            user["is_subscribed"],
-            user["subscription_expires_at"],
+            user.is_subscribed,
+            user.subscription_expires_at,
         )
     else:
         logger.warning("User not found: user_id=%s, attempting to add", message.from_user.id)
         try:
             await add_user(
-                config.db["path"],
                 message.from_user.id,
                 message.from_user.first_name,
                 message.from_user.last_name,
                 None,
                 message.from_user.username,
             )
-            user = await get_user(config.db["path"], message.from_user.id)
+            user = await get_subscription(message.from_user.id)
             if user:
                 logger.info("User added and retrieved: user_id=%s", message.from_user.id)
             else:
@@ -125,11 +128,11 @@ async def handle_message(message: types.Message):
             logger.error("Error adding user %s: %s", message.from_user.id, str(e))
             await message.answer("😔 Произошла ошибка. Пожалуйста, попробуйте снова или свяжитесь с поддержкой.")
             return
-    if user["is_subscribed"] and user["subscription_expires_at"] > datetime.utcnow():
-        logger.info("User %s has active subscription until %s", message.from_user.id, user["subscription_expires_at"])
-        invite_link = await get_channel_invite_link(message.bot, message.from_user.id)
+    if user.is_subscribed and user.subscription_expires_at > datetime.utcnow():
+        hot_logger.info("User %s has active subscription until %s", message.from_user.id, user.subscription_expires_at)
+        invite_link = await invite_links.get_link(message.from_user.id)
         await message.answer(
-            f"💪 Отлично, {message.from_user.first_name}! Ваша подписка активна до {user['subscription_expires_at'].strftime('%d.%m.%Y')}.\n"
+            f"💪 Отлично, {message.from_user.first_name}! Ваша подписка активна до {user.subscription_expires_at.strftime('%d.%m.%Y')}.\n"
             f"Погрузитесь в мир фитнеса, питания и мотивации в нашем премиум-канале Antow New Life! 🚀\n"
             f"Перейдите по ссылке: {invite_link}",
             reply_markup=InlineKeyboardMarkup(
@@ -138,6 +141,13 @@ async def handle_message(message: types.Message):
         )
         return
     if message.content_type == ContentType.PHOTO:
+        photo = message.photo[-1]
+        reviewer_id = await reviewers.pick()
+        request_id = await add_payment_request(message.from_user.id, photo.file_id, photo.file_unique_id, reviewer_id)
+        if request_id is None:
+            hot_logger.info("Screenshot from user_id=%s is already pending review", message.from_user.id)
+            await message.answer("ℹ️ Этот скриншот уже ожидает проверки. Как только администратор его рассмотрит, мы сообщим вам о решении! 😊")
+            return
         user_info = f"Пользователь: {message.from_user.full_name} (@{message.from_user.username or 'нет'}, ID: {message.from_user.id})"
         admin_keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -147,19 +157,26 @@ async def handle_message(message: types.Message):
                 ]
             ]
         )
-        logger.info("Sending screenshot notification to admin for user_id=%s", message.from_user.id)
-        await message.bot.send_photo(
-            config.admin_id,
-            photo=message.photo[-1].file_id,
-            caption=f"{user_info}\nОтправил скриншот оплаты для доступа к Antow New Life.\nОтветьте на это сообщение, чтобы связаться с пользователем.",
-            reply_markup=admin_keyboard,
-        )
+        caption = f"Заявка #{request_id}\n{user_info}\nОтправил скриншот оплаты для доступа к Antow New Life.\nОтветьте на это сообщение, чтобы связаться с пользователем."
+        logger.info("Sending screenshot of user_id=%s to reviewer %s", message.from_user.id, reviewer_id)
+        try:
+            sent = await _send_to_reviewer(message.bot, reviewer_id, photo.file_id, caption, admin_keyboard)
+        except Exception as e:
+            # Forget the request, otherwise the same screenshot sent again
+            # would count as a duplicate and no admin would ever see it.
+            logger.error("No admin could be notified of payment request %s: %s", request_id, str(e))
+            await delete_payment_request(request_id)
+            await message.answer(
+                "😔 Не удалось передать скриншот на проверку. Пожалуйста, отправьте его ещё раз чуть позже."
+            )
+            raise
+        await add_admin_route(sent.chat.id, sent.message_id, message.from_user.id)
         await message.answer(
             "✅ Ваш скриншот оплаты отправлен на проверку! 🙌\n"
             "Скоро мы подтвердим ваш доступ к эксклюзивному контенту Antow New Life. Оставайтесь на связи! 😊"
         )
     else:
-        logger.info("User %s sent text, prompting payment", message.from_user.id)
+        hot_logger.info("User %s sent text, prompting payment", message.from_user.id)
         await message.answer(
             "🔥 Хотите получить доступ к эксклюзивным материалам от Antow New Life? 💪\n"
             "Оплатите подписку по реквизитам ниже и отправьте скриншот оплаты в этот чат. 🚀\n\n"
@@ -180,16 +197,17 @@ async def handle_message(message: types.Message):
 
 
 @router.chat_member(ChatMemberUpdatedFilter(member_status_changed=(IS_NOT_MEMBER >> IS_MEMBER)))
-async def user_joined_channel(event: types.ChatMemberUpdated):
+async def user_joined_channel(event: types.ChatMemberUpdated, invite_links: InviteLinkManager):
     logger.info("User %s joined channel", event.from_user.id)
-    user = await get_user(event.bot.pool, event.from_user.id)
-    if user and user["is_subscribed"]:
-        logger.info("User %s has active subscription until %s", event.from_user.id, user["subscription_expires_at"])
-        invite_link = await get_channel_invite_link(event.bot, event.from_user.id)
+    await invite_links.mark_used(event.from_user.id, event.invite_link.invite_link if event.invite_link else None)
+    user = await get_subscription(event.from_user.id)
+    if user and user.is_subscribed:
+        logger.info("User %s has active subscription until %s", event.from_user.id, user.subscription_expires_at)
+        invite_link = await invite_links.get_link(event.from_user.id)
         await event.bot.send_message(
             event.from_user.id,
             f"🎉 Поздравляем, {event.from_user.first_name}! Вы в команде Antow New Life! 💪\n"
-            f"Ваша подписка активна до {user['subscription_expires_at'].strftime('%d.%m.%Y')}.\n"
+            f"Ваша подписка активна до {user.subscription_expires_at.strftime('%d.%m.%Y')}.\n"
             f"Наслаждайтесь эксклюзивными материалом! 🚀\n"
             f"Ссылка на канал: {invite_link}",
             reply_markup=InlineKeyboardMarkup(
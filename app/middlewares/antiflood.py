@@ -0,0 +1,111 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class _UserWindow:
+    # Sliding-window counter: the previous fixed window's count is weighted by
+    # how much of it still overlaps the sliding window, so each user costs a
+    # handful of numbers instead of a list of timestamps.
+    __slots__ = ("window_start", "current", "previous", "last_photo", "last_photo_id", "warned")
+
+    def __init__(self, now: float):
+        self.window_start = now
+        self.current = 0
+        self.previous = 0
+        self.last_photo = None
+        self.last_photo_id = None
+        self.warned = False
+
+    def hit(self, now: float, window: float) -> float:
+        elapsed = now - self.window_start
+        if elapsed >= window:
+            self.previous = self.current if elapsed < 2 * window else 0
+            self.current = 0
+            self.window_start = now - (elapsed % window)
+            self.warned = False
+            elapsed = now - self.window_start
+        self.current += 1
+        return self.previous * (1 - elapsed / window) + self.current
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        limit: int = 5,
+        window: float = 10,
+        photo_cooldown: float = 30,
+        max_users: int = 100000,
+        exempt: tuple = (),
+    ):
+        self.limit = limit
+        self.window = window
+        self.photo_cooldown = photo_cooldown
+        self.max_users = max_users
+        self.exempt = set(exempt)
+        self.passed = 0
+        self.dropped = 0
+        self.coalesced_photos = 0
+        # Least recently seen first, so the bound evicts in O(1).
+        self._users = OrderedDict()
+
+    def stats(self):
+        return {
+            "passed": self.passed,
+            "dropped": self.dropped,
+            "coalesced_photos": self.coalesced_photos,
+            "tracked_users": len(self._users),
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or event.from_user is None or event.from_user.id in self.exempt:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        user_id = event.from_user.id
+        window = self._users.get(user_id)
+        if window is None:
+            if len(self._users) >= self.max_users:
+                self._users.popitem(last=False)
+            window = self._users[user_id] = _UserWindow(now)
+        else:
+            self._users.move_to_end(user_id)
+
+        if event.photo:
+            # The same screenshot sent again in quick succession becomes a
+            # single notification to the admin. A different one goes through,
+            # it may be the user correcting a wrong screenshot.
+            photo_id = event.photo[-1].file_unique_id
+            if (
+                photo_id == window.last_photo_id
+                and window.last_photo is not None
+                and now - window.last_photo < self.photo_cooldown
+            ):
+                window.last_photo = now
+                self.coalesced_photos += 1
+                logger.info("Coalesced repeated screenshot from user_id=%s", user_id)
+                return None
+            window.last_photo = now
+            window.last_photo_id = photo_id
+
+        if window.hit(now, self.window) > self.limit:
+            self.dropped += 1
+            if not window.warned:
+                window.warned = True
+                logger.warning("Flood from user_id=%s, dropping updates", user_id)
+                await event.answer("⏳ Слишком много сообщений. Пожалуйста, подождите немного.")
+            return None
+
+        self.passed += 1
+        return await handler(event, data)
@@ -0,0 +1,43 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from app.utils.metrics import API_ERRORS, API_LATENCY, HANDLER_ERRORS, HANDLER_LATENCY
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Registered as an inner middleware, so it only sees updates that matched
+    # a handler and can label them with the handler's module and name.
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        labels = (callback.__module__.rsplit(".", 1)[-1], callback.__name__)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            API_LATENCY.labels(name).observe(time.perf_counter() - started)
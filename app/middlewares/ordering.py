@@ -0,0 +1,99 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.utils.metrics import (
+    UPDATE_QUEUE_DEPTH,
+    UPDATE_QUEUE_DROPPED,
+    UPDATE_QUEUE_KEYS,
+    UPDATE_QUEUE_WAIT,
+    UPDATE_QUEUE_WAITING,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(update: Update, data: dict[str, Any]):
+    # A payment decision is ordered with the paying user's own updates rather
+    # than with the admin's.
+    callback = update.callback_query
+    if callback is not None and callback.data and callback.data.startswith(("approve_", "reject_")):
+        return int(callback.data.split("_")[1])
+    user = data.get("event_from_user")
+    return user.id if user is not None else None
+
+
+class OrderedUpdatesMiddleware(BaseMiddleware):
+    # Outer middleware on dp.update: updates with the same key run one at a
+    # time in arrival order, different keys run concurrently. The update that
+    # finds its key idle runs it and then drains whatever arrived for the key
+    # meanwhile; later updates are queued and return at once, so a burst from
+    # one user ties up one webhook worker or polling task, not all of them.
+    # A key exists only while it has updates in flight.
+    def __init__(self, key: Callable[[Update, dict[str, Any]], Any] = user_key, max_pending: int = 20):
+        self.key = key
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._slots = {}
+
+    def stats(self):
+        return {
+            "keys": len(self._slots),
+            "queued": sum(len(queue) for queue in self._slots.values()),
+            "dropped": self.dropped,
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        key = self.key(event, data)
+        if key is None:
+            return await handler(event, data)
+
+        queue = self._slots.get(key)
+        if queue is not None:
+            # One update of the key is running, so the depth is one more than
+            # the number waiting.
+            if len(queue) + 1 >= self.max_pending:
+                self.dropped += 1
+                UPDATE_QUEUE_DROPPED.inc()
+                logger.warning("Dropping update %s for key=%s, %s already queued", event.update_id, key, len(queue) + 1)
+                return None
+            UPDATE_QUEUE_DEPTH.observe(len(queue) + 1)
+            UPDATE_QUEUE_WAITING.inc()
+            queue.append((handler, event, data, time.perf_counter()))
+            return None
+
+        queue = self._slots[key] = deque()
+        UPDATE_QUEUE_KEYS.inc()
+        UPDATE_QUEUE_DEPTH.observe(0)
+        try:
+            return await handler(event, data)
+        finally:
+            await self._drain(key, queue)
+
+    async def _drain(self, key, queue):
+        try:
+            while queue:
+                handler, event, data, queued = queue.popleft()
+                UPDATE_QUEUE_WAITING.dec()
+                UPDATE_QUEUE_WAIT.observe(time.perf_counter() - queued)
+                try:
+                    await handler(event, data)
+                except Exception as e:
+                    # Nobody awaits a queued update, so its error ends here.
+                    logger.error("Failed to process queued update %s for key=%s: %s", event.update_id, key, str(e))
+        finally:
+            if queue:
+                # Cancelled while draining, e.g. on shutdown.
+                logger.warning("Discarding %s queued updates for key=%s", len(queue), key)
+                UPDATE_QUEUE_WAITING.dec(len(queue))
+            del self._slots[key]
+            UPDATE_QUEUE_KEYS.dec()
@@ -0,0 +1,24 @@
+import argparse
+import sys
+
+from app.tools import backup, users
+from app.utils.logs import setup_logging
+from config.config import config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.tools", description="Maintenance commands for the bot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup.register(commands)
+    users.register(commands)
+    args = parser.parse_args(argv)
+
+    log_listener = setup_logging({**config.logging, "format": "text"}, stream=sys.stderr)
+    try:
+        return args.handler(args)
+    finally:
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import sys
+
+from app.database.backup import BackupError, create_snapshot, restore_snapshot, verify_snapshot
+from config.config import config
+
+
+def _sqlite_path():
+    if config.db.get("backend", "sqlite") != "sqlite" or config.db["path"] == ":memory:":
+        sys.exit("Snapshots are only available for a file-backed SQLite database; use pg_dump for PostgreSQL.")
+    return config.db["path"]
+
+
+def run_backup(args):
+    info = asyncio.run(
+        create_snapshot(_sqlite_path(), args.dir, pages=config.backup["pages"], keep=config.backup["keep"])
+    )
+    print(json.dumps(info, indent=2))
+
+
+def run_verify(args):
+    try:
+        info = verify_snapshot(args.snapshot)
+    except BackupError as e:
+        sys.exit(f"Snapshot is not usable: {e}")
+    print(json.dumps(info, indent=2))
+
+
+def run_restore(args):
+    target = _sqlite_path()
+    if not args.yes:
+        answer = input(f"Stop the bot first. Replace {target} with {args.snapshot}? [y/N] ")
+        if answer.strip().lower() != "y":
+            return 1
+    try:
+        info = restore_snapshot(args.snapshot, target)
+    except BackupError as e:
+        sys.exit(f"Snapshot is not usable, nothing was changed: {e}")
+    print(json.dumps(info, indent=2))
+    print(f"Previous database kept as {target}.before-restore")
+
+
+def register(commands):
+    parser = commands.add_parser("backup", help="write a compressed, verified snapshot of the SQLite database")
+    parser.add_argument("--dir", default=config.backup["dir"], help="snapshot directory")
+    parser.set_defaults(handler=run_backup)
+
+    parser = commands.add_parser("verify", help="check that a snapshot is intact and readable")
+    parser.add_argument("snapshot")
+    parser.set_defaults(handler=run_verify)
+
+    parser = commands.add_parser("restore", help="verify a snapshot and swap it in for the database")
+    parser.add_argument("snapshot")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    parser.set_defaults(handler=run_restore)
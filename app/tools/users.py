@@ -0,0 +1,192 @@
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app.database.models import close_db, init_db, iter_users, upsert_users
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("user_id", "first_name", "last_name", "phone_number", "username", "is_subscribed", "subscription_expires_at")
+TRUE = {"1", "true", "yes", "y", "t"}
+FALSE = {"0", "false", "no", "n", "f"}
+
+
+def _format_of(path, given):
+    if given:
+        return given
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+@contextmanager
+def _open(path, mode):
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        yield f
+
+
+def _read_csv(f):
+    for record in csv.DictReader(f):
+        yield record
+
+
+def _read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value if value is not None else "").strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError(f"is_subscribed={value!r}")
+
+
+def _parse_expiry(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return datetime.fromtimestamp(int(value), timezone.utc).replace(tzinfo=None)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse(record):
+    user = {"user_id": int(record["user_id"])}
+    for name in ("first_name", "last_name", "phone_number", "username"):
+        user[name] = record.get(name) or None
+    # Without is_subscribed the stored subscription is left as it is, so a
+    # file of names only cannot cancel anyone's subscription.
+    if record.get("is_subscribed") in (None, ""):
+        if record.get("subscription_expires_at") not in (None, ""):
+            raise ValueError("subscription_expires_at given without is_subscribed")
+        return user
+    user["is_subscribed"] = _parse_bool(record["is_subscribed"])
+    user["subscription_expires_at"] = _parse_expiry(record.get("subscription_expires_at"))
+    if user["is_subscribed"] and user["subscription_expires_at"] is None:
+        raise ValueError("is_subscribed without subscription_expires_at")
+    return user
+
+
+def _valid(records, skipped):
+    # Bad rows are reported and skipped so one typo does not abort a
+    # multi-million-row import.
+    for number, record in enumerate(records, 1):
+        try:
+            yield _parse(record)
+        except (KeyError, TypeError, ValueError) as e:
+            skipped.append(number)
+            logger.warning("Skipping record %s: %s", number, e)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+async def _import(path, fmt, chunk_size):
+    skipped = []
+    inserted = updated = 0
+    started = time.monotonic()
+    await init_db(config)
+    try:
+        with _open(path, "r") as f:
+            records = _read_jsonl(f) if fmt == "jsonl" else _read_csv(f)
+            for chunk in _chunks(_valid(records, skipped), chunk_size):
+                added, changed = await upsert_users(chunk)
+                inserted += added
+                updated += changed
+                done = inserted + updated
+                logger.info(
+                    "Imported %s users (%s new, %s updated), %.0f rows/s",
+                    done,
+                    inserted,
+                    updated,
+                    done / max(time.monotonic() - started, 1e-6),
+                )
+    finally:
+        await close_db()
+    return {"inserted": inserted, "updated": updated, "skipped": len(skipped), "seconds": round(time.monotonic() - started, 1)}
+
+
+def _exported(user):
+    expires_at = user["subscription_expires_at"]
+    return {
+        **{name: user[name] for name in FIELDS},
+        "is_subscribed": bool(user["is_subscribed"]),
+        "subscription_expires_at": expires_at.replace(tzinfo=timezone.utc).isoformat() if expires_at else None,
+    }
+
+
+async def _export(path, fmt, batch_size):
+    exported = 0
+    started = time.monotonic()
+    await init_db(config)
+    try:
+        with _open(path, "w") as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                def write(row):
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+            async for user in iter_users(batch_size):
+                write(_exported(user))
+                exported += 1
+                if exported % (batch_size * 100) == 0:
+                    logger.info("Exported %s users", exported)
+    finally:
+        await close_db()
+    return {"exported": exported, "seconds": round(time.monotonic() - started, 1)}
+
+
+def run_import(args):
+    try:
+        info = asyncio.run(_import(args.file, _format_of(args.file, args.format), args.chunk_size))
+    except OSError as e:
+        sys.exit(f"Cannot read {args.file}: {e}")
+    print(json.dumps(info, indent=2), file=sys.stderr)
+    return 1 if info["skipped"] else 0
+
+
+def run_export(args):
+    try:
+        info = asyncio.run(_export(args.file, _format_of(args.file, args.format), args.batch_size))
+    except OSError as e:
+        sys.exit(f"Cannot write {args.file}: {e}")
+    print(json.dumps(info, indent=2), file=sys.stderr)
+
+
+def register(commands):
+    parser = commands.add_parser("users", help="bulk import or export users as CSV or JSON Lines")
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    action = actions.add_parser("import", help="insert users and overwrite their subscription fields")
+    action.add_argument("file", help="input file, - for stdin")
+    action.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    action.add_argument("--chunk-size", type=int, default=5000, help="rows per transaction")
+    action.set_defaults(handler=run_import)
+
+    action = actions.add_parser("export", help="write every user, streamed from a database cursor")
+    action.add_argument("file", help="output file, - for stdout")
+    action.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    action.add_argument("--batch-size", type=int, default=1000, help="rows fetched per round trip")
+    action.set_defaults(handler=run_export)
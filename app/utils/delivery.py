@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # Telegram's RetryAfter applies to the whole bot, so drain the bucket
+        # and push the next refill past the flood wait.
+        self._tokens = 0
+        self._updated = max(self._updated, time.monotonic() + seconds)
+
+
+class ChatThrottle:
+    def __init__(self, interval: float, max_chats: int = 50000):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._next_slot = {}
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0))
+        self._next_slot[chat_id] = slot + self.interval
+        if len(self._next_slot) > self.max_chats:
+            self._next_slot = {k: v for k, v in self._next_slot.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+@dataclass
+class DeliveryReport:
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+
+    def add(self, status):
+        if status == SENT:
+            self.sent += 1
+        elif status == BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+    def merge(self, other: "DeliveryReport"):
+        self.sent += other.sent
+        self.failed += other.failed
+        self.blocked += other.blocked
+
+    def summary(self):
+        return f"отправлено: {self.sent}, ошибок: {self.failed}, заблокировали бота: {self.blocked}"
+
+
+class DeliveryEngine:
+    def __init__(
+        self,
+        rate: float = 30,
+        per_chat_interval: float = 1.0,
+        concurrency: int = 20,
+        max_retries: int = 3,
+    ):
+        self.bucket = TokenBucket(rate)
+        self.throttle = ChatThrottle(per_chat_interval)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(self, call, chat_id=None):
+        # call is a zero-argument callable returning a fresh Bot API coroutine,
+        # so it can be re-issued on retry. chat_id enables the per-chat limit
+        # for methods that post into a chat. Returns the method result and
+        # raises the last error once max_retries flood waits have been
+        # retried. Network and server errors are retried by the bot's
+        # TelegramSession alone, so the attempts of the two do not multiply.
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self.throttle.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                async with self._semaphore:
+                    return await call()
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    logger.error("Giving up on chat_id=%s after %s flood waits", chat_id, attempt + 1)
+                    raise
+                logger.warning("Flood limit hit for chat_id=%s, retrying in %ss", chat_id, e.retry_after)
+                self.bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            attempt += 1
+
+    async def execute(self, call, chat_id=None):
+        try:
+            await self.request(call, chat_id)
+            return SENT
+        except TelegramForbiddenError as e:
+            logger.info("Chat %s blocked the bot: %s", chat_id, str(e))
+            return BLOCKED
+        except Exception as e:
+            logger.error("Failed to deliver to chat_id=%s: %s", chat_id, str(e))
+            return FAILED
+
+    async def send_message(self, bot, chat_id, text, **kwargs):
+        return await self.execute(lambda: bot.send_message(chat_id, text, **kwargs), chat_id=chat_id)
+
+    async def run(self, jobs) -> DeliveryReport:
+        # jobs is an iterable of awaitables that each return a delivery
+        # status. It is consumed lazily by a fixed set of workers, so a
+        # generator over a large result set never creates all tasks at once.
+        report = DeliveryReport()
+        jobs = iter(jobs)
+
+        async def worker():
+            for job in jobs:
+                try:
+                    report.add(await job)
+                except Exception as e:
+                    logger.error("Delivery job failed: %s", str(e))
+                    report.add(FAILED)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return report
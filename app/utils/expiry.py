@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+from aiogram import Bot
+
+from app.database.models import from_epoch, get_subscriptions_expiring_between, get_user, to_epoch, update_subscription
+from app.utils.delivery import SENT, DeliveryEngine
+from app.utils.metrics import SUBSCRIPTIONS
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+
+async def expire_subscription(bot: Bot, delivery: DeliveryEngine, user_id: int):
+    # Re-read the row: the subscription may have been renewed since it was
+    # scheduled or selected for expiry.
+    user = await get_user(user_id)
+    if not user or not user["is_subscribed"]:
+        return SENT
+    if user["subscription_expires_at"] and user["subscription_expires_at"] > datetime.utcnow():
+        logger.info("Subscription for user_id=%s was renewed, skipping expiry", user_id)
+        return SENT
+    logger.info("Processing expired subscription for user_id=%s", user_id)
+    await update_subscription(user_id, False, None)
+    SUBSCRIPTIONS.labels("expired").inc()
+    status = await delivery.execute(lambda: bot.ban_chat_member(chat_id=config.channel_id, user_id=user_id))
+    if status != SENT:
+        logger.error("Failed to remove user %s from channel", user_id)
+        await delivery.send_message(bot, config.admin_id, f"Ошибка при удалении пользователя {user_id} из канала.")
+        return status
+    logger.info("User %s removed from channel", user_id)
+    SUBSCRIPTIONS.labels("banned").inc()
+    return await delivery.send_message(
+        bot, user_id, "Ваша подписка истекла. Пожалуйста, оплатите подписку снова для доступа к каналу."
+    )
+
+
+class ExpiryTimers:
+    def __init__(self, bot: Bot, delivery: DeliveryEngine, window: int = 6 * 3600):
+        self.bot = bot
+        self.delivery = delivery
+        self.window = window
+        # Min-heap of (expires_ts, user_id). Entries are not removed on
+        # renewal; _scheduled holds the current expiry per user and heap
+        # entries that disagree with it are skipped when popped.
+        self._heap = []
+        self._scheduled = {}
+        self._loaded_until = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # The flag ends the loop even when a wakeup races the cancellation
+        # and wait_for swallows it (Python < 3.12).
+        self._stopping = True
+        self._wakeup.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Another instance may take over meanwhile; start() reloads from the
+        # database.
+        self._heap = []
+        self._scheduled = {}
+        self._loaded_until = 0
+
+    def schedule(self, user_id: int, expires_at: datetime):
+        ts = to_epoch(expires_at)
+        if ts > self._loaded_until:
+            # Outside the loaded window; it will be read from the database
+            # when the window advances.
+            self._scheduled.pop(user_id, None)
+            return
+        self._scheduled[user_id] = ts
+        heapq.heappush(self._heap, (ts, user_id))
+        self._wakeup.set()
+
+    def cancel(self, user_id: int):
+        self._scheduled.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    async def _load_window(self):
+        now = int(time.time())
+        until = now + self.window
+        after = from_epoch(self._loaded_until) if self._loaded_until else None
+        rows = await get_subscriptions_expiring_between(after, from_epoch(until))
+        for row in rows:
+            ts = to_epoch(row["subscription_expires_at"])
+            self._scheduled[row["user_id"]] = ts
+            heapq.heappush(self._heap, (ts, row["user_id"]))
+        self._loaded_until = until
+        logger.info("Loaded %s expiries up to %s, %s timers pending", len(rows), from_epoch(until), len(self))
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            ts, user_id = heapq.heappop(self._heap)
+            if self._scheduled.get(user_id) == ts:
+                del self._scheduled[user_id]
+                due.append(user_id)
+        return due
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                now = time.time()
+                # Refill once half of the window has elapsed.
+                if self._loaded_until - now < self.window / 2:
+                    await self._load_window()
+                due = self._pop_due(now)
+                if due:
+                    report = await self.delivery.run(
+                        expire_subscription(self.bot, self.delivery, user_id) for user_id in due
+                    )
+                    logger.info("Expired %s subscriptions on time: %s", len(due), report)
+                    continue
+                next_refill = self._loaded_until - self.window / 2
+                next_due = self._heap[0][0] if self._heap else next_refill
+                timeout = max(0, min(next_due, next_refill) - time.time())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Expiry timer loop failed: %s", str(e))
+                await asyncio.sleep(60)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import weakref
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from app.database.cache import LRUCache
+from app.database.models import (
+    claim_pooled_invite_link,
+    count_pooled_invite_links,
+    get_stale_invite_links,
+    get_user_invite_link,
+    purge_expired_invite_links,
+    revoke_invite_links,
+    save_invite_links,
+    to_epoch,
+)
+from app.utils.delivery import DeliveryEngine
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class InviteLinkManager:
+    def __init__(
+        self,
+        bot: Bot,
+        delivery: DeliveryEngine,
+        pool_size: int = 20,
+        ttl: int = 24 * 3600,
+        min_remaining: int = 3600,
+        refill_interval: int = 300,
+        cache_size: int = 10000,
+        keep_expired: int = 7 * 24 * 3600,
+    ):
+        self.bot = bot
+        self.delivery = delivery
+        self.pool_size = pool_size
+        self.ttl = timedelta(seconds=ttl)
+        # A link is only handed out while it has at least this long to live.
+        self.min_remaining = timedelta(seconds=min_remaining)
+        self.refill_interval = refill_interval
+        self.keep_expired = timedelta(seconds=keep_expired)
+        # user_id -> (invite_link, expires_at) of links handed out recently
+        self._cache = LRUCache(maxsize=cache_size)
+        # A lock lives as long as some get_link call holds or waits for it.
+        self._locks = weakref.WeakValueDictionary()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def get_link(self, user_id: int) -> str:
+        cutoff = datetime.utcnow() + self.min_remaining
+        cached = self._cache.get(user_id)
+        if cached and cached[1] > cutoff:
+            return cached[0]
+        # One lookup per user at a time, so a burst of messages from the same
+        # user does not issue several links.
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        async with lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[1] > cutoff:
+                return cached[0]
+            link = await get_user_invite_link(user_id, cutoff)
+            if link is None:
+                link = await claim_pooled_invite_link(user_id, cutoff)
+                if link is not None:
+                    logger.info("Assigned pooled invite link to user_id=%s", user_id)
+            if link is None:
+                link = await self._create_link()
+                await save_invite_links([(link[0], user_id, link[1])])
+                logger.info("Created invite link for user_id=%s", user_id)
+            self._cache.put(user_id, link)
+            return link[0]
+
+    async def mark_used(self, user_id: int, invite_link: str | None = None):
+        # Links are single-use: the one the user joined with is never handed
+        # out again. The user's own link stays valid if they joined some
+        # other way, so get_link only claims a new one when it was spent.
+        if invite_link is None:
+            return
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == invite_link:
+            self._cache.pop(user_id)
+        await revoke_invite_links([invite_link])
+
+    async def _create_link(self):
+        expires_at = (datetime.utcnow() + self.ttl).replace(microsecond=0)
+        invite = await self.delivery.request(
+            lambda: self.bot.create_chat_invite_link(
+                chat_id=config.channel_id, member_limit=1, expire_date=to_epoch(expires_at)
+            )
+        )
+        return invite.invite_link, expires_at
+
+    async def refill_pool(self):
+        missing = self.pool_size - await count_pooled_invite_links(datetime.utcnow() + self.min_remaining)
+        if missing <= 0:
+            return 0
+        links = []
+        for _ in range(missing):
+            try:
+                links.append(await self._create_link())
+            except Exception as e:
+                logger.error("Failed to pre-generate invite link: %s", str(e))
+                break
+        await save_invite_links([(link, None, expires_at) for link, expires_at in links])
+        logger.info("Added %s invite links to the pool", len(links))
+        return len(links)
+
+    async def revoke_stale(self):
+        now = datetime.utcnow()
+        revoked = set()
+        while True:
+            stale = await get_stale_invite_links(now, now + self.min_remaining)
+            if not stale:
+                break
+            report = await self.delivery.run(
+                self.delivery.execute(
+                    lambda link=link: self.bot.revoke_chat_invite_link(chat_id=config.channel_id, invite_link=link)
+                )
+                for link in stale
+            )
+            # Links that failed to revoke are marked too: Telegram rejects
+            # unknown links, and the rest expire on their own within a day.
+            await revoke_invite_links(stale)
+            revoked.update(stale)
+            logger.info("Revoked stale invite links: %s", report)
+        for user_id, link in self._cache.items():
+            if link[1] <= now or link[0] in revoked:
+                self._cache.pop(user_id)
+        purged = await purge_expired_invite_links(now - self.keep_expired)
+        if revoked or purged:
+            logger.info("Revoked %s stale invite links, purged %s expired ones", len(revoked), purged)
+        return len(revoked)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.revoke_stale()
+                await self.refill_pool()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Invite link maintenance failed: %s", str(e))
+            await asyncio.sleep(self.refill_interval)
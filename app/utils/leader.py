@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from app.database.models import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    # Holds a named lease row in the database and renews it every heartbeat.
+    # Whichever instance holds it is the leader; if the leader dies, the
+    # lease expires after ttl seconds and another instance takes over.
+    def __init__(self, name: str, ttl: int = 60, heartbeat: int = 20, on_acquired=None, on_lost=None):
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                await release_lease(self.name, self.holder)
+            except Exception as e:
+                logger.error("Failed to release %s lease: %s", self.name, str(e))
+
+    async def _callback(self, callback) -> bool:
+        if callback is None:
+            return True
+        try:
+            await callback()
+            return True
+        except Exception as e:
+            logger.error("%s lease callback failed: %s", self.name, str(e))
+            return False
+
+    async def _set_leader(self, leader: bool):
+        logger.info("%s %s lease as %s", "Acquired" if leader else "Lost", self.name, self.holder)
+        if not leader:
+            self.is_leader = False
+            await self._callback(self.on_lost)
+            return
+        # Leadership counts only once the callback has set everything up.
+        # Otherwise undo what it managed and hand the lease back; the next
+        # heartbeat tries again unless another instance takes over first.
+        if await self._callback(self.on_acquired):
+            self.is_leader = True
+            return
+        await self._callback(self.on_lost)
+        try:
+            await release_lease(self.name, self.holder)
+        except Exception as e:
+            logger.error("Failed to release %s lease: %s", self.name, str(e))
+
+    async def _run(self):
+        while True:
+            try:
+                acquired = await acquire_lease(self.name, self.holder, self.ttl)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Without a renewal the lease may lapse, so stop acting as
+                # leader until the database is reachable again.
+                logger.error("Failed to renew %s lease: %s", self.name, str(e))
+                acquired = False
+            if acquired != self.is_leader:
+                await self._set_leader(acquired)
+            await asyncio.sleep(self.heartbeat)
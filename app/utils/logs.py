@@ -0,0 +1,93 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] [%(name)s] %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through extra=
+# and goes into the JSON object as is.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `rate` records per second for each message
+    # template and drops the rest. The first record of the next second
+    # carries the number dropped as `suppressed`.
+    def __init__(self, rate: float = 10):
+        super().__init__()
+        self.rate = rate
+        self._windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rate:
+            return True
+        key = (record.name, record.msg)
+        second = int(record.created)
+        window = self._windows.get(key)
+        if window is None or window[0] != second:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [second, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if window[1] < self.rate:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+sampler = RateLimitFilter()
+
+
+def get_sampled_logger(name: str) -> logging.Logger:
+    # For per-update messages on hot paths; setup_logging sets the rate.
+    logger = logging.getLogger(f"{name}.sampled")
+    logger.addFilter(sampler)
+    return logger
+
+
+def setup_logging(settings: dict, stream=None) -> logging.handlers.QueueListener:
+    # Handlers only put records on a queue; formatting and the blocking
+    # write to stdout happen on the listener's thread.
+    output = logging.StreamHandler(stream or sys.stdout)
+    if settings.get("format", "json") == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+        formatter.converter = time.gmtime
+        output.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(settings.get("level", "INFO"))
+    for name, level in settings.get("levels", {}).items():
+        logging.getLogger(name).setLevel(level)
+    sampler.rate = settings.get("sample_rate", 10)
+
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
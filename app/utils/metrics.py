@@ -0,0 +1,97 @@
+import functools
+import logging
+import time
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Buckets from 0.5ms: most SQLite reads finish well under 10ms, Bot API calls
+# take tens to hundreds of milliseconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DB_LATENCY = Histogram(
+    "bot_db_call_seconds", "Latency of app.database.models functions", ["function"], buckets=LATENCY_BUCKETS
+)
+DB_ERRORS = Counter("bot_db_call_errors_total", "app.database.models calls that raised", ["function"])
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Latency of update handlers", ["router", "handler"], buckets=LATENCY_BUCKETS
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Update handlers that raised", ["router", "handler"])
+API_LATENCY = Histogram("bot_api_request_seconds", "Telegram Bot API call latency", ["method"], buckets=LATENCY_BUCKETS)
+API_ERRORS = Counter("bot_api_request_errors_total", "Failed Telegram Bot API calls", ["method", "error"])
+API_ATTEMPT_LATENCY = Histogram(
+    "bot_api_attempt_seconds", "Latency of each Bot API HTTP request attempt", ["method"], buckets=LATENCY_BUCKETS
+)
+API_RETRIES = Counter("bot_api_retries_total", "Bot API requests retried after a transient error", ["method"])
+API_BREAKER_STATE = Gauge("bot_api_breaker_state", "Bot API circuit breaker: 0 closed, 1 half-open, 2 open")
+API_BREAKER_REJECTED = Counter("bot_api_breaker_rejected_total", "Bot API calls failed fast by the open breaker")
+JOB_DURATION = Histogram(
+    "bot_job_seconds", "Scheduler job duration", ["job"], buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+JOB_ERRORS = Counter("bot_job_errors_total", "Scheduler jobs that raised", ["job"])
+SUBSCRIPTIONS = Counter(
+    "bot_subscriptions_processed_total", "Subscriptions handled by the scheduler and expiry timers", ["kind"]
+)
+
+UPDATE_QUEUE_KEYS = Gauge("bot_update_queue_keys", "Users with updates in flight")
+UPDATE_QUEUE_WAITING = Gauge("bot_update_queue_waiting", "Updates waiting behind another update of the same user")
+UPDATE_QUEUE_DEPTH = Histogram(
+    "bot_update_queue_depth", "Updates already in flight for the user when an update arrives", buckets=(0, 1, 2, 5, 10, 20)
+)
+UPDATE_QUEUE_WAIT = Histogram(
+    "bot_update_queue_wait_seconds", "Time an update waited for the user's previous updates", buckets=LATENCY_BUCKETS
+)
+UPDATE_QUEUE_DROPPED = Counter("bot_update_queue_dropped_total", "Updates dropped because the user's queue was full")
+
+
+def timed(histogram: Histogram, errors: Counter):
+    # Decorator for coroutine functions, labelled with the function name.
+    # Cancellation, e.g. on shutdown or a timeout upstream, is not a failure
+    # of the function, so only exceptions are counted as errors.
+    def decorator(func):
+        latency = histogram.labels(func.__name__)
+        failures = errors.labels(func.__name__)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failures.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+db_timed = timed(DB_LATENCY, DB_ERRORS)
+job_timed = timed(JOB_DURATION, JOB_ERRORS)
+
+
+class MetricsServer:
+    def __init__(self, host: str = "0.0.0.0", port: int = 9090):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Metrics available on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramBadRequest
+
+from app.database.models import (
+    acquire_lease,
+    delete_checkpoint,
+    get_checkpoint,
+    get_users_after,
+    release_lease,
+    save_checkpoint,
+)
+from app.utils.delivery import SENT, DeliveryEngine
+from app.utils.metrics import SUBSCRIPTIONS, job_timed
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "membership_reconcile"
+LEASE = "membership_reconcile"
+IN_CHANNEL = {ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER}
+# Only ordinary members are removed; the channel's creator and
+# administrators are never banned, whatever their subscription.
+BANNABLE = {ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED}
+# Listed in the admin report; the counts cover the rest.
+REPORT_IDS = 20
+
+
+@dataclass
+class MembershipReport:
+    checked: int = 0
+    members: int = 0
+    unknown: int = 0
+    failed: int = 0
+    banned: int = 0
+    restored: int = 0
+    ban_failed: int = 0
+    # The first REPORT_IDS banned users, for the admin report; the
+    # checkpoint stays small however many there are.
+    banned_ids: list = field(default_factory=list)
+    ban_failed_ids: list = field(default_factory=list)
+
+    def summary(self):
+        lines = [
+            f"Проверено пользователей: {self.checked}, в канале: {self.members}",
+            f"Удалены без подписки: {self.banned}",
+            f"Разблокированы с подпиской: {self.restored}",
+        ]
+        if self.banned_ids:
+            more = " …" if self.banned > len(self.banned_ids) else ""
+            lines.append(f"  ID: {', '.join(map(str, self.banned_ids))}{more}")
+        if self.ban_failed:
+            lines.append(f"Не удалось удалить: {self.ban_failed} (ID: {', '.join(map(str, self.ban_failed_ids))})")
+        lines.append(f"Не найдены в Telegram: {self.unknown}, ошибок проверки: {self.failed}")
+        return "\n".join(lines)
+
+
+def is_in_channel(member) -> bool:
+    if member.status == ChatMemberStatus.RESTRICTED:
+        return member.is_member
+    return member.status in IN_CHANNEL
+
+
+async def _lookup(bot: Bot, lookups: DeliveryEngine, user_id: int):
+    try:
+        return await lookups.request(lambda: bot.get_chat_member(chat_id=config.channel_id, user_id=user_id))
+    except TelegramBadRequest:
+        # The account is gone or never talked to the bot.
+        return None
+    except Exception as e:
+        logger.error("Membership lookup failed for user_id=%s: %s", user_id, str(e))
+        return e
+
+
+async def _reconcile_page(bot: Bot, delivery: DeliveryEngine, lookups: DeliveryEngine, users, report, now):
+    members = await asyncio.gather(*(_lookup(bot, lookups, user["user_id"]) for user in users))
+    to_ban, to_restore = [], []
+    for user, member in zip(users, members):
+        report.checked += 1
+        if member is None:
+            report.unknown += 1
+            continue
+        if isinstance(member, Exception):
+            report.failed += 1
+            continue
+        subscribed = bool(user["is_subscribed"]) and (
+            user["subscription_expires_at"] is None or user["subscription_expires_at"] > now
+        )
+        if is_in_channel(member):
+            report.members += 1
+            if not subscribed and member.status in BANNABLE and user["user_id"] not in config.admins:
+                to_ban.append(user["user_id"])
+        elif member.status == ChatMemberStatus.KICKED and subscribed:
+            to_restore.append(user["user_id"])
+
+    async def ban(user_id):
+        status = await delivery.execute(lambda: bot.ban_chat_member(chat_id=config.channel_id, user_id=user_id))
+        if status == SENT:
+            report.banned += 1
+            SUBSCRIPTIONS.labels("banned").inc()
+            if len(report.banned_ids) < REPORT_IDS:
+                report.banned_ids.append(user_id)
+        else:
+            report.ban_failed += 1
+            if len(report.ban_failed_ids) < REPORT_IDS:
+                report.ban_failed_ids.append(user_id)
+        return status
+
+    async def restore(user_id):
+        status = await delivery.execute(
+            lambda: bot.unban_chat_member(chat_id=config.channel_id, user_id=user_id, only_if_banned=True)
+        )
+        if status == SENT:
+            report.restored += 1
+            SUBSCRIPTIONS.labels("restored").inc()
+        return status
+
+    if to_ban or to_restore:
+        await delivery.run([*(ban(user_id) for user_id in to_ban), *(restore(user_id) for user_id in to_restore)])
+
+
+async def claim():
+    # Runs are serialized through a lease row in the database, so only one
+    # run at a time reconciles, whichever instance it was started on. Returns
+    # the run's holder id, or None while another run holds the lease.
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if await acquire_lease(LEASE, holder, config.reconcile["lease_ttl"]):
+        return holder
+    return None
+
+
+@job_timed
+async def reconcile_membership(bot: Bot, delivery: DeliveryEngine, holder=None):
+    # Walks every known user in user_id order, compares channel membership
+    # with the subscription and fixes the difference. Progress is saved after
+    # each page, so an interrupted run resumes where it stopped. Telegram
+    # does not let bots list channel members, so accounts the bot has never
+    # seen cannot be checked.
+    if holder is None:
+        holder = await claim()
+        if holder is None:
+            logger.warning("Membership reconciliation is already running")
+            return None
+    try:
+        settings = config.reconcile
+        lookups = DeliveryEngine(
+            rate=settings["rate"], per_chat_interval=0, concurrency=settings["concurrency"], max_retries=3
+        )
+        checkpoint = await get_checkpoint(CHECKPOINT)
+        if checkpoint:
+            after_id = checkpoint["after_id"]
+            report = MembershipReport(**checkpoint["report"])
+            logger.info("Resuming membership reconciliation after user_id=%s", after_id)
+        else:
+            after_id, report = 0, MembershipReport()
+            logger.info("Starting membership reconciliation")
+        started = time.monotonic()
+
+        while True:
+            users = await get_users_after(after_id, settings["page_size"])
+            if not users:
+                break
+            await _reconcile_page(bot, delivery, lookups, users, report, datetime.utcnow())
+            after_id = users[-1]["user_id"]
+            await save_checkpoint(CHECKPOINT, {"after_id": after_id, "report": asdict(report)})
+            logger.info("Reconciled membership up to user_id=%s: checked %s", after_id, report.checked)
+            if not await acquire_lease(LEASE, holder, settings["lease_ttl"]):
+                # The lease lapsed and another run took over from the checkpoint.
+                logger.error("Lost the membership reconciliation lease after user_id=%s, stopping", after_id)
+                return None
+
+        await delete_checkpoint(CHECKPOINT)
+        logger.info(
+            "Membership reconciliation finished in %.0fs: checked=%s banned=%s restored=%s failed=%s",
+            time.monotonic() - started,
+            report.checked,
+            report.banned,
+            report.restored,
+            report.failed,
+        )
+        await delivery.send_message(bot, config.admin_id, f"🔍 Сверка участников канала завершена.\n{report.summary()}")
+        return report
+    finally:
+        try:
+            await release_lease(LEASE, holder)
+        except Exception as e:
+            logger.error("Failed to release the membership reconciliation lease: %s", str(e))
@@ -0,0 +1,34 @@
+import itertools
+import logging
+
+from app.database.models import count_pending_by_reviewer
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("least_loaded", "round_robin")
+
+
+class ReviewerPool:
+    def __init__(self, reviewers, strategy: str = "least_loaded"):
+        if not reviewers:
+            raise ValueError("At least one reviewer is required")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown review strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+        self.reviewers = tuple(reviewers)
+        self.strategy = strategy
+        self._cycle = itertools.cycle(self.reviewers)
+
+    async def pick(self) -> int:
+        if len(self.reviewers) == 1:
+            return self.reviewers[0]
+        if self.strategy == "round_robin":
+            return next(self._cycle)
+        # Pending requests are counted in the database, so the load is shared
+        # between instances and survives restarts. Ties go to the reviewer
+        # listed first.
+        load = await count_pending_by_reviewer()
+        return min(self.reviewers, key=lambda reviewer: load.get(reviewer, 0))
+
+    async def load(self) -> dict:
+        counts = await count_pending_by_reviewer()
+        return {reviewer: counts.get(reviewer, 0) for reviewer in self.reviewers}
@@ -1,69 +1,199 @@
 import logging
+from datetime import datetime, timedelta, timezone
 
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from app.database.models import get_expired_subscriptions, get_expiring_subscriptions, get_stats, update_subscription
+from app.database.backup import create_snapshot
+from app.database.models import (
+    claim_reminders,
+    get_due_reminders,
+    get_expired_subscriptions,
+    get_job_runs,
+    get_stats,
+    purge_admin_routes,
+    purge_reminders,
+    reconcile_stats,
+    record_job_run,
+    release_reminder,
+    rollup_subscriptions,
+    take_stats_snapshot,
+)
+from app.utils.delivery import FAILED, DeliveryEngine, DeliveryReport
+from app.utils.expiry import ExpiryTimers, expire_subscription
+from app.utils.invite_links import InviteLinkManager
+from app.utils.leader import LeaderLease
+from app.utils.metrics import SUBSCRIPTIONS, job_timed
+from app.utils.reconcile import reconcile_membership
+from app.utils.stats import format_stats
 from config.config import config
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] [Scheduler] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
 logger = logging.getLogger(__name__)
 
 
-def setup_scheduler(bot: Bot):
+async def remind(bot: Bot, delivery: DeliveryEngine, user, stage):
+    logger.info("Sending %s-day expiration reminder to user_id=%s", stage, user["user_id"])
+    status = await delivery.send_message(
+        bot,
+        user["user_id"],
+        f"Ваша подписка истекает {user['subscription_expires_at'].strftime('%d.%m.%Y')}. "
+        "Пожалуйста, продлите подписку, чтобы сохранить доступ.",
+    )
+    if status == FAILED:
+        # Tried again on the next run while the stage is still due.
+        await release_reminder(user["user_id"], stage, user["subscription_expires_at"])
+    return status
+
+
+async def send_reminders(bot: Bot, delivery: DeliveryEngine):
+    # A stage covers expiries between the next shorter stage and itself, so a
+    # subscriber gets each stage once per subscription period and one who
+    # subscribes late starts at the stage they fall into. Ledger entries are
+    # claimed before sending, so two runs never remind the same user twice.
+    now = datetime.utcnow()
+    stages = sorted(set(config.reminder_days), reverse=True)
+    counts = {}
+    report = DeliveryReport()
+    for stage, next_stage in zip(stages, stages[1:] + [0]):
+        due = await get_due_reminders(stage, now + timedelta(days=next_stage), now + timedelta(days=stage))
+        claimed = await claim_reminders(stage, due)
+        users = [user for user in due if user["user_id"] in claimed]
+        counts[stage] = len(users)
+        SUBSCRIPTIONS.labels("expiring").inc(len(users))
+        report.merge(await delivery.run(remind(bot, delivery, user, stage) for user in users))
+    return counts, report
+
+
+@job_timed
+async def check_subscriptions(bot: Bot, delivery: DeliveryEngine):
+    logger.info("Checking subscriptions")
+    await purge_reminders()
+    counts, reminders = await send_reminders(bot, delivery)
+
+    # Safety net for expiries the per-user timers missed
+    expired = await get_expired_subscriptions()
+    expirations = await delivery.run(expire_subscription(bot, delivery, user["user_id"]) for user in expired)
+
+    logger.info("Reminders %s: %s; expirations: %s", counts, reminders, expirations)
+    stages = ", ".join(f"за {stage} дн.: {count}" for stage, count in counts.items())
+    await delivery.send_message(
+        bot,
+        config.admin_id,
+        f"📬 Проверка подписок завершена.\n"
+        f"Напоминания ({stages}): {reminders.summary()}\n"
+        f"Истекшие подписки ({len(expired)}): {expirations.summary()}",
+    )
+    return reminders, expirations
+
+
+async def catch_up(scheduler: AsyncIOScheduler):
+    # Job definitions live in code; only their last runs are stored. A job
+    # whose next fire time after its last run has already passed missed a
+    # run while no instance was leading, and runs once now.
+    runs = await get_job_runs()
+    now = datetime.now(timezone.utc)
+    for job in scheduler.get_jobs():
+        last_run = runs.get(job.id)
+        if last_run is None:
+            await record_job_run(job.id, now)
+            continue
+        due = job.trigger.get_next_fire_time(last_run, last_run + timedelta(seconds=1))
+        if due is None:
+            continue
+        if due <= now:
+            logger.warning("Job %s missed its run at %s (last run %s), running it now", job.id, due, last_run)
+            job.modify(next_run_time=now)
+        else:
+            job.modify(next_run_time=due)
+
+
+def setup_scheduler(
+    bot: Bot, delivery: DeliveryEngine, expiry_timers: ExpiryTimers, invite_links: InviteLinkManager
+) -> LeaderLease:
+    # Every instance builds the scheduler, but it stays paused unless this
+    # instance holds the scheduler lease. The leader also runs the expiry
+    # timers, so bans happen once, and the invite link pool maintenance, so
+    # the pool is refilled and stale links revoked once.
     logger.info("Setting up scheduler")
     scheduler = AsyncIOScheduler()
+    lease = LeaderLease("scheduler", **config.scheduler)
 
-    async def check_subscriptions():
-        logger.info("Checking subscriptions")
-        # Check for subscriptions expiring in 3 days
-        expiring = await get_expiring_subscriptions(bot.pool, days_left=3)
-        for user in expiring:
-            logger.info("Sending expiration reminder to user_id=%s", user["user_id"])
-            await bot.send_message(
-                user["user_id"],
-                f"Ваша подписка истекает {user['subscription_expires_at'].strftime('%d.%m.%Y')}. "
-                "Пожалуйста, продлите подписку, чтобы сохранить доступ.",
-            )
+    def add_job(func, trigger, **kwargs):
+        job_id = func.__name__
+
+        async def run(*args):
+            if not lease.is_leader:
+                logger.warning("Skipping %s, this instance no longer holds the scheduler lease", job_id)
+                return
+            started = datetime.now(timezone.utc)
+            await func(*args)
+            await record_job_run(job_id, started)
 
-        # Check for expired subscriptions
-        expired = await get_expired_subscriptions(bot.pool)
-        for user in expired:
-            logger.info("Processing expired subscription for user_id=%s", user["user_id"])
-            await update_subscription(bot.pool, user["user_id"], False, None)
-            try:
-                await bot.ban_chat_member(chat_id=config.channel_id, user_id=user["user_id"])
-                await bot.send_message(
-                    user["user_id"], "Ваша подписка истекла. Пожалуйста, оплатите подписку снова для доступа к каналу."
-                )
-                logger.info("User %s removed from channel", user["user_id"])
-            except Exception as e:
-                logger.error("Failed to remove user %s from channel: %s", user["user_id"], str(e))
-                await bot.send_message(
-                    config.admin_id, f"Ошибка при удалении пользователя {user['user_id']} из канала: {e!s}"
-                )
+        scheduler.add_job(run, trigger, id=job_id, coalesce=True, misfire_grace_time=None, **kwargs)
 
+    @job_timed
     async def send_weekly_stats():
         logger.info("Sending weekly stats to admin")
         try:
-            stats = await get_stats(bot.pool)
-            response = (
-                f"📊 Еженедельная статистика:\n"
-                f"Всего пользователей: {stats['total_users']}\n"
-                f"Активные подписчики: {stats['active_subscribers']}\n"
-                f"Без подписки: {stats['non_subscribers']}\n"
-                f"Оценочный месячный доход: {stats['estimated_income']}₽"
-            )
+            stats = await get_stats()
+            response = format_stats("📊 Еженедельная статистика", stats)
             logger.info("Sending weekly stats to admin: %s", response)
-            await bot.send_message(config.admin_id, response)
+            await delivery.send_message(bot, config.admin_id, response)
         except Exception as e:
             logger.error("Failed to send weekly stats to admin: %s", str(e))
-            await bot.send_message(config.admin_id, f"Ошибка при отправке статистики: {e!s}")
+            await delivery.send_message(bot, config.admin_id, f"Ошибка при отправке статистики: {e!s}")
+
+    @job_timed
+    async def maintain_stats():
+        logger.info("Correcting statistics drift, taking daily snapshot and purging old admin routes")
+        try:
+            await reconcile_stats()
+            await take_stats_snapshot()
+            await purge_admin_routes(config.review["route_days"])
+        except Exception as e:
+            logger.error("Failed to maintain statistics: %s", str(e))
+
+    @job_timed
+    async def rollup_history():
+        try:
+            await rollup_subscriptions()
+        except Exception as e:
+            logger.error("Failed to roll up subscription history: %s", str(e))
+
+    @job_timed
+    async def backup_database():
+        try:
+            await create_snapshot(
+                config.db["path"], config.backup["dir"], pages=config.backup["pages"], keep=config.backup["keep"]
+            )
+        except Exception as e:
+            logger.error("Database backup failed: %s", str(e))
+            await delivery.send_message(bot, config.admin_id, f"⚠️ Ошибка резервного копирования базы: {e!s}")
+
+    add_job(check_subscriptions, "interval", days=1, args=(bot, delivery))
+    add_job(send_weekly_stats, "cron", day_of_week="sun", hour=10, minute=0)
+    add_job(maintain_stats, "cron", hour=23, minute=55, timezone="UTC")
+    add_job(rollup_history, "cron", hour=0, minute=10, timezone="UTC")
+    add_job(reconcile_membership, "cron", hour=4, minute=0, timezone="UTC", args=(bot, delivery))
+    if config.db.get("backend", "sqlite") == "sqlite" and config.db["path"] != ":memory:":
+        add_job(backup_database, "interval", hours=config.backup["interval_hours"])
+    logger.info("Scheduler jobs added: %s", ", ".join(job.id for job in scheduler.get_jobs()))
+
+    async def on_acquired():
+        await catch_up(scheduler)
+        scheduler.resume()
+        expiry_timers.start()
+        invite_links.start()
+        logger.info("Scheduler resumed on this instance")
+
+    async def on_lost():
+        scheduler.pause()
+        await expiry_timers.stop()
+        await invite_links.stop()
+        logger.info("Scheduler paused on this instance")
 
-    scheduler.add_job(check_subscriptions, "interval", days=1)
-    scheduler.add_job(send_weekly_stats, "cron", day_of_week="sun", hour=10, minute=0)
-    logger.info("Scheduler jobs added: check_subscriptions, send_weekly_stats")
-    scheduler.start()
-    logger.info("Scheduler started")
+    lease.on_acquired = on_acquired
+    lease.on_lost = on_lost
+    scheduler.start(paused=True)
+    logger.info("Scheduler started, waiting for the scheduler lease")
+    return lease
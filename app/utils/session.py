@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import TelegramMethod
+from aiohttp import ClientConnectorError
+
+from app.utils.metrics import API_ATTEMPT_LATENCY, API_BREAKER_REJECTED, API_BREAKER_STATE, API_RETRIES
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Calls that post something or mint a new object. A timeout or a 5xx on them
+# may still have been applied by Telegram, so they are only retried when the
+# connection failed before the request was sent.
+UNSAFE_PREFIXES = ("send", "copy", "forward", "create")
+
+# Polling has its own backoff and must keep running while other calls are
+# rejected, so getUpdates bypasses both retries and the breaker.
+EXEMPT = {"getUpdates"}
+
+
+def is_retryable(name: str, error: Exception) -> bool:
+    # A failed connect never reached Telegram, so it is safe for any call.
+    return isinstance(error.__cause__, ClientConnectorError) or not name.startswith(UNSAFE_PREFIXES)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = 10, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _set(self, state):
+        if state != self.state:
+            logger.warning("Bot API circuit breaker %s -> %s, consecutive failures: %s", self.state, state, self.failures)
+            self.state = state
+            API_BREAKER_STATE.set(STATES[state])
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._set(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        # Half-open lets a single probe through; its outcome decides whether
+        # the breaker closes or stays open for another cooldown.
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        API_BREAKER_REJECTED.inc()
+        return False
+
+    def success(self):
+        self._probing = False
+        self._set(CLOSED)
+        self.failures = 0
+
+    def failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self._opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def release(self):
+        # The probe ended with an answer that says nothing about Telegram's
+        # health (a 4xx, flood wait or cancellation).
+        self._probing = False
+
+
+class TelegramSession(AiohttpSession):
+    # AiohttpSession with a bounded keep-alive pool, per-method timeouts,
+    # jittered retries of transient failures and a circuit breaker that fails
+    # calls fast while the Bot API keeps erroring. The only layer that retries
+    # network and server errors; DeliveryEngine retries flood waits only.
+    def __init__(
+        self,
+        pool_size: int = 100,
+        keepalive: float = 30,
+        timeout: float = 15,
+        timeouts: dict | None = None,
+        retries: int = 2,
+        backoff: float = 0.5,
+        breaker_threshold: int = 10,
+        breaker_cooldown: float = 30,
+        **kwargs,
+    ):
+        super().__init__(limit=pool_size, timeout=timeout, **kwargs)
+        self._connector_init["keepalive_timeout"] = keepalive
+        self.timeouts = timeouts or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+    def stats(self):
+        return {"state": self.breaker.state, "failures": self.breaker.failures, "rejected": self.breaker.rejected}
+
+    async def _attempt(self, bot, method, timeout):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await super().make_request(bot, method, timeout)
+        finally:
+            API_ATTEMPT_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        name = method.__api_method__
+        if timeout is None:
+            timeout = self.timeouts.get(name, self.timeout)
+        if name in EXEMPT:
+            return await self._attempt(bot, method, timeout)
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise TelegramNetworkError(method=method, message="Circuit breaker is open")
+            try:
+                result = await self._attempt(bot, method, timeout)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                self.breaker.failure()
+                if attempt >= self.retries or not is_retryable(name, e):
+                    raise
+                delay = self.backoff * 2**attempt * (0.5 + random.random())
+                logger.warning("Bot API %s failed, retrying in %.2fs: %s", name, delay, str(e))
+                API_RETRIES.labels(name).inc()
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return result
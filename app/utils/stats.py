@@ -0,0 +1,75 @@
+from datetime import date
+
+
+def _delta(current, snapshot, key):
+    if not snapshot:
+        return ""
+    diff = current - snapshot[key]
+    return f" ({diff:+d})"
+
+
+def _day(day: str) -> str:
+    return date.fromisoformat(day).strftime("%d.%m.%Y")
+
+
+def format_stats(title: str, stats: dict) -> str:
+    day_ago = stats.get("day_ago")
+    week_ago = stats.get("week_ago")
+    lines = [
+        f"{title}:",
+        f"Всего пользователей: {stats['total_users']}{_delta(stats['total_users'], day_ago, 'total_users')}",
+        f"Активные подписчики: {stats['active_subscribers']}"
+        f"{_delta(stats['active_subscribers'], day_ago, 'active_subscribers')}",
+        f"Без подписки: {stats['non_subscribers']}",
+        f"Оценочный месячный доход: {stats['estimated_income']}₽",
+    ]
+    if stats.get("rollup"):
+        lines.append(f"MRR на {_day(stats['rollup']['day'])}: {stats['rollup']['mrr']}₽")
+    lines += [
+        f"Выручка всего: {stats['revenue']}₽{_delta(stats['revenue'], day_ago, 'revenue')}",
+    ]
+    if week_ago:
+        lines.append(
+            f"За неделю: пользователи {stats['total_users'] - week_ago['total_users']:+d}, "
+            f"подписчики {stats['active_subscribers'] - week_ago['active_subscribers']:+d}, "
+            f"выручка {stats['revenue'] - week_ago['revenue']:+d}₽"
+        )
+    return "\n".join(lines)
+
+
+def _months(first: str, last: str):
+    year, month = map(int, first.split("-"))
+    while f"{year:04d}-{month:02d}" <= last:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def format_report(days: int, report: dict, recent: int = 7) -> str:
+    rows = report["days"]
+    if not rows:
+        return "Сводки по подпискам ещё не рассчитаны, они обновляются каждую ночь."
+    last = rows[-1]
+    lines = [
+        f"📈 Подписки за {days} дн.:",
+        f"MRR на {_day(last['day'])}: {last['mrr']}₽ ({last['mrr'] - rows[0]['mrr']:+d}₽), "
+        f"подписчиков: {last['active']}",
+        f"Новые: {sum(row['new'] for row in rows)}, продления: {sum(row['renewed'] for row in rows)}, "
+        f"отток: {sum(row['churned'] for row in rows)}, отклонено: {sum(row['rejected'] for row in rows)}",
+        f"Выручка: {sum(row['revenue'] for row in rows)}₽",
+        "",
+        "По дням (новые / продления / отток, выручка):",
+    ]
+    for row in rows[-recent:]:
+        lines.append(f"{_day(row['day'])}: {row['new']} / {row['renewed']} / {row['churned']}, {row['revenue']}₽")
+
+    cohorts = {}
+    for row in report["cohorts"]:
+        cohorts.setdefault(row["cohort"], {})[row["month"]] = row["users"]
+    if cohorts:
+        lines += ["", "Удержание когорт (доля подписанных по месяцам):"]
+        last_month = max(row["month"] for row in report["cohorts"])
+        for cohort, months in cohorts.items():
+            size = months.get(cohort) or max(months.values())
+            shares = " ".join(f"{months.get(month, 0) / size:.0%}" for month in _months(cohort, last_month))
+            lines.append(f"{cohort} ({size}): {shares}")
+    return "\n".join(lines)
@@ -0,0 +1,116 @@
+import asyncio
+import hmac
+import logging
+import re
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# What Telegram accepts as secret_token in setWebhook.
+SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        url: str = "",
+        path: str = "/webhook",
+        secret: str = "",
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        queue_size: int = 1000,
+        workers: int = 8,
+    ):
+        # Without the secret anyone who finds the URL could post forged
+        # updates, admin callbacks included. It is not generated here: every
+        # replica has to check for the same one.
+        if not SECRET_PATTERN.fullmatch(secret):
+            raise ValueError("Webhook mode needs WEBHOOK.secret: 1-256 characters of A-Z, a-z, 0-9, _ and -")
+        self.bot = bot
+        self.dp = dp
+        self.url = url
+        self.path = path
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.processed = 0
+        self.rejected = 0
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._worker_tasks = []
+        self._runner = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/health", self.handle_health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            logger.warning("Rejected webhook request with a bad secret token from %s", request.remote)
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram redelivers updates that were not answered with 2xx.
+            self.rejected += 1
+            logger.warning("Update queue is full, asking Telegram to retry update %s", update.get("update_id"))
+            return web.Response(status=503)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "ok",
+                "queue": self._queue.qsize(),
+                "processed": self.processed,
+                "rejected": self.rejected,
+            }
+        )
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception as e:
+                logger.error("Failed to process update %s: %s", update.get("update_id"), str(e))
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+
+    async def start(self):
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info("Webhook server listening on %s:%s%s", self.host, self.port, self.path)
+        if self.url:
+            await self.bot.set_webhook(
+                self.url,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+            logger.info("Webhook registered at %s", self.url)
+
+    async def stop(self):
+        logger.info("Stopping webhook server, %s updates left in queue", self._queue.qsize())
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self._queue.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
@@ -0,0 +1,35 @@
+import argparse
+import json
+
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    sections = ("seed_s", "get_stats", "updates", "check_subscriptions", "reconcile")
+    old = dict(flatten({key: baseline[key] for key in sections if key in baseline}))
+    new = dict(flatten({key: candidate[key] for key in sections if key in candidate}))
+
+    print(f"{'metric':<48} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name]:+.1%}" if old[name] else "n/a"
+        print(f"{name:<48} {old[name]:>12} {new[name]:>12} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
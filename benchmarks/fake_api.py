@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegramAPI:
+    # Minimal stand-in for api.telegram.org: answers every method with a
+    # plausible result so aiogram can parse it, and counts the calls. Tests
+    # can queue error answers and slow down single methods.
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        # The parameters of the last call of each method.
+        self.params = {}
+        self.failures = {}
+        self.delays = {}
+        self._message_id = 0
+        self._link_id = 0
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Fake Bot API listening on %s", self.url)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def fail(self, method: str, *statuses: int):
+        # The next calls of method are answered with these error codes, in
+        # order; 429 is a flood wait of one second.
+        self.failures.setdefault(method, []).extend(statuses)
+
+    async def _handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await request.post()
+        self.params[method] = dict(params)
+        delay = self.delays.get(method, self.latency)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failures.get(method):
+            status = self.failures[method].pop(0)
+            answer = {"ok": False, "error_code": status, "description": "Injected failure"}
+            if status == 429:
+                answer["parameters"] = {"retry_after": 1}
+            return web.json_response(answer, status=status)
+        return web.json_response({"ok": True, "result": self._result(method.lower(), params)})
+
+    def _message(self, params):
+        self._message_id += 1
+        try:
+            chat_id = int(params.get("chat_id", 0))
+        except ValueError:
+            chat_id = 0
+        return {"message_id": self._message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+
+    def _invite_link(self, params):
+        if "invite_link" in params:
+            link = params["invite_link"]
+        else:
+            self._link_id += 1
+            link = f"https://t.me/+bench{self._link_id}"
+        result = {
+            "invite_link": link,
+            "creator": BOT_USER,
+            "creates_join_request": False,
+            "is_primary": False,
+            "is_revoked": "invite_link" in params,
+        }
+        if "expire_date" in params:
+            result["expire_date"] = int(params["expire_date"])
+        return result
+
+    def _chat_member(self, params):
+        # Deterministic spread: about 40% members, 10% banned, the rest left.
+        user_id = int(params["user_id"])
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        bucket = (user_id * 2654435761) % 10
+        if bucket < 4:
+            return {"status": "member", "user": user}
+        if bucket == 4:
+            return {"status": "kicked", "user": user, "until_date": 0}
+        return {"status": "left", "user": user}
+
+    def _result(self, method, params):
+        if method == "getme":
+            return BOT_USER
+        if method.startswith("send") or method.startswith("edit"):
+            return self._message(params)
+        if method in ("createchatinvitelink", "revokechatinvitelink"):
+            return self._invite_link(params)
+        if method == "getchatmember":
+            return self._chat_member(params)
+        return True
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# config.config requires these; the values only have to look valid because
+# every request goes to the fake API.
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK-TOKEN")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "-1001000000000")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+from app.bot import create_dispatcher  # noqa: E402
+from app.database import models  # noqa: E402
+from app.middlewares.metrics import ApiMetricsMiddleware  # noqa: E402
+from app.utils.delivery import DeliveryEngine  # noqa: E402
+from app.utils.logs import setup_logging  # noqa: E402
+from app.utils.reconcile import reconcile_membership  # noqa: E402
+from app.utils.scheduler import check_subscriptions  # noqa: E402
+from benchmarks.fake_api import FakeTelegramAPI  # noqa: E402
+from benchmarks.updates import DEFAULT_MIX, generate  # noqa: E402
+from config.config import config  # noqa: E402
+
+logger = logging.getLogger("benchmarks")
+
+FIRST_USER_ID = 1000
+SEED_CHUNK = 50000
+DAY = 86400
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "p50": round(pick(0.50), 3),
+        "p90": round(pick(0.90), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(values[-1], 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(users: int, subscribed_ratio: float):
+    repository = models.get_repository()
+    if (await repository.get_counters()).get("total_users", 0) >= users:
+        logger.warning("Database already holds %s users, skipping seeding", users)
+        return 0
+    started = time.perf_counter()
+    for first in range(FIRST_USER_ID, FIRST_USER_ID + users, SEED_CHUNK):
+        last = min(first + SEED_CHUNK, FIRST_USER_ID + users)
+        await repository.insert_users([(i, f"User{i}", None, None, f"user{i}") for i in range(first, last)])
+    # Subscribers get expiry dates spread from 5 days ago to 35 days ahead,
+    # so check_subscriptions finds both reminders and expired rows.
+    now = int(time.time())
+    async with repository.db.writer() as conn:
+        await conn.execute(
+            """
+            UPDATE users
+            SET is_subscribed = 1, subscription_expires_at = ? + (user_id * 7919) % (40 * ?)
+            WHERE (user_id * 2654435761) % 1000 < ?
+        """,
+            (now - 5 * DAY, DAY, int(subscribed_ratio * 1000)),
+        )
+    await repository.reconcile_counters()
+    return time.perf_counter() - started
+
+
+async def bench_updates(bot, dp, count, concurrency, user_ids, mix):
+    stream = generate(count, user_ids, mix)
+    latencies = {kind: [] for kind in mix}
+
+    async def worker():
+        for kind, update in stream:
+            started = time.perf_counter()
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                logger.error("Update %s (%s) failed: %s", update["update_id"], kind, str(e))
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "count": count,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "updates_per_s": round(count / wall, 1),
+        "latency_ms": percentiles(every),
+        "by_kind": {kind: {"count": len(values), "latency_ms": percentiles(values)} for kind, values in latencies.items()},
+        "antiflood": dp["antiflood"].stats(),
+    }
+
+
+async def bench_stats(runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await models.get_stats()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"runs": runs, "latency_ms": percentiles(timings)}
+
+
+async def bench_check_subscriptions(bot, delivery):
+    started = time.perf_counter()
+    reminders, expirations = await check_subscriptions(bot, delivery)
+    return {
+        "wall_s": round(time.perf_counter() - started, 3),
+        "reminders": vars(reminders),
+        "expirations": vars(expirations),
+    }
+
+
+async def bench_reconcile(bot, delivery):
+    started = time.perf_counter()
+    report = await reconcile_membership(bot, delivery)
+    return {
+        "wall_s": round(time.perf_counter() - started, 3),
+        "checked": report.checked,
+        "members": report.members,
+        "banned": report.banned,
+        "restored": report.restored,
+        "failed": report.failed,
+    }
+
+
+async def run(args):
+    api = FakeTelegramAPI(port=args.api_port, latency=args.api_latency / 1000)
+    await api.start()
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    config.db = {"backend": "sqlite", "path": db_path, "readers": config.db.get("readers", 4)}
+
+    bot = Bot(token=config.bot_token, session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    bot.session.middleware(ApiMetricsMiddleware())
+    delivery = DeliveryEngine(**{**config.delivery, "rate": args.rate})
+    dp = create_dispatcher(bot, delivery)
+    expiry_timers, invite_links = dp["expiry_timers"], dp["invite_links"]
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "db": db_path,
+            "users": args.users,
+            "args": vars(args),
+        }
+    }
+    try:
+        await models.init_db(config)
+        seed_time = await seed(args.users, args.subscribed)
+        results["seed_s"] = round(seed_time, 3)
+
+        logger.warning("Benchmarking get_stats (%s runs)", args.stats_runs)
+        results["get_stats"] = await bench_stats(args.stats_runs)
+
+        # Before the expiry timers start, so the already expired seed rows
+        # are left for check_subscriptions to handle.
+        logger.warning("Running check_subscriptions")
+        results["check_subscriptions"] = await bench_check_subscriptions(bot, delivery)
+
+        expiry_timers.start()
+        invite_links.start()
+        logger.warning("Feeding %s updates with concurrency %s", args.updates, args.concurrency)
+        user_ids = range(FIRST_USER_ID, FIRST_USER_ID + args.users)
+        results["updates"] = await bench_updates(bot, dp, args.updates, args.concurrency, user_ids, DEFAULT_MIX)
+
+        if args.reconcile:
+            logger.warning("Running membership reconciliation at %s lookups/s", args.reconcile_rate)
+            config.reconcile = {**config.reconcile, "rate": args.reconcile_rate}
+            results["reconcile"] = await bench_reconcile(bot, delivery)
+        results["api_calls"] = dict(api.calls)
+    finally:
+        await expiry_timers.stop()
+        await invite_links.stop()
+        await models.close_db()
+        await bot.session.close()
+        await api.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bot against a local fake Bot API.")
+    parser.add_argument("--users", type=int, default=10000, help="users to seed (10k-1M)")
+    parser.add_argument("--subscribed", type=float, default=0.3, help="share of seeded users with a subscription")
+    parser.add_argument("--updates", type=int, default=5000, help="synthetic updates to feed")
+    parser.add_argument("--concurrency", type=int, default=8, help="updates processed in parallel")
+    parser.add_argument("--stats-runs", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=1000, help="delivery engine rate limit, messages/s")
+    parser.add_argument("--reconcile", action="store_true", help="also time the membership reconciliation job")
+    parser.add_argument("--reconcile-rate", type=float, default=config.reconcile["rate"], help="get_chat_member calls/s")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency, ms")
+    parser.add_argument("--db", help="SQLite path to reuse; a fresh temporary database by default")
+    parser.add_argument("--output", help="JSON file for the results; benchmarks/results/<time>.json by default")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    log_listener = setup_logging({**config.logging, "level": args.log_level, "format": "text"})
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        log_listener.stop()
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).parent / "results" / f"{datetime.now():%Y%m%d-%H%M%S}-{results['meta']['revision'] or 'local'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    json.dump(
+        {key: results[key] for key in ("get_stats", "updates", "check_subscriptions", "reconcile") if key in results},
+        sys.stdout,
+        indent=2,
+    )
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import random
+import time
+
+# Share of each update kind in the synthetic stream.
+DEFAULT_MIX = {"start": 0.2, "text": 0.4, "photo": 0.2, "join": 0.2}
+
+CHANNEL_CHAT = {"id": -1001000000000, "type": "channel", "title": "Bench channel"}
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _message(update_id, user_id, **fields):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            **fields,
+        },
+    }
+
+
+def start_update(update_id, user_id):
+    return _message(update_id, user_id, text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+
+
+def text_update(update_id, user_id):
+    return _message(update_id, user_id, text="Здравствуйте! Как получить доступ?")
+
+
+def photo_update(update_id, user_id):
+    sizes = [
+        {"file_id": f"photo-{update_id}-{size}", "file_unique_id": f"uniq-{update_id}-{size}", "width": size, "height": size}
+        for size in (90, 320, 1280)
+    ]
+    return _message(update_id, user_id, photo=sizes)
+
+
+def join_update(update_id, user_id):
+    user = _user(user_id)
+    return {
+        "update_id": update_id,
+        "chat_member": {
+            "chat": CHANNEL_CHAT,
+            "from": user,
+            "date": int(time.time()),
+            "old_chat_member": {"status": "left", "user": user},
+            "new_chat_member": {"status": "member", "user": user},
+        },
+    }
+
+
+BUILDERS = {"start": start_update, "text": text_update, "photo": photo_update, "join": join_update}
+
+
+def generate(count, user_ids, mix=None, seed=0):
+    # Yields (kind, raw update dict) pairs; user_ids is a range or sequence
+    # the senders are drawn from.
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    for update_id in range(1, count + 1):
+        kind = rng.choices(kinds, weights)[0]
+        yield kind, BUILDERS[kind](update_id, rng.choice(user_ids))
@@ -3,12 +3,107 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     bot_token: str
-    admin_id: int
+    admin_id: int  # gets reports and alerts, and reviews payments unless admin_ids says otherwise
+    admin_ids: list[int] = []  # further admins sharing payment review
     channel_id: str
     payment_link: str = "https://example.com/payment"
+    subscription_price: int = 500  # ₽ per 30-day subscription
     db: dict = {
-        "path": "./bot.db"  # SQLite uses file path instead of host/port
+        "backend": "sqlite",  # "sqlite" or "postgres"
+        "path": "./bot.db",  # SQLite uses file path instead of host/port
+        "readers": 4,  # read-only connections kept open next to the single writer
+        # PostgreSQL settings, used when backend is "postgres":
+        # "host", "port", "user", "password", "database", "min_size", "max_size"
     }
+    subscription_cache: dict = {
+        "size": 10000,  # LRU bound on cached subscription records
+        "ttl": 300,  # seconds before a cached record is re-read from the database
+    }
+    registration_queue: dict = {
+        "flush_interval": 0.05,  # seconds a batch keeps filling under load; a lone registration is committed at once
+        "batch_size": 500,  # commit as soon as this many registrations are waiting
+        "max_pending": 10000,  # handlers block on add_user once this many are queued
+    }
+    delivery: dict = {
+        "rate": 30,  # messages per second across all chats (Telegram's global limit)
+        "per_chat_interval": 1.0,  # seconds between messages to the same chat
+        "concurrency": 20,  # Bot API calls in flight at once
+        "max_retries": 3,  # flood waits sat out and retried; network and server errors are api_session's retries
+    }
+    api_session: dict = {
+        "pool_size": 100,  # keep-alive connections to the Bot API
+        "keepalive": 30,  # seconds an idle connection stays open
+        "timeout": 15,  # seconds per request unless timeouts says otherwise
+        "timeouts": {"sendPhoto": 30, "sendDocument": 60},  # per Bot API method, seconds
+        "retries": 2,  # retries for network and server errors; send*/create* only when the connect failed
+        "backoff": 0.5,  # first retry delay, doubled each attempt and jittered
+        "breaker_threshold": 10,  # consecutive failures that open the circuit breaker
+        "breaker_cooldown": 30,  # seconds calls fail fast before a probe is let through
+    }
+    expiry_window: int = 6 * 3600  # seconds of upcoming expiries held in memory by the expiry timers
+    reminder_days: list[int] = [7, 3, 1]  # days before expiry at which a renewal reminder is sent, once each
+    invite_links: dict = {
+        "pool_size": 20,  # unassigned single-use links kept ready
+        "ttl": 24 * 3600,  # lifetime of each generated link, seconds
+        "min_remaining": 3600,  # links closer than this to expiry are not handed out
+        "refill_interval": 300,  # seconds between pool refills and stale link revocation, on the scheduler leader
+        "cache_size": 10000,  # users whose current link is kept in memory
+    }
+    antiflood: dict = {
+        "limit": 5,  # messages allowed per user within the window
+        "window": 10,  # sliding window length, seconds
+        "photo_cooldown": 30,  # the same screenshot re-sent within this many seconds is coalesced
+        "max_users": 100000,  # users tracked at once; the least recently seen one is forgotten first
+    }
+    review: dict = {
+        "strategy": "least_loaded",  # "least_loaded" (fewest pending screenshots) or "round_robin"
+        "route_cache": 10000,  # reviewer messages whose target user is kept in memory
+        "route_days": 90,  # how long a reviewer can still reply to a screenshot notification
+    }
+    update_queue: dict = {
+        "max_pending": 20,  # updates per user held in order before further ones are dropped
+    }
+    scheduler: dict = {
+        "ttl": 60,  # seconds a scheduler lease stays valid without renewal
+        "heartbeat": 20,  # seconds between lease renewals
+    }
+    reconcile: dict = {
+        "rate": 150,  # get_chat_member calls per second; 100k users take about 11 minutes
+        "concurrency": 50,  # lookups in flight at once
+        "page_size": 1000,  # users checked between checkpoints
+        "lease_ttl": 600,  # seconds a run may spend on one page before another instance may take over
+    }
+    backup: dict = {
+        "dir": "./backups",  # compressed SQLite snapshots, see python -m app.tools backup
+        "interval_hours": 6,
+        "keep": 28,  # newest snapshots kept, 0 keeps all
+        "pages": 1024,  # pages copied per backup step
+    }
+    mode: str = "polling"  # "polling" or "webhook"
+    webhook: dict = {
+        "url": "",  # public HTTPS URL registered with Telegram, e.g. https://bot.example.com/webhook
+        "path": "/webhook",
+        "secret": "",  # required in webhook mode; checked against the X-Telegram-Bot-Api-Secret-Token header
+        "host": "0.0.0.0",
+        "port": 8080,
+        "queue_size": 1000,  # updates buffered before Telegram is asked to retry
+        "workers": 8,  # updates processed concurrently
+    }
+    metrics: dict = {
+        "enabled": True,  # serve Prometheus metrics at http://host:port/metrics
+        "host": "0.0.0.0",
+        "port": 9090,
+    }
+    logging: dict = {
+        "level": "INFO",
+        "format": "json",  # "json" (one object per line) or "text"
+        "levels": {"aiogram.event": "WARNING"},  # per-logger overrides, e.g. {"db": "DEBUG"}
+        "sample_rate": 10,  # per-update messages logged per second for each message, 0 = no limit
+    }
+
+    @property
+    def admins(self) -> tuple[int, ...]:
+        return tuple(dict.fromkeys([self.admin_id, *self.admin_ids]))
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
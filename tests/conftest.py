@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# config.config requires these; nothing in the tests talks to Telegram.
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "-1001000000000")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiohttp.test_utils import unused_port  # noqa: E402
+
+from app.database.repository import create_repository  # noqa: E402
+from benchmarks.fake_api import FakeTelegramAPI  # noqa: E402
+
+# PostgreSQL settings in the same JSON form as DB, e.g.
+# {"host": "localhost", "port": 5432, "user": "postgres", "password": "postgres", "database": "test"}.
+# Without it the PostgreSQL variants are skipped.
+POSTGRES = json.loads(os.environ.get("TEST_POSTGRES") or "null")
+
+
+@pytest.fixture
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def pytest_pyfunc_call(pyfuncitem):
+    # Coroutine tests run on the test's event_loop, the same loop their
+    # fixtures were set up on.
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    loop = pyfuncitem._request.getfixturevalue("event_loop")
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    loop.run_until_complete(pyfuncitem.obj(**kwargs))
+    return True
+
+
+async def _reset_postgres(settings):
+    import asyncpg
+
+    conn = await asyncpg.connect(
+        **{key: settings[key] for key in ("host", "port", "user", "password", "database") if key in settings}
+    )
+    try:
+        await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    finally:
+        await conn.close()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path, event_loop):
+    # Database settings for an empty database of each backend.
+    if request.param == "sqlite":
+        return {"backend": "sqlite", "path": str(tmp_path / "bot.db")}
+    if POSTGRES is None:
+        pytest.skip("TEST_POSTGRES is not set")
+    settings = {**POSTGRES, "backend": "postgres", "min_size": 1, "max_size": 4}
+    event_loop.run_until_complete(_reset_postgres(settings))
+    return settings
+
+
+@pytest.fixture
+def repo(backend, event_loop):
+    repository = create_repository(backend)
+    event_loop.run_until_complete(repository.open())
+    yield repository
+    event_loop.run_until_complete(repository.close())
+
+
+@pytest.fixture
+def models_db(backend, event_loop):
+    # app.database.models initialized on an empty database of each backend.
+    from app.database import models
+
+    settings = SimpleNamespace(
+        db=backend, registration_queue={"flush_interval": 0.01, "batch_size": 100, "max_pending": 1000}
+    )
+    event_loop.run_until_complete(models.init_db(settings))
+    yield models
+    event_loop.run_until_complete(models.close_db())
+    models.subscription_cache.clear()
+    models.route_cache.clear()
+
+
+@pytest.fixture
+def api(event_loop):
+    # A local stand-in for the Bot API that counts calls and can fail them.
+    fake = FakeTelegramAPI(port=unused_port())
+    event_loop.run_until_complete(fake.start())
+    yield fake
+    event_loop.run_until_complete(fake.stop())
+
+
+@pytest.fixture
+def bot(api, event_loop):
+    bot = Bot("123456:TEST-TOKEN", session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    yield bot
+    event_loop.run_until_complete(bot.session.close())
@@ -0,0 +1,80 @@
+import pytest
+from aiogram.types import Chat, Message, PhotoSize, User
+
+from app.middlewares.antiflood import AntiFloodMiddleware
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.middlewares.antiflood.time.monotonic", lambda: now[0])
+    return now
+
+
+def message(bot, user_id=111, text="hello", photo_id=None):
+    photo = [PhotoSize(file_id=f"file-{photo_id}", file_unique_id=photo_id, width=10, height=10)] if photo_id else None
+    return Message(
+        message_id=1,
+        date=0,
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Test"),
+        text=None if photo else text,
+        photo=photo,
+    ).as_(bot)
+
+
+async def passes(middleware, event):
+    async def handler(event, data):
+        return "handled"
+
+    return await middleware(handler, event, {}) == "handled"
+
+
+async def test_flood_is_dropped_with_a_single_warning(bot, api, clock):
+    middleware = AntiFloodMiddleware(limit=3, window=10)
+    results = [await passes(middleware, message(bot)) for _ in range(6)]
+    assert results == [True, True, True, False, False, False]
+    assert api.calls["sendMessage"] == 1
+    # Other users are not affected.
+    assert await passes(middleware, message(bot, user_id=222))
+    assert middleware.stats()["dropped"] == 3
+
+
+async def test_window_slides(bot, clock):
+    middleware = AntiFloodMiddleware(limit=2, window=10)
+    for _ in range(2):
+        assert await passes(middleware, message(bot))
+    clock[0] += 15
+    # Half of the previous window still counts: 2 * 0.5 + 1 <= 2.
+    assert await passes(middleware, message(bot))
+    assert not await passes(middleware, message(bot))
+    clock[0] += 20
+    assert await passes(middleware, message(bot))
+
+
+async def test_only_the_same_screenshot_is_coalesced(bot, clock):
+    middleware = AntiFloodMiddleware(limit=10, photo_cooldown=30)
+    assert await passes(middleware, message(bot, photo_id="a"))
+    assert not await passes(middleware, message(bot, photo_id="a"))
+    assert await passes(middleware, message(bot, photo_id="b"))
+    clock[0] += 31
+    assert await passes(middleware, message(bot, photo_id="b"))
+    assert middleware.stats()["coalesced_photos"] == 1
+
+
+async def test_exempt_users_are_never_limited(bot, clock):
+    middleware = AntiFloodMiddleware(limit=1, exempt=(111,))
+    assert all([await passes(middleware, message(bot)) for _ in range(5)])
+    assert middleware.stats()["tracked_users"] == 0
+
+
+async def test_tracked_users_are_strictly_bounded(bot, clock):
+    middleware = AntiFloodMiddleware(limit=1, window=60, max_users=3)
+    for user_id in (1, 2, 3):
+        assert await passes(middleware, message(bot, user_id=user_id))
+    # User 1 is active again, so user 2 is now the least recently seen.
+    assert not await passes(middleware, message(bot, user_id=1))
+    for user_id in (4, 5):
+        assert await passes(middleware, message(bot, user_id=user_id))
+    assert middleware.stats()["tracked_users"] == 3
+    assert list(middleware._users) == [1, 4, 5]
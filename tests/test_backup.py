@@ -0,0 +1,98 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from app.database.backup import BackupError, _prune, create_snapshot, restore_snapshot, verify_snapshot
+from app.database.migrations import MIGRATIONS
+from app.database.repository import create_repository
+
+
+def users(*ids):
+    return [(user_id, f"User{user_id}", None, None, None) for user_id in ids]
+
+
+@pytest.fixture
+def database(tmp_path, event_loop):
+    path = str(tmp_path / "bot.db")
+    repository = create_repository({"backend": "sqlite", "path": path})
+    event_loop.run_until_complete(repository.open())
+    event_loop.run_until_complete(repository.insert_users(users(*range(1, 501))))
+    yield path, repository
+    event_loop.run_until_complete(repository.close())
+
+
+async def test_snapshot_of_a_live_database(database, tmp_path):
+    path, repository = database
+
+    async def keep_writing():
+        for user_id in range(1000, 1100):
+            await repository.insert_users(users(user_id))
+
+    info, _ = await asyncio.gather(create_snapshot(path, str(tmp_path / "backups"), pages=1, pause=0), keep_writing())
+    assert 500 <= info["users"] <= 600
+    assert info["schema_version"] == MIGRATIONS[-1][0]
+    with gzip.open(info["path"], "rb") as packed:
+        assert hashlib.sha256(packed.read()).hexdigest() == info["sha256"]
+    assert verify_snapshot(info["path"])["users"] == info["users"]
+
+
+def test_broken_snapshots_are_rejected(tmp_path):
+    garbage = tmp_path / "garbage.db"
+    garbage.write_bytes(b"not a database" * 100)
+    with pytest.raises(BackupError, match="not a readable SQLite database"):
+        verify_snapshot(str(garbage))
+
+    truncated = tmp_path / "truncated.db.gz"
+    truncated.write_bytes(gzip.compress(os.urandom(10000))[:1000])
+    with pytest.raises(BackupError, match="cannot unpack"):
+        verify_snapshot(str(truncated))
+
+    newer = tmp_path / "newer.db"
+    conn = sqlite3.connect(newer)
+    conn.execute(f"PRAGMA user_version = {MIGRATIONS[-1][0] + 1}")
+    conn.close()
+    with pytest.raises(BackupError, match="newer than this code"):
+        verify_snapshot(str(newer))
+
+
+async def test_restore_swaps_in_the_snapshot(database, tmp_path):
+    path, repository = database
+    info = await create_snapshot(path, str(tmp_path / "backups"))
+    await repository.insert_users(users(9999))
+    await repository.close()
+
+    assert restore_snapshot(info["path"], path)["users"] == 500
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 500
+    conn.close()
+    conn = sqlite3.connect(f"{path}.before-restore")
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 501
+    conn.close()
+
+
+async def test_broken_snapshot_leaves_the_database_alone(database, tmp_path):
+    path, repository = database
+    await repository.close()
+    broken = tmp_path / "broken.db.gz"
+    broken.write_bytes(gzip.compress(b"not a database" * 100))
+    with pytest.raises(BackupError):
+        restore_snapshot(str(broken), path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 500
+    conn.close()
+
+
+def test_only_the_newest_snapshots_are_kept(tmp_path):
+    for stamp in ("20260101-000000", "20260102-000000", "20260103-000000"):
+        (tmp_path / f"bot-{stamp}.db.gz").touch()
+    (tmp_path / "other-20260101-000000.db.gz").touch()
+    _prune(str(tmp_path), "bot", keep=2)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "bot-20260102-000000.db.gz",
+        "bot-20260103-000000.db.gz",
+        "other-20260101-000000.db.gz",
+    ]
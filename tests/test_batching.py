@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.database.batching import WriteBehindQueue
+
+
+class Writer:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    async def __call__(self, rows):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("disk full")
+        self.batches.append(rows)
+
+
+async def test_lone_row_is_written_without_waiting_for_the_interval():
+    writer = Writer()
+    queue = WriteBehindQueue(writer, flush_interval=10)
+    queue.start()
+    future = await queue.submit(1, "row1")
+    assert queue.pending == {1: "row1"}
+    await asyncio.wait_for(future, 1)
+    assert writer.batches == [["row1"]]
+    assert queue.pending == {}
+    await queue.stop()
+
+
+async def test_rows_arriving_together_share_a_batch():
+    writer = Writer(delay=0.05)
+    queue = WriteBehindQueue(writer, flush_interval=0.05, batch_size=10)
+    queue.start()
+    futures = [await queue.submit(key, key) for key in range(25)]
+    await asyncio.gather(*futures)
+    assert sorted(row for batch in writer.batches for row in batch) == list(range(25))
+    assert all(len(batch) <= 10 for batch in writer.batches)
+    assert len(writer.batches) < 25
+    await queue.stop()
+
+
+async def test_stop_writes_everything_queued():
+    writer = Writer(delay=0.02)
+    queue = WriteBehindQueue(writer, flush_interval=0.01, batch_size=3)
+    queue.start()
+    futures = [await queue.submit(key, key) for key in range(10)]
+    await queue.stop()
+    assert all(future.done() and future.exception() is None for future in futures)
+    assert sorted(row for batch in writer.batches for row in batch) == list(range(10))
+    with pytest.raises(RuntimeError):
+        await queue.submit(11, 11)
+
+
+async def test_failed_write_fails_its_rows():
+    queue = WriteBehindQueue(Writer(fail=True))
+    queue.start()
+    future = await queue.submit(1, "row1")
+    with pytest.raises(RuntimeError, match="disk full"):
+        await future
+    assert queue.pending == {}
+    await queue.stop()
+
+
+async def test_cancelled_submit_leaves_no_pending_row():
+    # The writer is held up, so the one-slot queue stays full.
+    release = asyncio.Event()
+
+    async def blocked(rows):
+        await release.wait()
+
+    queue = WriteBehindQueue(blocked, batch_size=1, max_pending=1)
+    queue.start()
+    await queue.submit(1, "row1")
+    await asyncio.sleep(0)
+    await queue.submit(2, "row2")
+    waiting = asyncio.create_task(queue.submit(3, "row3"))
+    await asyncio.sleep(0.01)
+    assert 3 in queue.pending
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert 3 not in queue.pending
+    release.set()
+    await queue.stop()
+    assert queue.pending == {}
+
+
+async def test_registration_is_visible_before_and_after_the_commit(models_db):
+    registration = asyncio.create_task(models_db.add_user(7, "Seven", None, None, "seven"))
+    await asyncio.sleep(0)
+    assert (await models_db.get_user(7))["first_name"] == "Seven"
+    await asyncio.wait_for(registration, 1)
+    assert (await models_db.get_repository().get_user(7))["username"] == "seven"
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.cache import LRUCache, SubscriptionCache, SubscriptionRecord
+
+
+def record(user_id, is_subscribed=True):
+    return SubscriptionRecord(user_id, is_subscribed, None)
+
+
+def test_get_put_and_ttl(monkeypatch):
+    cache = SubscriptionCache(ttl=10)
+    clock = [100.0]
+    monkeypatch.setattr("app.database.cache.time.monotonic", lambda: clock[0])
+    cache.put(record(1))
+    assert cache.get(1).is_subscribed
+    clock[0] += 11
+    assert cache.get(1) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_bound():
+    cache = SubscriptionCache(maxsize=2)
+    for user_id in (1, 2):
+        cache.put(record(user_id))
+    cache.get(1)
+    cache.put(record(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_fill_after_a_write_to_the_same_user_is_dropped():
+    cache = SubscriptionCache()
+    version = cache.version
+    # The row was read, then the user was approved before the fill.
+    cache.put(record(1, True))
+    cache.fill(record(1, False), version)
+    assert cache.get(1).is_subscribed
+    cache.invalidate(1)
+    cache.fill(record(1, False), version)
+    assert cache.get(1) is None
+
+
+def test_writes_to_other_users_do_not_block_fills():
+    cache = SubscriptionCache()
+    version = cache.version
+    for user_id in range(2, 50):
+        cache.invalidate(user_id)
+    cache.fill(record(1), version)
+    assert cache.get(1) is not None
+
+
+def test_fill_is_dropped_once_the_write_was_pruned():
+    cache = SubscriptionCache(maxsize=2)
+    version = cache.version
+    cache.invalidate(1)
+    # User 1's tick falls out of the bounded write log.
+    cache.invalidate(2)
+    cache.invalidate(3)
+    cache.fill(record(1), version)
+    assert cache.get(1) is None
+    cache.fill(record(1), cache.version)
+    assert cache.get(1) is not None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SubscriptionCache(enabled=False)
+    cache.put(record(1))
+    cache.fill(record(2), cache.version)
+    assert cache.get(1) is None
+    assert cache.get(2) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+async def test_subscription_reads_follow_writes(models_db):
+    await models_db.add_user(42, "User", None, None, "user")
+    assert not (await models_db.get_subscription(42)).is_subscribed
+    expires_at = datetime.utcnow() + timedelta(days=30)
+    await models_db.update_subscription(42, True, expires_at, 500)
+    assert (await models_db.get_subscription(42)).is_subscribed
+
+
+async def test_postgres_reads_see_writes_from_other_replicas(backend, models_db):
+    if backend["backend"] != "postgres":
+        pytest.skip("only PostgreSQL is shared between bot processes")
+    await models_db.add_user(42, "User", None, None, "user")
+    assert not (await models_db.get_subscription(42)).is_subscribed
+    # Another replica approves the user.
+    expires_at = models_db.to_epoch(datetime.utcnow() + timedelta(days=30))
+    await models_db.get_repository().update_subscription(42, True, expires_at, 500, 0)
+    assert (await models_db.get_subscription(42)).is_subscribed
+    assert not models_db.subscription_cache.stats()["enabled"]
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import BanChatMember, SendMessage
+
+from app.utils.delivery import BLOCKED, FAILED, SENT, ChatThrottle, DeliveryEngine, TokenBucket
+from app.utils.session import TelegramSession
+
+SEND = SendMessage(chat_id=1, text="hello")
+BAN = BanChatMember(chat_id=-100, user_id=1)
+
+
+def engine(**kwargs):
+    return DeliveryEngine(**{"rate": 1000, "per_chat_interval": 0, "max_retries": 2, **kwargs})
+
+
+def failing(*errors, result="ok"):
+    # A call that raises the given errors in turn, then returns result.
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return result
+
+    return call, attempts
+
+
+async def test_transient_errors_are_left_to_the_session():
+    for error in (TelegramServerError(BAN, "Bad Gateway"), TelegramNetworkError(SEND, "timeout")):
+        call, attempts = failing(error)
+        with pytest.raises(type(error)):
+            await engine().request(call, chat_id=1)
+        assert len(attempts) == 1
+
+
+async def test_flood_waits_are_retried_and_bounded():
+    call, attempts = failing(TelegramRetryAfter(SEND, "Flood", 0))
+    assert await engine().request(call, chat_id=1) == "ok"
+    call, attempts = failing(*[TelegramRetryAfter(SEND, "Flood", 0)] * 5)
+    with pytest.raises(TelegramRetryAfter):
+        await engine().request(call, chat_id=1)
+    assert len(attempts) == 3
+
+
+async def test_flood_wait_pauses_every_chat():
+    delivery = engine(rate=100)
+    call, attempts = failing(TelegramRetryAfter(SEND, "Flood", 1))
+    flooded = asyncio.create_task(delivery.request(call, chat_id=1))
+    await asyncio.sleep(0.05)
+    started = time.monotonic()
+    await delivery.request(failing()[0], chat_id=2)
+    assert time.monotonic() - started > 0.8
+    await flooded
+
+
+async def test_session_retries_are_not_multiplied(api):
+    session = TelegramSession(api=TelegramAPIServer.from_base(api.url), retries=2, backoff=0.01)
+    bot = Bot("123456:TEST-TOKEN", session=session)
+    api.fail("banChatMember", *[500] * 10)
+    try:
+        with pytest.raises(TelegramServerError):
+            await engine(max_retries=3).request(lambda: bot.ban_chat_member(-100, 5))
+        # The session's retries only, not (retries + 1) * (max_retries + 1).
+        assert api.calls["banChatMember"] == 3
+        # A flood wait is the engine's to retry, errors around it the session's.
+        api.failures.clear()
+        api.fail("banChatMember", 500, 429, 500, 500)
+        assert await engine(max_retries=3).request(lambda: bot.ban_chat_member(-100, 5)) is True
+        assert api.calls["banChatMember"] == 8
+        api.failures.clear()
+        api.fail("sendMessage", 500)
+        assert await engine().execute(lambda: bot.send_message(1, "hello"), chat_id=1) == FAILED
+        assert api.calls["sendMessage"] == 1
+    finally:
+        await session.close()
+
+
+async def test_execute_reports_the_outcome():
+    delivery = engine(max_retries=0)
+    assert await delivery.execute(failing()[0]) == SENT
+    assert await delivery.execute(failing(TelegramForbiddenError(SEND, "blocked"))[0]) == BLOCKED
+    assert await delivery.execute(failing(TelegramBadRequest(SEND, "chat not found"))[0]) == FAILED
+    assert await delivery.execute(failing(TelegramServerError(BAN, "Bad Gateway"))[0]) == FAILED
+
+
+async def test_run_bounds_concurrency_and_counts_outcomes():
+    delivery = engine(concurrency=3)
+    running = []
+    peak = []
+
+    async def job(status):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        if status is None:
+            raise RuntimeError("job crashed")
+        return status
+
+    statuses = [SENT] * 6 + [BLOCKED] * 2 + [FAILED, None]
+    report = await delivery.run(job(status) for status in statuses)
+    assert (report.sent, report.blocked, report.failed) == (6, 2, 2)
+    assert max(peak) == 3
+
+
+async def test_token_bucket_rate():
+    bucket = TokenBucket(rate=50, capacity=5)
+    started = time.monotonic()
+    for _ in range(15):
+        await bucket.acquire()
+    # Five from the full bucket, ten refilled at 50 per second.
+    assert 0.15 < time.monotonic() - started < 0.5
+
+
+async def test_chat_throttle_spaces_one_chat_only():
+    throttle = ChatThrottle(interval=0.1)
+    started = time.monotonic()
+    await throttle.wait(1)
+    await throttle.wait(2)
+    assert time.monotonic() - started < 0.05
+    await throttle.wait(1)
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.utils.delivery import SENT, DeliveryEngine
+from app.utils.expiry import ExpiryTimers, expire_subscription
+
+
+def delivery():
+    return DeliveryEngine(rate=1000, per_chat_interval=0)
+
+
+async def subscribe(models, user_id, expires_at):
+    await models.add_user(user_id, f"User{user_id}", None, None, None)
+    await models.update_subscription(user_id, True, expires_at, 500)
+
+
+async def wait_until(predicate, timeout=3):
+    async def poll():
+        while not await predicate():
+            await asyncio.sleep(0.05)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def test_expire_subscription_bans_and_notifies(models_db, api, bot):
+    await subscribe(models_db, 1, datetime.utcnow() - timedelta(seconds=1))
+    assert await expire_subscription(bot, delivery(), 1) == SENT
+    assert not (await models_db.get_user(1))["is_subscribed"]
+    assert (api.calls["banChatMember"], api.calls["sendMessage"]) == (1, 1)
+
+
+async def test_expire_subscription_skips_renewed_users(models_db, api, bot):
+    await subscribe(models_db, 1, datetime.utcnow() + timedelta(days=30))
+    await models_db.add_user(2, "User2", None, None, None)
+    assert await expire_subscription(bot, delivery(), 1) == SENT
+    assert await expire_subscription(bot, delivery(), 2) == SENT
+    assert (await models_db.get_user(1))["is_subscribed"]
+    assert api.calls["banChatMember"] == 0
+
+
+async def test_timers_expire_subscriptions_on_time(models_db, api, bot):
+    now = datetime.utcnow()
+    await subscribe(models_db, 1, now - timedelta(minutes=5))
+    await subscribe(models_db, 2, now + timedelta(seconds=2))
+    await subscribe(models_db, 3, now + timedelta(hours=1))
+    timers = ExpiryTimers(bot, delivery(), window=600)
+    timers.start()
+    try:
+
+        async def expired(user_id):
+            return not (await models_db.get_user(user_id))["is_subscribed"]
+
+        await wait_until(lambda: expired(1))
+        assert len(timers) == 1
+        await wait_until(lambda: expired(2))
+        assert len(timers) == 0
+        # Beyond the loaded window, so not held in memory yet.
+        assert (await models_db.get_user(3))["is_subscribed"]
+    finally:
+        await timers.stop()
+    assert api.calls["banChatMember"] == 2
+
+
+async def test_renewed_and_cancelled_timers_do_not_fire(models_db, api, bot):
+    soon = datetime.utcnow() + timedelta(seconds=3)
+    await subscribe(models_db, 1, soon)
+    await subscribe(models_db, 2, soon)
+    timers = ExpiryTimers(bot, delivery(), window=600)
+    timers.start()
+    try:
+
+        async def loaded():
+            return len(timers) == 2
+
+        await wait_until(loaded)
+        later = datetime.utcnow() + timedelta(seconds=300)
+        await models_db.update_subscription(1, True, later, 500)
+        timers.schedule(1, later)
+        await models_db.update_subscription(2, False, None)
+        timers.cancel(2)
+        await asyncio.sleep(3.5)
+    finally:
+        await timers.stop()
+    assert (await models_db.get_user(1))["is_subscribed"]
+    assert api.calls["banChatMember"] == 0
+
+
+async def test_schedule_beyond_the_window_is_left_to_the_database(models_db, bot):
+    timers = ExpiryTimers(bot, delivery(), window=600)
+    timers.start()
+    try:
+        await asyncio.sleep(0.1)
+        timers.schedule(1, datetime.utcnow() + timedelta(seconds=60))
+        timers.schedule(2, datetime.utcnow() + timedelta(days=1))
+        assert len(timers) == 1
+    finally:
+        await timers.stop()
+    assert len(timers) == 0
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.cache import LRUCache
+from app.utils import invite_links as invite_links_module
+from app.utils.delivery import DeliveryEngine
+from app.utils.expiry import ExpiryTimers
+from app.utils.invite_links import InviteLinkManager
+from app.utils.scheduler import setup_scheduler
+
+
+@pytest.fixture
+def links(models_db, bot):
+    delivery = DeliveryEngine(rate=1000, per_chat_interval=0)
+    return InviteLinkManager(bot, delivery, pool_size=3, cache_size=2)
+
+
+async def test_link_is_created_once_and_reused(links, api):
+    first = await links.get_link(1)
+    assert first.startswith("https://t.me/+")
+    assert await links.get_link(1) == first
+    # Not cached any more, but still stored for the user.
+    links._cache.pop(1)
+    assert await links.get_link(1) == first
+    assert api.calls["createChatInviteLink"] == 1
+
+
+async def test_pool_is_refilled_and_claimed(links, api):
+    assert await links.refill_pool() == 3
+    assert await links.refill_pool() == 0
+    await links.get_link(1)
+    assert api.calls["createChatInviteLink"] == 3
+    assert await links.refill_pool() == 1
+
+
+async def test_concurrent_requests_share_one_link(links, api, monkeypatch):
+    # Slow lookups keep several callers waiting on the user's lock, including
+    # one that arrives right as the first caller releases it.
+    inside = []
+    peak = []
+    lookup = invite_links_module.get_user_invite_link
+
+    async def slow_lookup(user_id, cutoff):
+        inside.append(user_id)
+        peak.append(len(inside))
+        await asyncio.sleep(0.02)
+        inside.pop()
+        return await lookup(user_id, cutoff)
+
+    monkeypatch.setattr(invite_links_module, "get_user_invite_link", slow_lookup)
+    # Without the cache every caller goes through the lookup.
+    links._cache = LRUCache(maxsize=0)
+    first = asyncio.create_task(links.get_link(1))
+    second = asyncio.create_task(links.get_link(1))
+    await asyncio.sleep(0)
+    await first
+    third = asyncio.create_task(links.get_link(1))
+    assert len({first.result(), await second, await third}) == 1
+    assert max(peak) == 1
+    assert api.calls["createChatInviteLink"] == 1
+    assert len(links._locks) == 0
+
+
+async def test_cache_is_bounded(links):
+    for user_id in (1, 2, 3):
+        await links.get_link(user_id)
+    assert links._cache.stats()["size"] == 2
+    assert links._cache.get(1) is None
+
+
+async def test_only_the_link_used_to_join_is_revoked(links, models_db):
+    link = await links.get_link(1)
+    await links.mark_used(1, "https://t.me/+someone-else")
+    assert await links.get_link(1) == link
+    await links.mark_used(1, link)
+    assert await links.get_link(1) != link
+
+
+async def test_stale_links_are_revoked(links, models_db, api):
+    await models_db.add_user(1, "Subscriber", None, None, None)
+    await models_db.add_user(2, "Lapsed", None, None, None)
+    await models_db.update_subscription(1, True, datetime.utcnow() + timedelta(days=30), 500)
+    kept, stale = await links.get_link(1), await links.get_link(2)
+    assert await links.revoke_stale() == 1
+    assert api.calls["revokeChatInviteLink"] == 1
+    assert await links.get_link(1) == kept
+    assert await links.get_link(2) != stale
+
+
+async def test_pool_maintenance_runs_only_on_the_scheduler_leader(links, bot):
+    delivery = DeliveryEngine(rate=1000, per_chat_interval=0)
+    lease = setup_scheduler(bot, delivery, ExpiryTimers(bot, delivery), links)
+    assert links._task is None
+    await lease.on_acquired()
+    assert links._task is not None
+    await lease.on_lost()
+    assert links._task is None
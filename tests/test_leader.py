@@ -0,0 +1,96 @@
+import asyncio
+
+from app.utils import leader as leader_module
+from app.utils.leader import LeaderLease
+
+
+def lease(events=None, name="scheduler", **kwargs):
+    events = [] if events is None else events
+
+    async def on_acquired():
+        events.append("acquired")
+
+    async def on_lost():
+        events.append("lost")
+
+    kwargs = {"ttl": 1, "heartbeat": 0.05, "on_acquired": on_acquired, "on_lost": on_lost, **kwargs}
+    return LeaderLease(name, **kwargs)
+
+
+async def wait_until(predicate, timeout=3):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.02)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def test_only_one_instance_leads_and_hands_over_on_stop(models_db):
+    first_events, second_events = [], []
+    first, second = lease(first_events), lease(second_events)
+    first.start()
+    await wait_until(lambda: first.is_leader)
+    second.start()
+    try:
+        await asyncio.sleep(0.2)
+        assert not second.is_leader
+        await first.stop()
+        assert first_events == ["acquired", "lost"]
+        # Released, so the next heartbeat takes over without waiting for the ttl.
+        await wait_until(lambda: second.is_leader, timeout=0.5)
+        assert second_events == ["acquired"]
+    finally:
+        await second.stop()
+
+
+async def test_lease_of_a_dead_leader_expires(models_db):
+    # Expiry is stored in whole seconds, so a ttl of 2 holds for at least 1.
+    first, second = lease(ttl=2), lease(ttl=2)
+    first.start()
+    await wait_until(lambda: first.is_leader)
+    # The process dies: no more renewals and no release.
+    first._task.cancel()
+    second.start()
+    try:
+        await asyncio.sleep(0.2)
+        assert not second.is_leader
+        await wait_until(lambda: second.is_leader)
+    finally:
+        await second.stop()
+
+
+async def test_failed_setup_hands_the_lease_back(models_db):
+    events = []
+
+    async def broken():
+        events.append("acquired")
+        raise RuntimeError("scheduler did not start")
+
+    first = lease(events, on_acquired=broken)
+    first.start()
+    await wait_until(lambda: events[:2] == ["acquired", "lost"])
+    await first.stop()
+    assert not first.is_leader
+    second = lease()
+    second.start()
+    try:
+        await wait_until(lambda: second.is_leader, timeout=0.5)
+    finally:
+        await second.stop()
+
+
+async def test_leadership_is_dropped_when_the_lease_cannot_be_renewed(models_db, monkeypatch):
+    events = []
+    instance = lease(events)
+    instance.start()
+    try:
+        await wait_until(lambda: instance.is_leader)
+
+        async def unreachable(name, holder, ttl):
+            raise ConnectionError("database is unreachable")
+
+        monkeypatch.setattr(leader_module, "acquire_lease", unreachable)
+        await wait_until(lambda: not instance.is_leader)
+        assert events == ["acquired", "lost"]
+    finally:
+        await instance.stop()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Histogram
+
+from app.utils.metrics import timed
+
+
+@pytest.fixture
+def metrics():
+    registry = CollectorRegistry()
+    latency = Histogram("test_seconds", "Latency", ["function"], registry=registry)
+    errors = Counter("test_errors_total", "Errors", ["function"], registry=registry)
+
+    def sample(name):
+        return registry.get_sample_value(name, {"function": "call"}) or 0
+
+    return timed(latency, errors), sample
+
+
+async def test_errors_are_counted(metrics):
+    decorator, sample = metrics
+
+    @decorator
+    async def call(error=None):
+        if error:
+            raise error
+        return "ok"
+
+    assert await call() == "ok"
+    with pytest.raises(ValueError):
+        await call(ValueError("boom"))
+    assert sample("test_errors_total") == 1
+    assert sample("test_seconds_count") == 2
+
+
+async def test_cancellation_is_not_an_error(metrics):
+    decorator, sample = metrics
+
+    @decorator
+    async def call():
+        await asyncio.sleep(10)
+
+    task = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(call(), 0.01)
+    assert sample("test_errors_total") == 0
+    assert sample("test_seconds_count") == 2
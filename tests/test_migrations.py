@@ -0,0 +1,203 @@
+import re
+
+import pytest
+
+from app.database.connection import Database
+from app.database.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+
+@pytest.fixture
+def db(tmp_path, event_loop):
+    database = Database(str(tmp_path / "bot.db"), readers=1)
+    event_loop.run_until_complete(database.open())
+    yield database
+    event_loop.run_until_complete(database.close())
+
+
+async def _migrate_to(db, version):
+    for number, _, apply in MIGRATIONS:
+        if number > version:
+            break
+        await apply(db)
+    async with db.writer() as conn:
+        await conn.execute(f"PRAGMA user_version = {int(version)}")
+
+
+async def test_migrations_run_once(db):
+    latest = MIGRATIONS[-1][0]
+    assert await run_migrations(db) == latest
+    assert await get_schema_version(db) == latest
+    assert await run_migrations(db) == latest
+
+
+def test_migration_versions_are_unique_and_ordered():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+# The hot lookups of SqliteRepository and the index each one must use.
+PLANS = [
+    (
+        "subscriptions expiring",
+        """
+        SELECT user_id, subscription_expires_at FROM users
+        WHERE is_subscribed = 1 AND subscription_expires_at > ? AND subscription_expires_at <= ?
+        """,
+        (0, 1000),
+        "idx_users_subscription_expiry",
+    ),
+    (
+        "lapsed subscriptions",
+        """
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE is_subscribed = 1 AND subscription_expires_at IS NULL)
+            + (SELECT COUNT(*) FROM users WHERE is_subscribed = 1 AND subscription_expires_at <= ?)
+        """,
+        (1000,),
+        "idx_users_subscription_expiry (is_subscribed=? AND subscription_expires_at<?)",
+    ),
+    (
+        "due reminders",
+        """
+        SELECT u.user_id, u.subscription_expires_at FROM users u
+        WHERE u.is_subscribed = 1 AND u.subscription_expires_at > ? AND u.subscription_expires_at <= ?
+        AND NOT EXISTS (
+            SELECT 1 FROM reminders r
+            WHERE r.user_id = u.user_id AND r.stage = ? AND r.expires_at = u.subscription_expires_at
+        )
+        """,
+        (0, 1000, 3),
+        "idx_users_subscription_expiry",
+    ),
+    (
+        "reminder ledger purge",
+        "DELETE FROM reminders WHERE expires_at <= ?",
+        (1000,),
+        "idx_reminders_expires_at",
+    ),
+    (
+        "pending requests of users",
+        """
+        UPDATE payment_requests SET status = 'approved'
+        WHERE status = 'pending' AND user_id IN (SELECT value FROM json_each(?))
+        """,
+        ("[1, 2]",),
+        "idx_payment_requests_pending",
+    ),
+    (
+        "pending requests per reviewer",
+        """
+        SELECT reviewer_id, COUNT(*) FROM payment_requests
+        WHERE status = 'pending' AND reviewer_id IS NOT NULL
+        GROUP BY reviewer_id
+        """,
+        (),
+        "idx_payment_requests_reviewer",
+    ),
+    (
+        "pending request count",
+        "SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'",
+        (),
+        "idx_payment_requests_",
+    ),
+    (
+        "invite link of a user",
+        """
+        SELECT invite_link, expires_at FROM invite_links
+        WHERE user_id = ? AND revoked = 0 AND expires_at > ?
+        ORDER BY expires_at DESC LIMIT 1
+        """,
+        (1, 0),
+        "idx_invite_links_user",
+    ),
+    (
+        "pooled invite link",
+        """
+        SELECT invite_link FROM invite_links
+        WHERE user_id IS NULL AND revoked = 0 AND expires_at > ?
+        ORDER BY expires_at LIMIT 1
+        """,
+        (0,),
+        "idx_invite_links_",
+    ),
+    (
+        "admin route",
+        "SELECT user_id FROM admin_routes WHERE chat_id = ? AND message_id = ?",
+        (1, 2),
+        "PRIMARY KEY (chat_id=? AND message_id=?)",
+    ),
+    (
+        "admin route purge",
+        "DELETE FROM admin_routes WHERE created_at < ?",
+        (1000,),
+        "idx_admin_routes_created_at",
+    ),
+]
+
+
+@pytest.mark.parametrize("query, params, index", [plan[1:] for plan in PLANS], ids=[plan[0] for plan in PLANS])
+async def test_hot_queries_use_their_index(db, query, params, index):
+    await run_migrations(db)
+    async with db.reader() as conn:
+        async with conn.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+            plan = [row["detail"] for row in await cursor.fetchall()]
+    assert any(index in detail for detail in plan), plan
+    # A bare "SCAN <table>" reads every row.
+    assert not [detail for detail in plan if re.fullmatch(r"SCAN \w+", detail)], plan
+
+
+async def test_text_expiry_is_converted_to_epoch(db):
+    await _migrate_to(db, 2)
+    async with db.writer() as conn:
+        await conn.executemany(
+            "INSERT INTO users (user_id, is_subscribed, subscription_expires_at) VALUES (?, ?, ?)",
+            [(1, 1, "2026-01-01 00:00:00"), (2, 0, None), (3, 1, 1767225600)],
+        )
+    await run_migrations(db)
+    async with db.reader() as conn:
+        async with conn.execute("SELECT user_id, subscription_expires_at FROM users ORDER BY user_id") as cursor:
+            rows = [tuple(row) for row in await cursor.fetchall()]
+    assert rows == [(1, 1767225600), (2, None), (3, 1767225600)]
+
+
+async def test_epoch_conversion_resumes_in_chunks(db):
+    convert = next(apply for version, _, apply in MIGRATIONS if version == 3)
+    await _migrate_to(db, 2)
+    async with db.writer() as conn:
+        await conn.executemany(
+            "INSERT INTO users (user_id, subscription_expires_at) VALUES (?, ?)",
+            [(user_id, "2026-01-01 00:00:00") for user_id in range(1, 11)],
+        )
+    await convert(db, chunk_size=3)
+    await convert(db, chunk_size=3)
+    async with db.reader() as conn:
+        async with conn.execute(
+            "SELECT COUNT(*) FROM users WHERE typeof(subscription_expires_at) = 'integer'"
+        ) as cursor:
+            assert (await cursor.fetchone())[0] == 10
+
+
+async def test_screenshot_uniqueness_is_narrowed_to_pending_requests(db):
+    await _migrate_to(db, 11)
+    async with db.writer() as conn:
+        await conn.executemany(
+            """
+            INSERT INTO payment_requests (user_id, file_id, file_unique_id, status, created_at, reviewer_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(1, "f1", "u1", "rejected", 10, 7), (2, "f2", "u2", "pending", 20, 8)],
+        )
+    await run_migrations(db)
+    await run_migrations(db)
+    async with db.writer() as conn:
+        await conn.execute(
+            "INSERT INTO payment_requests (user_id, file_id, file_unique_id, created_at) VALUES (1, 'f1', 'u1', 30)"
+        )
+        async with conn.execute(
+            "INSERT OR IGNORE INTO payment_requests (user_id, file_id, file_unique_id, created_at) "
+            "VALUES (2, 'f2', 'u2', 40) RETURNING id"
+        ) as cursor:
+            assert await cursor.fetchone() is None
+        async with conn.execute("SELECT user_id, status, reviewer_id FROM payment_requests ORDER BY id") as cursor:
+            rows = [tuple(row) for row in await cursor.fetchall()]
+    assert rows == [(1, "rejected", 7), (2, "pending", 8), (1, "pending", None)]
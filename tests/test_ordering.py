@@ -0,0 +1,87 @@
+import asyncio
+
+from aiogram.types import CallbackQuery, Update, User
+
+from app.middlewares.ordering import OrderedUpdatesMiddleware, user_key
+
+
+def update(update_id):
+    return Update(update_id=update_id)
+
+
+def sender(user_id):
+    return {"event_from_user": User(id=user_id, is_bot=False, first_name=f"User{user_id}")}
+
+
+def recorder(log, delay=0.02, fail=()):
+    async def handler(event, data):
+        log.append(("start", event.update_id))
+        await asyncio.sleep(delay)
+        log.append(("end", event.update_id))
+        if event.update_id in fail:
+            raise RuntimeError("handler failed")
+        return event.update_id
+
+    return handler
+
+
+async def test_updates_of_one_user_run_in_order():
+    ordering = OrderedUpdatesMiddleware()
+    log = []
+    handler = recorder(log)
+    results = await asyncio.gather(*(ordering(handler, update(n), sender(1)) for n in range(1, 4)))
+    # The first update runs all three; the others return once queued.
+    assert results == [1, None, None]
+    assert log == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+    assert ordering.stats() == {"keys": 0, "queued": 0, "dropped": 0}
+
+
+async def test_users_run_concurrently():
+    ordering = OrderedUpdatesMiddleware()
+    log = []
+    handler = recorder(log)
+    await asyncio.gather(ordering(handler, update(1), sender(1)), ordering(handler, update(2), sender(2)))
+    assert log[:2] == [("start", 1), ("start", 2)]
+    # Updates without a user are not queued at all.
+    assert await ordering(handler, update(3), {}) == 3
+
+
+async def test_burst_beyond_the_limit_is_dropped():
+    ordering = OrderedUpdatesMiddleware(max_pending=3)
+    log = []
+    await asyncio.gather(*(ordering(recorder(log, delay=0.01), update(n), sender(1)) for n in range(1, 6)))
+    assert [update_id for kind, update_id in log if kind == "end"] == [1, 2, 3]
+    assert ordering.stats()["dropped"] == 2
+
+
+async def test_failed_queued_update_does_not_stop_the_queue():
+    ordering = OrderedUpdatesMiddleware()
+    log = []
+    handler = recorder(log, fail={2})
+    await asyncio.gather(*(ordering(handler, update(n), sender(1)) for n in range(1, 4)))
+    assert [update_id for kind, update_id in log if kind == "end"] == [1, 2, 3]
+    assert ordering.stats()["keys"] == 0
+
+
+async def test_cancelled_drain_frees_the_key():
+    ordering = OrderedUpdatesMiddleware()
+    log = []
+    handler = recorder(log, delay=0.1)
+    first = asyncio.create_task(ordering(handler, update(1), sender(1)))
+    await asyncio.sleep(0)
+    for n in (2, 3):
+        await ordering(handler, update(n), sender(1))
+    assert ordering.stats()["queued"] == 2
+    await asyncio.sleep(0.15)
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    assert ordering.stats() == {"keys": 0, "queued": 0, "dropped": 0}
+    assert ("end", 3) not in log
+
+
+def test_payment_decisions_are_ordered_with_the_paying_user():
+    admin = User(id=1, is_bot=False, first_name="Admin")
+    callback = CallbackQuery(id="1", from_user=admin, chat_instance="1", data="approve_42")
+    assert user_key(Update(update_id=1, callback_query=callback), {"event_from_user": admin}) == 42
+    callback = CallbackQuery(id="2", from_user=admin, chat_instance="1", data="pending_page_0")
+    assert user_key(Update(update_id=2, callback_query=callback), {"event_from_user": admin}) == 1
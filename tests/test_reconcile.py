@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.types import Chat, Message, User
+
+from app.handlers.admin import start_reconcile
+from app.utils import reconcile as reconcile_module
+from app.utils.delivery import DeliveryEngine
+from app.utils.reconcile import CHECKPOINT, claim, reconcile_membership
+from config.config import config
+
+
+@pytest.fixture
+def delivery():
+    return DeliveryEngine(rate=1000, per_chat_interval=0)
+
+
+async def add_users(models, subscribed=(), expired=(), unsubscribed=()):
+    # The fake API decides membership by user_id: 1-3, 11-13 are members,
+    # 4 and 14 are banned, the rest have left.
+    for user_id in (*subscribed, *expired, *unsubscribed):
+        await models.add_user(user_id, f"User{user_id}", None, None, None)
+    for user_id in subscribed:
+        await models.update_subscription(user_id, True, datetime.utcnow() + timedelta(days=30), 500)
+    for user_id in expired:
+        await models.update_subscription(user_id, True, datetime.utcnow() - timedelta(days=1), 500)
+
+
+async def test_membership_follows_the_subscription(models_db, api, bot, delivery):
+    await add_users(models_db, subscribed=(3, 4), expired=(12,), unsubscribed=(config.admin_id, 2, 5, 14))
+    report = await reconcile_membership(bot, delivery)
+    assert (report.checked, report.members) == (7, 4)
+    # The bot admin stays in the channel without a subscription.
+    assert sorted(report.banned_ids) == [2, 12]
+    assert report.restored == 1
+    assert (api.calls["banChatMember"], api.calls["unbanChatMember"]) == (2, 1)
+    assert api.params["unbanChatMember"]["user_id"] == "4"
+    assert "Удалены без подписки: 2" in api.params["sendMessage"]["text"]
+    assert await models_db.get_checkpoint(CHECKPOINT) is None
+
+
+async def test_channel_owner_is_never_banned(models_db, api, bot, delivery):
+    await add_users(models_db, unsubscribed=(2,))
+    api._chat_member = lambda params: {
+        "status": "creator",
+        "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "Owner"},
+        "is_anonymous": False,
+    }
+    report = await reconcile_membership(bot, delivery)
+    assert report.members == 1
+    assert api.calls["banChatMember"] == 0
+
+
+async def test_one_run_at_a_time_across_instances(models_db, api, bot, delivery):
+    await add_users(models_db, unsubscribed=(2,))
+    # Another instance is reconciling.
+    holder = await claim()
+    assert holder is not None
+    assert await claim() is None
+    assert await reconcile_membership(bot, delivery) is None
+    admin = User(id=config.admin_id, is_bot=False, first_name="Admin")
+    chat = Chat(id=config.admin_id, type="private")
+    command = Message(message_id=1, date=0, chat=chat, from_user=admin, text="/reconcile").as_(bot)
+    await start_reconcile(command, delivery)
+    assert "уже выполняется" in api.params["sendMessage"]["text"]
+    assert api.calls["getChatMember"] == 0
+    # Once that run is done the lease is free again, and each run hands it back.
+    await reconcile_membership(bot, delivery, holder)
+    assert api.calls["getChatMember"] == 1
+    assert await claim() is not None
+
+
+async def test_run_that_lost_its_lease_stops_at_the_checkpoint(models_db, api, bot, delivery, monkeypatch):
+    await add_users(models_db, unsubscribed=(2, 3, 11, 12))
+    monkeypatch.setitem(config.reconcile, "page_size", 2)
+
+    async def lapsed(name, holder, ttl):
+        return False
+
+    holder = await claim()
+    monkeypatch.setattr(reconcile_module, "acquire_lease", lapsed)
+    assert await reconcile_membership(bot, delivery, holder) is None
+    assert api.calls["getChatMember"] == 2
+    assert (await models_db.get_checkpoint(CHECKPOINT))["after_id"] == 3
+    # The next run resumes from there.
+    monkeypatch.undo()
+    monkeypatch.setitem(config.reconcile, "page_size", 2)
+    report = await reconcile_membership(bot, delivery)
+    assert report.checked == 4
+    assert api.calls["getChatMember"] == 4
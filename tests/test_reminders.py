@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.delivery import DeliveryEngine
+from app.utils.scheduler import send_reminders
+from config.config import config
+
+
+@pytest.fixture
+def delivery(monkeypatch):
+    monkeypatch.setattr(config, "reminder_days", [7, 3, 1])
+    return DeliveryEngine(rate=1000, per_chat_interval=0, max_retries=0)
+
+
+async def subscribe(models, user_id, expires_in):
+    await models.add_user(user_id, f"User{user_id}", None, None, None)
+    await models.update_subscription(user_id, True, datetime.utcnow() + expires_in, 500)
+
+
+async def test_each_stage_is_sent_once(models_db, api, bot, delivery):
+    await subscribe(models_db, 1, timedelta(days=5))
+    await subscribe(models_db, 2, timedelta(hours=12))
+    await subscribe(models_db, 3, timedelta(days=20))
+    counts, report = await send_reminders(bot, delivery)
+    assert counts == {7: 1, 3: 0, 1: 1}
+    assert report.sent == 2
+    counts, _ = await send_reminders(bot, delivery)
+    assert counts == {7: 0, 3: 0, 1: 0}
+    assert api.calls["sendMessage"] == 2
+
+
+async def test_concurrent_runs_remind_once(models_db, api, bot, delivery):
+    for user_id in range(1, 11):
+        await subscribe(models_db, user_id, timedelta(days=2))
+    results = await asyncio.gather(*(send_reminders(bot, delivery) for _ in range(3)))
+    assert sum(counts[3] for counts, _ in results) == 10
+    assert api.calls["sendMessage"] == 10
+
+
+async def test_failed_reminder_is_sent_on_the_next_run(models_db, api, bot, delivery):
+    await subscribe(models_db, 1, timedelta(days=2))
+    api.fail("sendMessage", 400)
+    _, report = await send_reminders(bot, delivery)
+    assert report.failed == 1
+    _, report = await send_reminders(bot, delivery)
+    assert report.sent == 1
+    _, report = await send_reminders(bot, delivery)
+    assert report.sent == 0
+
+
+async def test_renewal_starts_a_new_period(models_db, api, bot, delivery):
+    await subscribe(models_db, 1, timedelta(days=2))
+    assert (await send_reminders(bot, delivery))[0][3] == 1
+    # Renewed for a few more days only: the 3-day stage is due again.
+    await models_db.update_subscription(1, True, datetime.utcnow() + timedelta(days=2, hours=12), 500)
+    assert (await send_reminders(bot, delivery))[0][3] == 1
+    assert api.calls["sendMessage"] == 2
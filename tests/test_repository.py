@@ -0,0 +1,237 @@
+import pytest
+
+from app.database.repository import create_repository
+
+# The contract every storage backend implements, run against each of them.
+# Timestamps are plain epoch seconds, as at the Repository boundary.
+
+
+def users(*ids):
+    return [(user_id, f"User{user_id}", None, None, f"user{user_id}") for user_id in ids]
+
+
+async def test_insert_users_ignores_existing(repo):
+    assert await repo.insert_users(users(1, 2, 3)) == 3
+    assert await repo.insert_users(users(2, 3, 4)) == 1
+    assert (await repo.get_counters())["total_users"] == 4
+    user = await repo.get_user(2)
+    assert user["username"] == "user2"
+    assert not user["is_subscribed"]
+    assert user["subscription_expires_at"] is None
+    assert await repo.get_user(99) is None
+
+
+async def test_update_subscription_keeps_counters_and_history(repo):
+    await repo.insert_users(users(1, 2))
+    assert await repo.update_subscription(1, True, 1000, 500, 10)
+    assert await repo.update_subscription(2, True, 2000, 500, 10)
+    assert not await repo.update_subscription(99, True, 2000, 500, 10)
+    assert await repo.update_subscription(2, False, None, 0, 20)
+    counters = await repo.get_counters()
+    assert counters["active_subscribers"] == 1
+    assert counters["revenue"] == 1000
+    assert [row["user_id"] for row in await repo.get_subscriptions_expiring(None, 1500)] == [1]
+    assert await repo.get_subscriptions_expiring(1000, 3000) == []
+    # Nothing drifted, so a recount changes no counter.
+    before, after = await repo.reconcile_counters()
+    assert {name: before[name] for name in after} == after
+
+
+async def test_get_users_after_pages_in_id_order(repo):
+    await repo.insert_users(users(5, 1, 3, 2, 4))
+    assert [row["user_id"] for row in await repo.get_users_after(0, 2)] == [1, 2]
+    assert [row["user_id"] for row in await repo.get_users_after(2, 10)] == [3, 4, 5]
+
+
+async def test_upsert_users(repo):
+    await repo.insert_users(users(1, 2))
+    await repo.update_subscription(2, True, 5000, 0, 10)
+    inserted, updated = await repo.upsert_users(
+        [
+            (1, None, "Last", None, None, True, 9000),
+            (2, "Renamed", None, None, None, None, None),
+            (3, "New", None, None, None, False, None),
+            (4, None, None, None, None, None, None),
+        ]
+    )
+    assert (inserted, updated) == (2, 2)
+    one, two = await repo.get_user(1), await repo.get_user(2)
+    assert (one["first_name"], one["last_name"], bool(one["is_subscribed"])) == ("User1", "Last", True)
+    # Without is_subscribed the stored subscription is left alone.
+    assert (two["first_name"], bool(two["is_subscribed"]), two["subscription_expires_at"]) == ("Renamed", True, 5000)
+    assert not (await repo.get_user(4))["is_subscribed"]
+    counters = await repo.get_counters()
+    assert counters["total_users"] == 4
+    assert counters["active_subscribers"] == 2
+    assert [row["user_id"] async for row in repo.iter_users(3)] == [1, 2, 3, 4]
+
+
+async def test_reminder_ledger_sends_once(repo):
+    await repo.insert_users(users(1, 2, 3))
+    for user_id, expires_at in ((1, 500), (2, 800), (3, 900)):
+        await repo.update_subscription(user_id, True, expires_at, 0, 10)
+    due = await repo.get_due_reminders(3, 400, 850)
+    assert sorted(row["user_id"] for row in due) == [1, 2]
+    assert sorted(await repo.claim_reminders(3, [(1, 500), (2, 800)], 10)) == [1, 2]
+    assert await repo.claim_reminders(3, [(1, 500), (3, 900)], 11) == [3]
+    assert await repo.get_due_reminders(3, 400, 950) == []
+    await repo.release_reminder(2, 3, 800)
+    assert [row["user_id"] for row in await repo.get_due_reminders(3, 400, 950)] == [2]
+    # Stages are independent.
+    assert len(await repo.get_due_reminders(1, 400, 950)) == 3
+    assert await repo.purge_reminders(800) == 1
+    assert await repo.purge_reminders(800) == 0
+
+
+async def test_statistics_snapshots(repo):
+    await repo.insert_users(users(1, 2))
+    await repo.update_subscription(1, True, 1000, 500, 10)
+    await repo.take_snapshot("2026-01-01", 0)
+    snapshots = await repo.get_snapshots(["2026-01-01", "2026-01-02"])
+    assert list(snapshots) == ["2026-01-01"]
+    assert snapshots["2026-01-01"]["total_users"] == 2
+    assert snapshots["2026-01-01"]["active_subscribers"] == 1
+
+
+async def test_lapsed_subscriptions_are_not_active(repo):
+    await repo.insert_users(users(1, 2, 3))
+    await repo.update_subscription(1, True, 1000, 0, 10)
+    await repo.update_subscription(2, True, 5000, 0, 10)
+    await repo.update_subscription(3, True, None, 0, 10)
+    # The counter follows the flag; expiry is applied when reading it.
+    assert (await repo.get_counters())["active_subscribers"] == 3
+    assert await repo.count_lapsed_subscriptions(2000) == 2
+    assert await repo.count_lapsed_subscriptions(5000) == 3
+    await repo.take_snapshot("2026-01-01", 2000)
+    assert (await repo.get_snapshots(["2026-01-01"]))["2026-01-01"]["active_subscribers"] == 1
+
+
+async def test_invite_link_pool(repo):
+    await repo.insert_users(users(3, 4, 5))
+    await repo.save_invite_links([("A", None, 5000), ("B", None, 9000), ("C", 3, 9000), ("D", 4, 9000)], 10)
+    assert await repo.count_pooled_invite_links(4000) == 2
+    assert await repo.claim_pooled_invite_link(5, 4000) in (("A", 5000), ("B", 9000))
+    assert await repo.get_user_invite_link(5, 100) is not None
+    assert await repo.count_pooled_invite_links(4000) == 1
+    await repo.revoke_invite_links(["D"])
+    assert await repo.get_user_invite_link(4, 100) is None
+    assert await repo.get_user_invite_link(3, 100) == ("C", 9000)
+    assert await repo.purge_expired_invite_links(6000) >= 0
+
+
+async def test_payment_requests(repo):
+    await repo.insert_users(users(3, 5, 6))
+    first = await repo.add_payment_request(3, "f1", "u1", 7, 100)
+    assert first is not None
+    assert await repo.add_payment_request(3, "f1", "u1", 8, 101) is None
+    await repo.add_payment_request(5, "f2", "u2", 8, 102)
+    await repo.add_payment_request(6, "f3", "u3", 7, 103)
+    assert await repo.count_pending_by_reviewer() == {7: 2, 8: 1}
+    assert await repo.count_pending_payment_requests() == 3
+    page = await repo.get_pending_payment_requests(0, 2)
+    assert [row["user_id"] for row in page] == [3, 5]
+    assert page[0]["first_name"] == "User3"
+    assert [row["user_id"] for row in await repo.get_pending_payment_requests(page[-1]["id"], 10)] == [6]
+
+    assert await repo.delete_payment_request(first)
+    assert not await repo.delete_payment_request(first)
+    # A forgotten screenshot can be submitted again.
+    assert await repo.add_payment_request(3, "f1", "u1", 7, 104) is not None
+    # So can a rejected one, but only once while it is pending.
+    await repo.resolve_payment_requests([3], False, None, 0, 105)
+    assert await repo.add_payment_request(3, "f1", "u1", 7, 106) is not None
+    assert await repo.add_payment_request(3, "f1", "u1", 7, 107) is None
+
+
+async def test_resolve_payment_requests_only_touches_pending_users(repo):
+    await repo.insert_users(users(42, 43))
+    await repo.add_payment_request(42, "f", "u", None, 10)
+    assert await repo.resolve_payment_requests([42, 43, 777], True, 5000, 500, 20) == [42]
+    # A second approval of the same request, e.g. a double tap, changes nothing.
+    assert await repo.resolve_payment_requests([42], True, 9000, 500, 21) == []
+    assert await repo.resolve_payment_requests([42], False, None, 0, 22) == []
+    counters = await repo.get_counters()
+    assert counters["active_subscribers"] == 1
+    assert counters["revenue"] == 500
+    assert (await repo.get_user(42))["subscription_expires_at"] == 5000
+    assert not (await repo.get_user(43))["is_subscribed"]
+    assert await repo.count_pending_payment_requests() == 0
+
+
+async def test_rejection_is_recorded(repo):
+    await repo.insert_users(users(1))
+    await repo.add_payment_request(1, "f", "u", None, 10)
+    assert await repo.resolve_payment_requests([1], False, None, 0, 20) == [1]
+    assert not (await repo.get_user(1))["is_subscribed"]
+    rollup = await repo.rollup_day("1970-01-01", 0, 100, 500)
+    assert rollup["rejected"] == 1
+    assert rollup["revenue"] == 0
+
+
+async def test_subscription_history_rollups(repo):
+    await repo.insert_users(users(1, 2))
+    await repo.update_subscription(1, True, 90000, 500, 1000)
+    await repo.update_subscription(1, True, 190000, 500, 2000)
+    await repo.update_subscription(2, True, 90000, 500, 1500)
+    await repo.update_subscription(2, False, None, 0, 3000)
+    assert await repo.get_first_event_at() == 1000
+    day = await repo.rollup_day("1970-01-01", 0, 4000, 300)
+    assert (day["new"], day["renewed"], day["churned"]) == (2, 1, 1)
+    assert day["revenue"] == 1500
+    assert day["active"] == 1
+    assert await repo.get_last_rollup_day() == "1970-01-01"
+    assert [row["day"] for row in await repo.get_daily_rollups("1970-01-01")] == ["1970-01-01"]
+    await repo.rollup_cohorts("1970-01", 0, 4000)
+    retention = await repo.get_cohort_retention("1970-01")
+    assert [(row["cohort"], row["month"], row["users"]) for row in retention] == [("1970-01", "1970-01", 2)]
+
+
+async def test_admin_routes(repo):
+    await repo.add_admin_route(7, 100, 3, 10)
+    await repo.add_admin_route(8, 100, 5, 20)
+    await repo.add_admin_route(7, 100, 6, 30)
+    assert [await repo.get_admin_route(7, 100), await repo.get_admin_route(8, 100)] == [6, 5]
+    assert await repo.get_admin_route(7, 101) is None
+    assert await repo.purge_admin_routes(25) == 1
+    assert await repo.get_admin_route(8, 100) is None
+
+
+async def test_lease(repo):
+    assert await repo.acquire_lease("s", "a", 100, 160)
+    assert not await repo.acquire_lease("s", "b", 110, 170)
+    assert await repo.acquire_lease("s", "a", 120, 180)
+    # Expired leases can be taken over.
+    assert await repo.acquire_lease("s", "b", 181, 240)
+    assert not await repo.acquire_lease("s", "a", 190, 250)
+    await repo.release_lease("s", "a")
+    assert not await repo.acquire_lease("s", "a", 200, 260)
+    await repo.release_lease("s", "b")
+    assert await repo.acquire_lease("s", "a", 200, 260)
+
+
+async def test_job_runs_and_checkpoints(repo):
+    await repo.record_job_run("j", 5)
+    await repo.record_job_run("j", 7)
+    await repo.record_job_run("k", 1)
+    assert await repo.get_job_runs() == {"j": 7, "k": 1}
+    assert await repo.get_checkpoint("c") is None
+    await repo.save_checkpoint("c", "v1", 1)
+    await repo.save_checkpoint("c", "v2", 2)
+    assert await repo.get_checkpoint("c") == "v2"
+    await repo.delete_checkpoint("c")
+    assert await repo.get_checkpoint("c") is None
+
+
+async def test_migrations_are_idempotent(backend, repo):
+    await repo.insert_users(users(1))
+    again = create_repository(backend)
+    await again.open()
+    try:
+        assert (await again.get_user(1))["user_id"] == 1
+    finally:
+        await again.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_repository({"backend": "mysql"})
@@ -0,0 +1,86 @@
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, PhotoSize, User
+
+from app.handlers.admin import bulk_approve, handle_pending_page
+from app.handlers.users import handle_message
+from app.utils.delivery import DeliveryEngine
+from app.utils.expiry import ExpiryTimers
+from app.utils.reviewers import ReviewerPool
+from config.config import config
+
+
+@pytest.fixture
+def delivery():
+    return DeliveryEngine(rate=1000, per_chat_interval=0)
+
+
+def message(bot, user_id, text=None, photo_id=None):
+    photo = [PhotoSize(file_id=f"file-{photo_id}", file_unique_id=photo_id, width=10, height=10)] if photo_id else None
+    return Message(
+        message_id=1,
+        date=0,
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name=f"User{user_id}"),
+        text=text,
+        photo=photo,
+    ).as_(bot)
+
+
+async def send_screenshot(bot, user_id, photo_id):
+    await handle_message(message(bot, user_id, photo_id=photo_id), None, ReviewerPool([config.admin_id]))
+
+
+async def test_screenshot_is_a_duplicate_only_while_pending(models_db, api, bot):
+    await send_screenshot(bot, 5, "a")
+    assert api.calls["sendPhoto"] == 1
+    await send_screenshot(bot, 5, "a")
+    assert api.calls["sendPhoto"] == 1
+    assert "уже ожидает проверки" in api.params["sendMessage"]["text"]
+    # After a rejection the same screenshot goes to review again.
+    await models_db.resolve_payments([5], False)
+    await send_screenshot(bot, 5, "a")
+    assert api.calls["sendPhoto"] == 2
+    assert "отправлен на проверку" in api.params["sendMessage"]["text"]
+    assert await models_db.count_pending_payments() == 1
+
+
+async def test_bulk_approve_reports_users_without_pending_requests(models_db, api, bot, delivery):
+    for user_id in (2, 3):
+        await send_screenshot(bot, user_id, f"screenshot-{user_id}")
+    sent = api.calls["sendMessage"]
+    expiry_timers = ExpiryTimers(bot, delivery)
+    await bulk_approve(message(bot, config.admin_id, text="/approve 2 3 4"), delivery, expiry_timers)
+    # Two notifications and the summary for the admin.
+    assert api.calls["sendMessage"] - sent == 3
+    assert "Подтверждено подписок: 2" in api.params["sendMessage"]["text"]
+    assert "Нет ожидающих заявок: 4" in api.params["sendMessage"]["text"]
+    assert all([(await models_db.get_user(user_id))["is_subscribed"] for user_id in (2, 3)])
+    # Approving again changes nothing.
+    await bulk_approve(message(bot, config.admin_id, text="/approve 2 3"), delivery, expiry_timers)
+    assert "Подтверждено подписок: 0" in api.params["sendMessage"]["text"]
+
+
+async def test_bulk_approve_is_for_admins_only(models_db, api, bot, delivery):
+    await send_screenshot(bot, 2, "a")
+    await bulk_approve(message(bot, 2, text="/approve 2"), delivery, ExpiryTimers(bot, delivery))
+    assert not (await models_db.get_user(2))["is_subscribed"]
+    assert await models_db.count_pending_payments() == 1
+
+
+async def test_page_approval_covers_only_the_requests_shown(models_db, api, bot, delivery):
+    for user_id in (2, 3):
+        await send_screenshot(bot, user_id, f"screenshot-{user_id}")
+    shown = await models_db.get_pending_payments()
+    # Arrives after the admin opened the page.
+    await send_screenshot(bot, 4, "screenshot-4")
+    callback = CallbackQuery(
+        id="1",
+        from_user=User(id=config.admin_id, is_bot=False, first_name="Admin"),
+        chat_instance="1",
+        message=message(bot, config.admin_id, text="page"),
+        data=f"pending_approve_0_{shown[-1]['id']}",
+    ).as_(bot)
+    await handle_pending_page(callback, delivery, ExpiryTimers(bot, delivery))
+    assert api.calls["answerCallbackQuery"] == 1
+    assert [row["user_id"] for row in await models_db.get_pending_payments()] == [4]
+    assert (await models_db.get_user(3))["is_subscribed"]
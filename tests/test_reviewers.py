@@ -0,0 +1,90 @@
+import pytest
+from aiogram.types import Chat, Message, PhotoSize, User
+
+from app.handlers.admin import handle_admin_reply
+from app.handlers.users import handle_message
+from app.utils.delivery import DeliveryEngine
+from app.utils.reviewers import ReviewerPool
+from config.config import config
+
+REVIEWER = 777
+
+
+def message(bot, user_id, chat_id=None, text=None, photo_id=None, reply_to=None):
+    photo = [PhotoSize(file_id=f"file-{photo_id}", file_unique_id=photo_id, width=10, height=10)] if photo_id else None
+    return Message(
+        message_id=100,
+        date=0,
+        chat=Chat(id=chat_id or user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name=f"User{user_id}"),
+        text=text,
+        photo=photo,
+        reply_to_message=reply_to,
+    ).as_(bot)
+
+
+async def test_least_loaded_reviewer_is_picked(models_db):
+    reviewers = ReviewerPool([1, 2, 3])
+    # Ties go to the reviewer listed first.
+    assert await reviewers.pick() == 1
+    await models_db.add_payment_request(10, "f1", "u1", 1)
+    await models_db.add_payment_request(11, "f2", "u2", 2)
+    assert await reviewers.pick() == 3
+    await models_db.add_payment_request(12, "f3", "u3", 3)
+    await models_db.add_payment_request(13, "f4", "u4", 3)
+    await models_db.resolve_payments([10], False)
+    assert await reviewers.pick() == 1
+    assert await reviewers.load() == {1: 0, 2: 1, 3: 2}
+
+
+async def test_round_robin_takes_turns():
+    reviewers = ReviewerPool([1, 2], "round_robin")
+    assert [await reviewers.pick() for _ in range(3)] == [1, 2, 1]
+
+
+def test_pool_settings_are_checked():
+    with pytest.raises(ValueError):
+        ReviewerPool([])
+    with pytest.raises(ValueError, match="Unknown review strategy"):
+        ReviewerPool([1], "random")
+
+
+async def test_screenshot_goes_to_the_picked_reviewer_and_replies_are_routed(models_db, api, bot):
+    reviewers = ReviewerPool([config.admin_id, REVIEWER])
+    await models_db.add_payment_request(10, "f1", "u1", config.admin_id)
+    # The fake API numbers messages in order, so the notification is the next one.
+    notification_id = api._message_id + 1
+    await handle_message(message(bot, 5, photo_id="a"), None, reviewers)
+    assert api.params["sendPhoto"]["chat_id"] == str(REVIEWER)
+
+    # The reviewer replies to the notification without any ID in the text.
+    notification = Message(message_id=notification_id, date=0, chat=Chat(id=REVIEWER, type="private"))
+    reply = message(bot, REVIEWER, text="Нужен чек целиком", reply_to=notification)
+    delivery = DeliveryEngine(rate=1000, per_chat_interval=0)
+    await handle_admin_reply(reply, delivery)
+    sent = api.calls["sendMessage"]
+    assert api.params["sendMessage"]["text"] == "Сообщение отправлено пользователю 5."
+    # The route is read from the database once the cache has forgotten it.
+    models_db.route_cache.clear()
+    await handle_admin_reply(reply, delivery)
+    assert api.calls["sendMessage"] == sent + 2
+    assert api.params["sendMessage"]["text"] == "Сообщение отправлено пользователю 5."
+
+
+async def test_unreachable_reviewer_falls_back_to_the_admin(models_db, api, bot):
+    api.fail("sendPhoto", 403)
+    notification_id = api._message_id + 1
+    await handle_message(message(bot, 5, photo_id="a"), None, ReviewerPool([REVIEWER, config.admin_id], "round_robin"))
+    assert api.calls["sendPhoto"] == 2
+    assert api.params["sendPhoto"]["chat_id"] == str(config.admin_id)
+    # Replies from the admin's copy reach the user.
+    assert await models_db.get_admin_route(config.admin_id, notification_id) == 5
+    assert await models_db.count_pending_payments() == 1
+
+
+async def test_reply_to_an_unknown_message_is_refused(models_db, api, bot):
+    notification = Message(message_id=999, date=0, chat=Chat(id=config.admin_id, type="private"))
+    reply = message(bot, config.admin_id, text="Привет", reply_to=notification)
+    await handle_admin_reply(reply, DeliveryEngine(rate=1000, per_chat_interval=0))
+    assert api.calls["sendMessage"] == 1
+    assert "ответьте на сообщение со скриншотом" in api.params["sendMessage"]["text"]
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from app.database.models import to_epoch
+from app.utils.stats import format_report
+
+DAY = 86400
+
+
+def midnight():
+    return to_epoch(datetime.combine(datetime.utcnow().date(), datetime.min.time()))
+
+
+async def add_users(repository, *user_ids):
+    await repository.insert_users([(user_id, f"User{user_id}", None, None, None) for user_id in user_ids])
+
+
+async def test_missed_days_are_rolled_up_once(models_db):
+    repository = models_db.get_repository()
+    today = midnight()
+    await add_users(repository, 1, 2)
+    await repository.update_subscription(1, True, today + 30 * DAY, 500, today - 3 * DAY + 3600)
+    await repository.update_subscription(2, True, today - DAY + 8 * 3600, 500, today - 2 * DAY + 3600)
+    await repository.update_subscription(1, True, today + 60 * DAY, 500, today - DAY + 3600)
+    await repository.update_subscription(2, False, None, 0, today - DAY + 9 * 3600)
+
+    rows = await models_db.rollup_subscriptions()
+    assert [(row["new"], row["renewed"], row["churned"], row["active"]) for row in rows] == [
+        (1, 0, 0, 1),
+        (1, 0, 0, 2),
+        (0, 1, 1, 1),
+    ]
+    assert rows[-1]["day"] == (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    assert [row["revenue"] for row in rows] == [500, 500, 500]
+    assert [row["mrr"] for row in rows] == [500, 1000, 500]
+    # Nothing is left to roll up until today is over.
+    await repository.update_subscription(2, True, today + 30 * DAY, 500, today + 60)
+    assert await models_db.rollup_subscriptions() == []
+
+    report = await models_db.get_subscription_report()
+    assert len(report["days"]) == 3
+    month = rows[-1]["day"][:7]
+    # Both were subscribed at some point of the month.
+    assert sum(row["users"] for row in report["cohorts"] if row["month"] == month) == 2
+    text = format_report(30, report)
+    assert "Новые: 2, продления: 1, отток: 1, отклонено: 0" in text
+    assert "Выручка: 1500₽" in text
+
+
+async def test_catch_up_is_capped(models_db):
+    repository = models_db.get_repository()
+    await add_users(repository, 1)
+    await repository.update_subscription(1, True, midnight() + 30 * DAY, 500, midnight() - 10 * DAY)
+    rows = await models_db.rollup_subscriptions(max_days=3)
+    assert len(rows) == 3
+    assert all(row["active"] == 1 and row["new"] == 0 for row in rows)
+
+
+async def test_empty_history_rolls_up_yesterday(models_db):
+    rows = await models_db.rollup_subscriptions()
+    assert [(row["day"], row["active"], row["revenue"]) for row in rows] == [
+        ((datetime.utcnow().date() - timedelta(days=1)).isoformat(), 0, 0)
+    ]
+    assert await models_db.rollup_subscriptions() == []
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramServerError
+from aiohttp.test_utils import unused_port
+
+from app.utils.session import CLOSED, HALF_OPEN, OPEN, TelegramSession
+
+
+@pytest.fixture
+def sessions(event_loop):
+    created = []
+
+    def make(url, **kwargs):
+        kwargs = {"retries": 2, "backoff": 0.01, **kwargs}
+        session = TelegramSession(api=TelegramAPIServer.from_base(url), **kwargs)
+        created.append(session)
+        return Bot("123456:TEST-TOKEN", session=session)
+
+    yield make
+    for session in created:
+        event_loop.run_until_complete(session.close())
+
+
+async def test_idempotent_call_is_retried_on_server_error(api, sessions):
+    bot = sessions(api.url)
+    api.fail("banChatMember", 500, 502)
+    assert await bot.ban_chat_member(-100, 5) is True
+    assert api.calls["banChatMember"] == 3
+    assert bot.session.stats()["state"] == CLOSED
+
+
+async def test_retries_are_bounded(api, sessions):
+    bot = sessions(api.url, retries=1)
+    api.fail("banChatMember", 500, 500, 500)
+    with pytest.raises(TelegramServerError):
+        await bot.ban_chat_member(-100, 5)
+    assert api.calls["banChatMember"] == 2
+
+
+async def test_send_is_not_retried_on_server_error(api, sessions):
+    bot = sessions(api.url)
+    api.fail("sendMessage", 500)
+    with pytest.raises(TelegramServerError):
+        await bot.send_message(1, "hello")
+    assert api.calls["sendMessage"] == 1
+
+
+async def test_send_is_retried_when_the_connection_fails(sessions):
+    # Nothing listens on the port, so the request never reached Telegram.
+    bot = sessions(f"http://127.0.0.1:{unused_port()}")
+    with pytest.raises(TelegramNetworkError):
+        await bot.send_message(1, "hello")
+    assert bot.session.breaker.failures == 3
+
+
+async def test_per_method_timeout(api, sessions):
+    bot = sessions(api.url, timeout=5, timeouts={"banChatMember": 0.1}, retries=0)
+    api.delays["banChatMember"] = 0.5
+    with pytest.raises(TelegramNetworkError):
+        await asyncio.wait_for(bot.ban_chat_member(-100, 5), 0.4)
+    # Other methods keep the session-wide timeout.
+    api.delays["sendMessage"] = 0.2
+    assert (await bot.send_message(1, "hello")).message_id
+
+
+async def test_client_error_is_not_retried_and_keeps_the_breaker_closed(api, sessions):
+    bot = sessions(api.url, breaker_threshold=1)
+    api.fail("banChatMember", 400)
+    with pytest.raises(TelegramBadRequest):
+        await bot.ban_chat_member(-100, 5)
+    assert api.calls["banChatMember"] == 1
+    assert bot.session.stats() == {"state": CLOSED, "failures": 0, "rejected": 0}
+
+
+async def test_breaker_opens_and_recovers_through_a_single_probe(api, sessions):
+    bot = sessions(api.url, retries=0, breaker_threshold=3, breaker_cooldown=0.2)
+    api.fail("banChatMember", *[500] * 3)
+    for _ in range(3):
+        with pytest.raises(TelegramServerError):
+            await bot.ban_chat_member(-100, 5)
+    assert bot.session.breaker.state == OPEN
+
+    # While open, calls fail fast without reaching the API.
+    with pytest.raises(TelegramNetworkError, match="Circuit breaker is open"):
+        await bot.ban_chat_member(-100, 5)
+    assert api.calls["banChatMember"] == 3
+    assert bot.session.stats()["rejected"] == 1
+
+    # After the cooldown one probe goes through; concurrent calls are still rejected.
+    await asyncio.sleep(0.25)
+    api.delays["banChatMember"] = 0.1
+    probe = asyncio.create_task(bot.ban_chat_member(-100, 5))
+    await asyncio.sleep(0.02)
+    assert bot.session.breaker.state == HALF_OPEN
+    with pytest.raises(TelegramNetworkError, match="Circuit breaker is open"):
+        await bot.ban_chat_member(-100, 5)
+    assert await probe is True
+    assert bot.session.stats() == {"state": CLOSED, "failures": 0, "rejected": 2}
+
+
+async def test_failed_probe_reopens_the_breaker(api, sessions):
+    bot = sessions(api.url, retries=0, breaker_threshold=1, breaker_cooldown=0.1)
+    api.fail("banChatMember", 500, 500)
+    with pytest.raises(TelegramServerError):
+        await bot.ban_chat_member(-100, 5)
+    await asyncio.sleep(0.15)
+    with pytest.raises(TelegramServerError):
+        await bot.ban_chat_member(-100, 5)
+    assert bot.session.breaker.state == OPEN
+    with pytest.raises(TelegramNetworkError, match="Circuit breaker is open"):
+        await bot.ban_chat_member(-100, 5)
+
+
+async def test_get_updates_bypasses_the_breaker(api, sessions):
+    bot = sessions(api.url, retries=0, breaker_threshold=1, breaker_cooldown=60)
+    api.fail("banChatMember", 500)
+    with pytest.raises(TelegramServerError):
+        await bot.ban_chat_member(-100, 5)
+    assert bot.session.breaker.state == OPEN
+    api.fail("getUpdates", 500)
+    with pytest.raises(TelegramServerError):
+        await bot.get_updates()
+    # Neither retried nor counted.
+    assert api.calls["getUpdates"] == 1
+    assert bot.session.breaker.failures == 1
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from app.utils.stats import format_stats
+
+
+async def test_counters_follow_every_write_path(models_db):
+    later = datetime.utcnow() + timedelta(days=30)
+    for user_id in (1, 2, 3, 4):
+        await models_db.add_user(user_id, f"User{user_id}", None, None, None)
+    await models_db.add_user(1, "Again", None, None, None)
+    await models_db.update_subscription(1, True, later, 500)
+    await models_db.upsert_users(
+        [
+            {"user_id": 2, "is_subscribed": True, "subscription_expires_at": later},
+            {"user_id": 5, "first_name": "Imported"},
+        ]
+    )
+    await models_db.add_payment_request(3, "file", "unique", None)
+    await models_db.resolve_payments([3], True, later, 500)
+    await models_db.update_subscription(2, False, None)
+
+    stats = await models_db.get_stats()
+    assert (stats["total_users"], stats["active_subscribers"], stats["non_subscribers"]) == (5, 2, 3)
+    assert stats["revenue"] == 1000
+    assert stats["estimated_income"] == 2 * 500
+    # A full recount agrees with the incremental counters.
+    assert not any((await models_db.reconcile_stats()).values())
+
+
+async def test_expired_subscriptions_are_not_active_before_the_sweep(models_db):
+    for user_id, expires_at in ((1, timedelta(days=-1)), (2, timedelta(days=1))):
+        await models_db.add_user(user_id, f"User{user_id}", None, None, None)
+        await models_db.update_subscription(user_id, True, datetime.utcnow() + expires_at, 500)
+    stats = await models_db.get_stats()
+    assert (stats["active_subscribers"], stats["non_subscribers"]) == (1, 1)
+    await models_db.take_stats_snapshot()
+    today = datetime.utcnow().date().isoformat()
+    assert (await models_db.get_repository().get_snapshots([today]))[today]["active_subscribers"] == 1
+
+
+def test_format_stats_shows_daily_and_weekly_change():
+    stats = {
+        "total_users": 120,
+        "active_subscribers": 30,
+        "non_subscribers": 90,
+        "estimated_income": 15000,
+        "revenue": 50000,
+        "day_ago": {"total_users": 100, "active_subscribers": 31, "revenue": 49500},
+        "week_ago": {"total_users": 80, "active_subscribers": 20, "revenue": 40000},
+        "rollup": None,
+    }
+    text = format_stats("📊 Статистика", stats)
+    assert "Всего пользователей: 120 (+20)" in text
+    assert "Активные подписчики: 30 (-1)" in text
+    assert "За неделю: пользователи +40, подписчики +10, выручка +10000₽" in text
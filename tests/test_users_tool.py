@@ -0,0 +1,94 @@
+import csv
+import json
+
+import pytest
+
+from app.tools.users import FIELDS, _export, _import
+from config.config import config
+
+
+@pytest.fixture
+def files(backend, monkeypatch, tmp_path):
+    # The tool opens the database from config, as it does from the command line.
+    monkeypatch.setattr(config, "db", backend)
+    return tmp_path
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+async def export_jsonl(path):
+    await _export(str(path), "jsonl", 2)
+    with open(path, encoding="utf-8") as f:
+        return {user["user_id"]: user for user in map(json.loads, f)}
+
+
+async def test_import_skips_bad_rows_and_keeps_unlisted_subscriptions(files, repo):
+    source = files / "users.csv"
+    write_csv(
+        source,
+        [
+            # Offsets are converted to UTC.
+            {
+                "user_id": 1,
+                "first_name": "Anna",
+                "is_subscribed": "yes",
+                "subscription_expires_at": "2030-01-01T03:00:00+03:00",
+            },
+            {"user_id": 2, "first_name": "Boris", "is_subscribed": "0"},
+            # Epoch seconds are accepted as well.
+            {"user_id": 3, "first_name": "Vera", "is_subscribed": "1", "subscription_expires_at": "1893456000"},
+            {"user_id": "x", "first_name": "Bad id"},
+            {"user_id": 4, "is_subscribed": "maybe"},
+            {"user_id": 5, "is_subscribed": "1"},
+            {"user_id": 6, "subscription_expires_at": "2030-01-01"},
+        ],
+    )
+    result = await _import(str(source), "csv", 2)
+    assert (result["inserted"], result["updated"], result["skipped"]) == (3, 0, 4)
+
+    # A file of names only updates the names and leaves subscriptions alone.
+    update = files / "names.jsonl"
+    update.write_text('{"user_id": 1, "username": "anna"}\n{"user_id": 7, "first_name": "Gleb"}\n', encoding="utf-8")
+    result = await _import(str(update), "jsonl", 2)
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 1, 0)
+
+    users = await export_jsonl(files / "export.jsonl")
+    assert sorted(users) == [1, 2, 3, 7]
+    assert users[1] == {
+        "user_id": 1,
+        "first_name": "Anna",
+        "last_name": None,
+        "phone_number": None,
+        "username": "anna",
+        "is_subscribed": True,
+        "subscription_expires_at": "2030-01-01T00:00:00+00:00",
+    }
+    assert users[3]["subscription_expires_at"] == "2030-01-01T00:00:00+00:00"
+    assert not users[2]["is_subscribed"] and not users[7]["is_subscribed"]
+    counters = await repo.get_counters()
+    assert (counters["total_users"], counters["active_subscribers"]) == (4, 2)
+
+
+async def test_export_and_import_round_trip(files, repo):
+    rows = [
+        {"user_id": user_id, "is_subscribed": user_id % 2, "subscription_expires_at": 1893456000 if user_id % 2 else ""}
+        for user_id in range(1, 8)
+    ]
+    write_csv(files / "users.csv", rows)
+    await _import(str(files / "users.csv"), "csv", 3)
+    await _export(str(files / "export.csv"), "csv", 3)
+    with open(files / "export.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row["user_id"]) for row in rows] == list(range(1, 8))
+
+    # Importing the export again changes nothing.
+    before = await export_jsonl(files / "before.jsonl")
+    result = await _import(str(files / "export.csv"), "csv", 3)
+    assert (result["inserted"], result["updated"], result["skipped"]) == (0, 7, 0)
+    assert await export_jsonl(files / "after.jsonl") == before
+    assert (await repo.get_counters())["active_subscribers"] == 4
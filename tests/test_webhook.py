@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "s3cret"
+
+
+def message_update(update_id, user_id=111, text="hello"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+@pytest.fixture
+def received():
+    return []
+
+
+@pytest.fixture
+def dispatcher(received):
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def record(message):
+        received.append((message.from_user.id, message.text))
+
+    dp.include_router(router)
+    return dp
+
+
+def webhook(dispatcher, **kwargs):
+    # Port 0: start() binds its own listener, the tests go through TestServer.
+    return WebhookServer(Bot("123456:TEST-TOKEN"), dispatcher, secret=SECRET, host="127.0.0.1", port=0, **kwargs)
+
+
+async def post(client, update, secret=SECRET):
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return await client.post("/webhook", json=update, headers=headers)
+
+
+async def test_updates_reach_the_dispatcher(dispatcher, received):
+    server = webhook(dispatcher, workers=2)
+    await server.start()
+    async with TestClient(TestServer(server.build_app())) as client:
+        for update_id in range(1, 4):
+            response = await post(client, message_update(update_id, text=f"m{update_id}"))
+            assert response.status == 200
+        await server.stop()
+        assert sorted(received) == [(111, "m1"), (111, "m2"), (111, "m3")]
+        health = await (await client.get("/health")).json()
+    assert health == {"status": "ok", "queue": 0, "processed": 3, "rejected": 0}
+
+
+@pytest.mark.parametrize("secret", [None, "wrong"])
+async def test_bad_secret_is_rejected(dispatcher, received, secret):
+    server = webhook(dispatcher)
+    async with TestClient(TestServer(server.build_app())) as client:
+        response = await post(client, message_update(1), secret=secret)
+        assert response.status == 401
+    assert server._queue.empty()
+    assert received == []
+
+
+async def test_malformed_body_is_rejected(dispatcher):
+    server = webhook(dispatcher)
+    async with TestClient(TestServer(server.build_app())) as client:
+        response = await client.post("/webhook", data="not json", headers={SECRET_HEADER: SECRET})
+        assert response.status == 400
+
+
+async def test_full_queue_asks_telegram_to_retry(dispatcher, received):
+    # No workers are running, so the queue fills up.
+    server = webhook(dispatcher, queue_size=2)
+    async with TestClient(TestServer(server.build_app())) as client:
+        statuses = [(await post(client, message_update(update_id))).status for update_id in range(1, 5)]
+        assert statuses == [200, 200, 503, 503]
+        health = await (await client.get("/health")).json()
+    assert health["queue"] == 2
+    assert health["rejected"] == 2
+    # The queued updates are still processed once workers run.
+    await server.start()
+    await server.stop()
+    assert len(received) == 2
+
+
+async def test_handler_errors_do_not_stop_the_workers(received):
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def flaky(message):
+        if message.text == "boom":
+            raise RuntimeError("boom")
+        received.append(message.text)
+
+    dp.include_router(router)
+    server = webhook(dp, workers=1)
+    await server.start()
+    async with TestClient(TestServer(server.build_app())) as client:
+        await post(client, message_update(1, text="boom"))
+        await post(client, message_update(2, text="ok"))
+        await asyncio.wait_for(server._queue.join(), 5)
+    await server.stop()
+    assert received == ["ok"]
+    assert server.processed == 2
+
+
+@pytest.mark.parametrize("secret", ["", "has spaces", "x" * 257])
+def test_webhook_mode_requires_a_valid_secret(dispatcher, secret):
+    with pytest.raises(ValueError):
+        WebhookServer(Bot("123456:TEST-TOKEN"), dispatcher, secret=secret)
+
+
+async def test_webhook_is_registered_with_the_secret(dispatcher, api, bot):
+    server = WebhookServer(bot, dispatcher, url="https://bot.example.com/webhook", secret=SECRET, port=0)
+    await server.start()
+    await server.stop()
+    assert api.calls["setWebhook"] == 1
+    assert api.params["setWebhook"]["secret_token"] == SECRET